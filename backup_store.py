@@ -0,0 +1,296 @@
+# MushiMix - Backup Store
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Content-addressed backups, kept in "<game>/mushimix-bk/":
+#
+#   objects/<2 hex>/<sha256>        One copy of each distinct file ever backed up, named by its hash.
+#                                   Identical BINs (e.g. the same file in res/ and res_BL/) are only stored once.
+#   snapshots/<timestamp>.json      One manifest per Remix, listing the path -> hash of every file
+#                                   as it was right before that Remix overwrote it.
+#   store-index.json                Cache of (size, mtime) -> hash for files in the install,
+#                                   so files that haven't changed since they were last backed up aren't hashed again.
+#
+# Objects are made with a reflink (FICLONE) where the filesystem supports it, so a backup costs next to no space or time.
+# Backups from before the store existed (plain copies under mushimix-bk/res*/) are imported as a "legacy" snapshot.
+#
+# restore() rolls the install back to how it was right before any snapshot (or to vanilla),
+# copying only files whose contents differ, in parallel, and verifying each one by hash afterwards.
+# -----
+
+# Standard Modules
+import os
+import json
+import datetime
+import threading
+
+# MushiMix Modules
+import cave_io
+
+MANIFEST_VERSION = 1
+INDEX_FILE = "store-index.json"
+
+
+class BackupStoreError(Exception):
+    pass
+
+
+# Snapshot - Manifest of one backup run. Use BackupStore.beginSnapshot() and BackupStore.commit().
+class Snapshot:
+    def __init__(self, name, created, game=""):
+        self.name = name
+        self.created = created
+        self.game = game
+        self.files = {} # relative path ("/res/DISKDATA/B/m05.bin") -> {"sha256", "size"}
+        self._lock = threading.Lock()
+
+    def toJson(self):
+        return {"version": MANIFEST_VERSION, "created": self.created, "game": self.game, "files": self.files}
+
+    @classmethod
+    def fromJson(cls, name, data):
+        snapshot = cls(name, data.get("created", ""), data.get("game", ""))
+        snapshot.files = data.get("files", {})
+        return snapshot
+
+
+# BackupStore - The backup folder of one game install
+class BackupStore:
+    def __init__(self, backup_dir, game_dir):
+        self.backup_dir = backup_dir
+        self.game_dir = game_dir.rstrip("/\\")
+        self.objects_dir = backup_dir + "/objects"
+        self.snapshots_dir = backup_dir + "/snapshots"
+
+        self._lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+        self._index = {}
+        self._index_dirty = False
+        self._loadIndex()
+
+        # Directory fsyncs for restored files are done together at the end of restore()
+        self.dir_batch = cave_io.DirSyncBatch()
+
+    # --- Objects ---
+
+    def objectPath(self, digest):
+        return self.objects_dir + "/" + digest[:2] + "/" + digest
+
+    def hasObject(self, digest):
+        return os.path.isfile(self.objectPath(digest))
+
+    # Hash of a file in the install, from the index if it hasn't changed since it was last hashed
+    def hashOf(self, path):
+        stat = cave_io.statKey(path)
+        key = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            cached = self._index.get(key)
+        if cached and stat and cached[:2] == stat:
+            return cached[2]
+        digest = cave_io.hashFile(path)
+        with self._lock:
+            self._index[key] = stat + [digest]
+            self._index_dirty = True
+        return digest
+
+    # Stores a file's current contents, if an identical object isn't stored already. Returns its hash.
+    def store(self, path):
+        digest = self.hashOf(path)
+        if self.hasObject(digest):
+            return digest
+
+        # Not batched: the object has to be on disk before the file it backs up gets overwritten
+        object_path = self.objectPath(digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        cave_io.cloneFile(path, object_path)
+        return digest
+
+    # --- Snapshots ---
+
+    def beginSnapshot(self, game="", created=None):
+        if created == None:
+            created = datetime.datetime.now()
+        name = created.strftime("%Y%m%d-%H%M%S-%f")
+        return Snapshot(name, str(created).split(".")[0], game)
+
+    # Backs up the install file at relpath (e.g. "/res/DISKDATA/B/m05.bin") into a snapshot. Safe to call from several threads.
+    def add(self, snapshot, relpath):
+        path = self.game_dir + relpath
+        digest = self.store(path)
+        with snapshot._lock:
+            snapshot.files[relpath] = {"sha256": digest, "size": os.path.getsize(path)}
+        return digest
+
+    # Writes the snapshot's manifest (if it has anything in it) and the hash index.
+    # Everything the manifest points to is made durable first.
+    def commit(self, snapshot):
+        self.dir_batch.sync()
+        self.writeManifest(snapshot)
+        self._saveIndex()
+
+    # For runs without a snapshot: makes the files written with dir_batch durable, and saves the hash index
+    def flush(self):
+        self.dir_batch.sync()
+        self._saveIndex()
+
+    # Can also be called part way through a run, so the manifest is on disk before the files it lists are overwritten
+    def writeManifest(self, snapshot):
+        with self._manifest_lock:
+            with snapshot._lock:
+                data = snapshot.toJson()
+                data["files"] = dict(snapshot.files)
+            if data["files"]:
+                os.makedirs(self.snapshots_dir, exist_ok=True)
+                _writeJson(self.snapshots_dir + "/" + snapshot.name + ".json", data)
+
+    # All snapshots, oldest first
+    def snapshots(self):
+        self.importLegacy()
+        result = []
+        if os.path.isdir(self.snapshots_dir):
+            for file_name in sorted(os.listdir(self.snapshots_dir)):
+                if file_name.endswith(".json"):
+                    try:
+                        with open(self.snapshots_dir + "/" + file_name, 'r', encoding="utf-8") as f:
+                            result.append(Snapshot.fromJson(file_name[:-5], json.load(f)))
+                    except (OSError, ValueError) as e:
+                        print("[WARNING]", "Skipping unreadable snapshot", file_name, ":", e)
+        return result
+
+    def snapshot(self, name):
+        for snapshot in self.snapshots():
+            if snapshot.name == name:
+                return snapshot
+        raise BackupStoreError("No backup snapshot named " + repr(name))
+
+    # The oldest backed up version of every file, which is the vanilla file unless it was modded before mushimix saw it
+    def vanilla(self):
+        snapshots = self.snapshots()
+        if not snapshots:
+            return Snapshot("vanilla", "", "")
+        return self.stateAt(snapshots[0].name, "vanilla")
+
+    # What every backed up file looked like right before the snapshot `name` was taken.
+    # A snapshot only lists the files that Remix changed, so for the rest, the next snapshot that has them
+    # holds their contents from that time. Files no later snapshot has haven't been touched since, and aren't listed.
+    def stateAt(self, name, label=None):
+        snapshots = self.snapshots()
+        names = [snapshot.name for snapshot in snapshots]
+        if name not in names:
+            raise BackupStoreError("No backup snapshot named " + repr(name))
+
+        merged = Snapshot(label or name, snapshots[names.index(name)].created, snapshots[names.index(name)].game)
+        for snapshot in snapshots[names.index(name):]:
+            for relpath, info in snapshot.files.items():
+                merged.files.setdefault(relpath, info)
+        return merged
+
+    # --- Restore ---
+
+    # Puts every file in `target` (from stateAt() or vanilla()) back into the install.
+    # Files that already match are skipped. If undo is a Snapshot, the current contents of the files
+    # being replaced are backed up into it first, so the restore itself can be rolled back.
+    # callback(relpath, restored) is called (from worker threads) as each file is done.
+    # Returns (restored, unchanged, errors), errors being a list of (relpath, exception).
+    def restore(self, target, threads=4, undo=None, callback=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        restored = []
+        unchanged = []
+        errors = []
+
+        def restoreOne(relpath, info):
+            path = self.game_dir + relpath
+            digest = info["sha256"]
+            if os.path.isfile(path) and self.hashOf(path) == digest:
+                return False
+            if not self.hasObject(digest):
+                raise BackupStoreError("Backup object " + digest + " is missing from the store")
+
+            if undo != None and os.path.isfile(path):
+                self.add(undo, relpath)
+                self.writeManifest(undo)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            cave_io.cloneFile(self.objectPath(digest), path, self.dir_batch)
+
+            # Verify, reading the restored file back rather than trusting the index
+            with self._lock:
+                self._index.pop(os.path.normcase(os.path.abspath(path)), None)
+            if self.hashOf(path) != digest:
+                raise BackupStoreError("Restored file does not match its backup")
+            return True
+
+        def run(relpath, info):
+            try:
+                result = restoreOne(relpath, info)
+                error = None
+            except Exception as e:
+                result = False
+                error = e
+            with self._lock:
+                if error != None:
+                    errors.append((relpath, error))
+                elif result:
+                    restored.append(relpath)
+                else:
+                    unchanged.append(relpath)
+            if callback:
+                callback(relpath, result)
+
+        with ThreadPoolExecutor(max_workers=max(1, int(threads)), thread_name_prefix="mushimix-restore") as pool:
+            for relpath, info in sorted(target.files.items()):
+                pool.submit(run, relpath, info)
+
+        if undo != None:
+            self.commit(undo)
+        else:
+            self.flush()
+        return sorted(restored), sorted(unchanged), errors
+
+    # Old style backups were plain copies under mushimix-bk/res*/DISKDATA/..., which were always vanilla files.
+    # Store them as the first snapshot, once. The original copies are left where they are.
+    def importLegacy(self):
+        legacy = self.snapshots_dir + "/00000000-legacy.json"
+        if os.path.exists(legacy) or not os.path.isdir(self.backup_dir):
+            return
+        snapshot = Snapshot("00000000-legacy", "legacy", "")
+        for res in sorted(os.listdir(self.backup_dir)):
+            if res[:3] != "res" or not os.path.isdir(self.backup_dir + "/" + res):
+                continue
+            for root, dirs, files in os.walk(self.backup_dir + "/" + res):
+                dirs.sort()
+                for file_name in sorted(files):
+                    path = os.path.join(root, file_name)
+                    relpath = "/" + os.path.relpath(path, self.backup_dir).replace("\\", "/")
+                    snapshot.files[relpath] = {"sha256": self.store(path), "size": os.path.getsize(path)}
+        if snapshot.files:
+            os.makedirs(self.snapshots_dir, exist_ok=True)
+            _writeJson(legacy, snapshot.toJson())
+            print("[INFO]", ": Imported", len(snapshot.files), "legacy backup file(s)")
+            self._saveIndex()
+
+    # --- Index ---
+
+    def _loadIndex(self):
+        try:
+            with open(self.backup_dir + "/" + INDEX_FILE, 'r', encoding="utf-8") as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+
+    def _saveIndex(self):
+        with self._lock:
+            if not self._index_dirty:
+                return
+            data = dict(self._index)
+            self._index_dirty = False
+        os.makedirs(self.backup_dir, exist_ok=True)
+        _writeJson(self.backup_dir + "/" + INDEX_FILE, data)
+
+
+def _writeJson(path, data):
+    with cave_io.atomicWrite(path, 'w', encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
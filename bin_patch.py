@@ -0,0 +1,374 @@
+# MushiMix - Delta Patches
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Compact patches that turn vanilla BINs into modded ones, to share a remix without shipping whole BINs or WAVs.
+#
+# A remixed BIN is mostly the vanilla BIN: only the header, the ifd table and the replaced tracks change, and every other
+# internal file (like the menu Sound Effects) is copied across byte for byte, just at a different offset.
+# So each modded BIN is stored as a list of ops, in output order:
+#   ["base", offset, length]    copy this range of the vanilla BIN
+#   ["delta", offset, length]   copy this range of the delta data stored in the patch (new header, new tracks)
+#
+# A patch is a plain zip file (".mmpatch") with every member stored uncompressed, like mod packs (see mod_pack.py):
+#   mushimix-patch.json    the manifest
+#   deltas/NN-mXX.delta    the delta data of each BIN
+#
+# Manifest:
+#   {
+#     "version": 1, "name": "...", "author": "...", "description": "...", "created": "...", "game": "mushi" or "dfk",
+#     "files": {"/res/DISKDATA/B/m05.bin": {"base_sha256": ..., "base_size": ..., "sha256": ..., "size": ...,
+#                                           "member": "deltas/00-m05.delta", "delta_sha256": ..., "ops": [[...], ...]}}
+#   }
+# Each file is keyed to the sha256 of the vanilla BIN it applies to, which is looked for in the install first
+# and then in the backups, so a patch can also be (re)applied over an install that's already modded.
+# Applying streams the vanilla BIN and the delta straight into the output, hashing it on the way, and the output only
+# replaces the BIN if it matches the manifest's sha256. Use MushiMixCore.restore() to revert.
+# -----
+
+# Standard Modules
+import os
+import json
+import hashlib
+import zipfile
+import datetime
+import threading
+
+# MushiMix Modules
+import cave_io
+import cave_bin
+import mod_pack
+
+PATCH_EXTENSION = ".mmpatch"
+MANIFEST_NAME = "mushimix-patch.json"
+PATCH_VERSION = 1
+
+
+class PatchError(mod_pack.PackError):
+    pass
+
+
+# PatchFile - How to make one modded BIN. offset and length are where its delta data is in the patch file.
+class PatchFile:
+    __slots__ = ("relpath", "base_sha256", "base_size", "sha256", "size", "name", "offset", "length", "delta_sha256", "ops")
+
+    def __init__(self, relpath, base_sha256, base_size, sha256, size, name, offset, length, delta_sha256, ops):
+        self.relpath = relpath
+        self.base_sha256 = base_sha256
+        self.base_size = base_size
+        self.sha256 = sha256
+        self.size = size
+        self.name = name
+        self.offset = offset
+        self.length = length
+        self.delta_sha256 = delta_sha256
+        self.ops = ops
+
+    # Streams base_path (the vanilla BIN) and the delta data from patch_path into dst
+    # Writes the patched BIN to dst. If digest (a hashlib object) is given, everything written is hashed into it,
+    # which needs the data in user space, so the ranges are copied in chunks instead of with cave_io.copyRange().
+    def writeTo(self, base_path, patch_path, dst, callback=None, digest=None):
+        with open(base_path, 'rb') as base, open(patch_path, 'rb') as patch:
+            for kind, offset, length in self.ops:
+                src, start = (base, offset) if kind == "base" else (patch, self.offset + offset)
+                if digest == None:
+                    cave_io.copyRange(src, dst, start, length, callback)
+                else:
+                    _copyHashed(src, dst, start, length, digest, callback)
+
+    def __repr__(self):
+        return "PatchFile(" + self.relpath + ", " + str(len(self.ops)) + " ops)"
+
+
+# BinPatch - An opened patch. Reads the manifest and where the delta data is, not the data itself.
+class BinPatch:
+    def __init__(self, path):
+        self.path = path
+        try:
+            with zipfile.ZipFile(path, 'r') as zf:
+                try:
+                    manifest = json.loads(zf.read(MANIFEST_NAME).decode("utf-8"))
+                except KeyError:
+                    raise PatchError(os.path.basename(path) + ": no " + MANIFEST_NAME + ", not a MushiMix patch")
+                infos = {info.filename: info for info in zf.infolist()}
+        except (OSError, zipfile.BadZipFile, ValueError) as e:
+            raise PatchError(os.path.basename(path) + ": can't read patch: " + str(e))
+
+        if not isinstance(manifest, dict) or manifest.get("version") != PATCH_VERSION:
+            raise PatchError(os.path.basename(path) + ": unsupported patch version " + repr(manifest.get("version") if isinstance(manifest, dict) else None))
+        self.manifest = manifest
+        self.name = manifest.get("name", "")
+        self.author = manifest.get("author", "")
+        self.description = manifest.get("description", "")
+        self.created = manifest.get("created", "")
+        self.game = manifest.get("game", "")
+
+        self.files = {}
+        with open(path, 'rb') as f:
+            for relpath, data in manifest.get("files", {}).items():
+                _checkRelpath(path, relpath)
+                try:
+                    info = infos[data["member"]]
+                    ops = [(kind, int(offset), int(length)) for kind, offset, length in data["ops"]]
+                    self.files[relpath] = PatchFile(relpath, data["base_sha256"], data["base_size"], data["sha256"], data["size"],
+                                                    info.filename, mod_pack.memberOffset(f, info), info.file_size, data["delta_sha256"], ops)
+                except (KeyError, TypeError, ValueError) as e:
+                    raise PatchError(os.path.basename(path) + ": bad entry for " + relpath + ": " + str(e))
+                _checkOps(self.files[relpath])
+
+    # Hashes every file's delta data, in one front to back read of the patch. Raises PatchError on the first bad one.
+    def verify(self, callback=None):
+        with open(self.path, 'rb') as f:
+            for patch_file in sorted(self.files.values(), key=lambda patch_file: patch_file.offset):
+                f.seek(patch_file.offset)
+                digest = hashlib.sha256()
+                remaining = patch_file.length
+                while remaining > 0:
+                    chunk = f.read(min(cave_io.COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise PatchError(os.path.basename(self.path) + ": " + patch_file.name + " is truncated")
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                    if callback:
+                        callback(len(chunk))
+                if digest.hexdigest() != patch_file.delta_sha256:
+                    raise PatchError(os.path.basename(self.path) + ": " + patch_file.name + " doesn't match its hash, the patch is damaged")
+
+    def __repr__(self):
+        return "BinPatch(" + repr(self.name) + ", " + self.game + ", " + str(len(self.files)) + " files)"
+
+
+# Patches come from other people, so a relpath has to be a plain "/res*/DISKDATA/<folder>/<file>.bin",
+# with nothing that could lead outside the install ("..", backslashes, drive letters, empty parts)
+def _checkRelpath(path, relpath):
+    parts = relpath.split("/") if isinstance(relpath, str) else []
+    if (len(parts) != 5 or parts[0] != "" or parts[1][:3] != "res" or parts[2] != "DISKDATA" or not parts[4].lower().endswith(".bin")
+            or any(part in ("", ".", "..") or "\\" in part or ":" in part for part in parts[1:])):
+        raise PatchError(os.path.basename(path) + ": bad file path " + repr(relpath) + ", only BINs in the install's DISKDATA folders can be patched")
+
+
+# Ops have to stay inside their base and delta data, and add up to the output size
+def _checkOps(patch_file):
+    total = 0
+    for kind, offset, length in patch_file.ops:
+        limit = patch_file.base_size if kind == "base" else patch_file.length
+        if kind not in ("base", "delta") or offset < 0 or length < 0 or offset + length > limit:
+            raise PatchError(patch_file.relpath + ": bad op " + repr([kind, offset, length]))
+        total += length
+    if total != patch_file.size:
+        raise PatchError(patch_file.relpath + ": ops add up to " + str(total) + " bytes, expected " + str(patch_file.size))
+
+
+# Ops that make out_path out of base_path, as [kind, offset, length] with "delta" offsets into out_path.
+# Internal files of out_path that are byte for byte the same as an internal file of base_path with the same name
+# are copied from base_path, everything else (headers, replaced tracks, padding) is delta data.
+# If either file isn't a CAVE BIN, the whole of out_path is delta data.
+def diffBin(base_path, out_path):
+    size = os.path.getsize(out_path)
+    try:
+        base = cave_bin.CaveBin(base_path)
+    except cave_bin.CaveBinError:
+        return [["delta", 0, size]] if size else []
+    try:
+        with cave_bin.CaveBin(out_path) as out:
+            candidates = {}
+            for entry in base:
+                candidates.setdefault(entry.file_name, []).append(entry)
+
+            # (offset in out_path, length, offset in base_path) of every internal file that's unchanged
+            spans = []
+            for entry in sorted(out.entries, key=lambda entry: entry.data_offset):
+                data = out.data(entry)
+                try:
+                    for original in candidates.get(entry.file_name, []):
+                        original_data = base.data(original)
+                        try:
+                            if len(data) and len(original_data) == len(data) and original_data == data:
+                                spans.append((entry.data_offset, len(data), original.data_offset))
+                                break
+                        finally:
+                            original_data.release()
+                finally:
+                    data.release()
+    except cave_bin.CaveBinError:
+        return [["delta", 0, size]] if size else []
+    finally:
+        base.close()
+
+    ops = []
+    position = 0
+    for offset, length, base_offset in spans:
+        if offset < position: # Overlapping entries, keep it simple
+            continue
+        if offset > position:
+            ops.append(["delta", position, offset - position])
+        if ops and ops[-1][0] == "base" and ops[-1][1] + ops[-1][2] == base_offset:
+            ops[-1][2] += length
+        else:
+            ops.append(["base", base_offset, length])
+        position = offset + length
+    if position < size:
+        ops.append(["delta", position, size - position])
+    return ops
+
+
+# Builds a patch at patch_path from every BIN of core's game that differs from its vanilla copy
+# (from the backups if there are any, see MushiMixCore.vanillaPath()).
+# The modded BINs are read from the install, or from modded_dir if given (a Manual Mode output folder).
+# Returns the BinPatch. Raises PatchError if nothing differs.
+def buildPatch(core, patch_path, modded_dir=None, name="", author="", description="", callback=None):
+    if not core.game:
+        raise PatchError("No supported game found in " + repr(core.game_dir))
+    vanilla = core.store.vanilla() if os.path.isdir(core.backup_dir) else None
+
+    # Every BIN once, even if more than one entry shares it
+    bins = {}
+    for entry, bin_name in core.game_files.items():
+        relpath = core.relPath(entry)
+        if relpath not in bins:
+            bins[relpath] = (core.vanillaPath(entry, vanilla), modded_dir + "/" + bin_name if modded_dir else core.binPath(entry))
+
+    files = {}
+    with cave_io.atomicWrite(patch_path) as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+        now = datetime.datetime.now()
+        for relpath, (base_path, out_path) in sorted(bins.items()):
+            if not os.path.isfile(out_path) or not os.path.isfile(base_path):
+                continue
+            base_sha256 = _hashOf(core.store, base_path)
+            sha256 = core.store.hashOf(out_path)
+            if sha256 == base_sha256:
+                continue
+
+            ops = diffBin(base_path, out_path)
+            member = zipfile.ZipInfo("deltas/%02d-%s.delta" % (len(files), os.path.splitext(os.path.basename(relpath))[0]), now.timetuple()[:6])
+            member.compress_type = zipfile.ZIP_STORED
+            member.file_size = sum(op[2] for op in ops if op[0] == "delta")
+            digest = hashlib.sha256()
+            position = 0
+            with open(out_path, 'rb') as src, zf.open(member, 'w', force_zip64=member.file_size > 0x7FFFFFFF) as dst:
+                for op in ops:
+                    if op[0] != "delta":
+                        continue
+                    src.seek(op[1])
+                    remaining = op[2]
+                    op[1] = position
+                    while remaining > 0:
+                        chunk = src.read(min(cave_io.COPY_CHUNK_SIZE, remaining))
+                        if not chunk:
+                            raise PatchError(out_path + " changed while building the patch")
+                        digest.update(chunk)
+                        dst.write(chunk)
+                        remaining -= len(chunk)
+                        if callback:
+                            callback(len(chunk))
+                    position += op[2]
+
+            files[relpath] = {"base_sha256": base_sha256, "base_size": os.path.getsize(base_path), "sha256": sha256, "size": os.path.getsize(out_path),
+                              "member": member.filename, "delta_sha256": digest.hexdigest(), "ops": ops}
+            print("[INFO]", ": Patched", relpath, ":", position, "of", files[relpath]["size"], "bytes stored")
+
+        if not files:
+            raise PatchError("Nothing to patch, every BIN matches vanilla")
+        manifest = {"version": PATCH_VERSION, "name": name, "author": author, "description": description,
+                    "created": str(now).split(".")[0], "game": core.game, "files": files}
+        zf.writestr(MANIFEST_NAME, json.dumps(manifest, indent=1, ensure_ascii=False))
+    return BinPatch(patch_path)
+
+
+# Copies `length` bytes of src from `offset` to dst, hashing them into digest on the way
+def _copyHashed(src, dst, offset, length, digest, callback=None):
+    src.seek(offset)
+    remaining = length
+    while remaining > 0:
+        chunk = src.read(min(cave_io.COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise PatchError(os.path.basename(src.name) + " is shorter than the patch expects")
+        digest.update(chunk)
+        dst.write(chunk)
+        remaining -= len(chunk)
+        if callback:
+            callback(len(chunk))
+    return length
+
+
+# Hash of a file, which for backup objects is their name
+def _hashOf(store, path):
+    if os.path.dirname(os.path.dirname(os.path.abspath(path))) == os.path.abspath(store.objects_dir):
+        return os.path.basename(path)
+    return store.hashOf(path)
+
+
+# Applies every file in `patch` (a BinPatch) to the install of `store` (a backup_store.BackupStore),
+# writing to out_dir instead if given (Manual Mode). Files that already match are skipped.
+# If undo is a Snapshot, the files being replaced are backed up into it first.
+# callback(relpath, patched) is called (from worker threads) as each file is done.
+# Returns (patched, unchanged, errors), errors being a list of (relpath, exception).
+def applyPatch(patch, store, out_dir=None, threads=4, undo=None, callback=None):
+    from concurrent.futures import ThreadPoolExecutor
+
+    game_dir = os.path.realpath(store.game_dir)
+    lock = threading.Lock()
+    patched = []
+    unchanged = []
+    errors = []
+
+    def applyOne(patch_file):
+        path = store.game_dir + patch_file.relpath
+        out_path = out_dir + "/" + os.path.basename(patch_file.relpath) if out_dir else path
+        # Also catches symlinked folders that lead out of the install
+        if os.path.commonpath([game_dir, os.path.realpath(path)]) != game_dir:
+            raise PatchError(patch_file.relpath + " is outside the install")
+        if os.path.isfile(out_path) and os.path.getsize(out_path) == patch_file.size and store.hashOf(out_path) == patch_file.sha256:
+            return False
+
+        # The vanilla BIN: the one in the install if it hasn't been modded yet, otherwise the backed up copy
+        if os.path.isfile(path) and os.path.getsize(path) == patch_file.base_size and store.hashOf(path) == patch_file.base_sha256:
+            base_path = path
+        elif store.hasObject(patch_file.base_sha256):
+            base_path = store.objectPath(patch_file.base_sha256)
+        else:
+            raise PatchError("This patch is for a different version of " + os.path.basename(path) + ", and there's no backup of the right one")
+
+        if undo != None and out_path == path and os.path.isfile(path):
+            store.add(undo, patch_file.relpath)
+            store.writeManifest(undo)
+
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with cave_io.atomicWrite(out_path, dir_batch=store.dir_batch) as dst:
+            digest = hashlib.sha256()
+            patch_file.writeTo(base_path, patch.path, dst, digest=digest)
+            if dst.tell() != patch_file.size:
+                raise PatchError(os.path.basename(out_path) + ": came out " + str(dst.tell()) + " bytes, expected " + str(patch_file.size))
+            # Raised inside atomicWrite(), so a bad output never replaces the BIN
+            if digest.hexdigest() != patch_file.sha256:
+                raise PatchError(os.path.basename(out_path) + ": came out with the wrong sha256, the patch or its vanilla BIN is damaged")
+        return True
+
+    def run(patch_file):
+        try:
+            result = applyOne(patch_file)
+            error = None
+        except Exception as e:
+            result = False
+            error = e
+        with lock:
+            if error != None:
+                errors.append((patch_file.relpath, error))
+            elif result:
+                patched.append(patch_file.relpath)
+            else:
+                unchanged.append(patch_file.relpath)
+        if callback:
+            callback(patch_file.relpath, result)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(threads)), thread_name_prefix="mushimix-patch") as pool:
+        for relpath in sorted(patch.files):
+            pool.submit(run, patch.files[relpath])
+
+    if undo != None:
+        store.commit(undo)
+    else:
+        store.flush()
+    return sorted(patched), sorted(unchanged), errors
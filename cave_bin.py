@@ -0,0 +1,332 @@
+# MushiMix - CAVE BIN Container Parser
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Parser for the .bin containers used by the KOMODO published CAVE Steam Ports.
+# See the _CAVE_HEADER/_IFD_HEADER notes in mushimix.py or doc/cave_header_spec.py for the research this is based on.
+#
+# Layout:
+#   cave_header   0x24 bytes
+#   ifd_header    0x114 bytes each, `internal_count` of them directly after the cave_header
+#   file data     starting at `bin_meta_len`, located by each ifd's `data_offset`
+#
+# The whole file is memory-mapped, and the header and ifd table are unpacked straight out of the map,
+# so listing a BIN's internal files only touches the first page or two of the file.
+#
+# rebuildBin() writes a new container from a parsed one, replacing any internal entries,
+# and recalculates bin_len and every ifd's data_offset and length fields to match.
+# -----
+
+# Standard Modules
+import os
+import mmap
+import struct
+
+# MushiMix Modules
+import cave_io
+
+CAVE_MAGIC = b"\xC0\x09\x01\x17"
+WAV_FILE_TYPE = b"\x00\x00\x02" # Always this for wav, unknown for other types
+
+# Replacement key for "whichever entry is the music track", see CaveBin.musicEntry()
+MUSIC_ENTRY = "<music>"
+
+# magic, bin_len, bin_meta_len, internal_count, padding
+_CAVE_HEADER_FORMAT = "4sIII20s"
+# file_index, file_type, wav_len, unk_meta, data_offset, file_name
+_IFD_HEADER_FORMAT = "B3sIII260s"
+
+CAVE_HEADER_SIZE = struct.calcsize(">" + _CAVE_HEADER_FORMAT) # 0x24
+IFD_HEADER_SIZE = struct.calcsize(">" + _IFD_HEADER_FORMAT)   # 0x114
+
+
+class CaveBinError(Exception):
+    pass
+
+
+# cave_header - x00 - x23
+class CaveHeader:
+    __slots__ = ("magic", "bin_len", "bin_meta_len", "internal_count", "padding", "byteorder")
+
+    def __init__(self, magic=CAVE_MAGIC, bin_len=0, bin_meta_len=0, internal_count=0, padding=b"\x00" * 20, byteorder=">"):
+        self.magic = magic
+        self.bin_len = bin_len
+        self.bin_meta_len = bin_meta_len
+        self.internal_count = internal_count
+        self.padding = padding
+        self.byteorder = byteorder
+
+    @classmethod
+    def unpack(cls, buf, byteorder=">"):
+        return cls(*struct.unpack_from(byteorder + _CAVE_HEADER_FORMAT, buf, 0), byteorder=byteorder)
+
+    def pack(self):
+        return struct.pack(self.byteorder + _CAVE_HEADER_FORMAT, self.magic, self.bin_len, self.bin_meta_len, self.internal_count, self.padding)
+
+    def __repr__(self):
+        return "CaveHeader(bin_len=" + hex(self.bin_len) + ", bin_meta_len=" + hex(self.bin_meta_len) + ", internal_count=" + str(self.internal_count) + ")"
+
+
+# ifd_header - 0x114 bytes per internal file
+class IfdHeader:
+    __slots__ = ("file_index", "file_type", "wav_len", "unk_meta", "data_offset", "raw_name", "header_offset", "byteorder")
+
+    def __init__(self, file_index=0, file_type=WAV_FILE_TYPE, wav_len=0, unk_meta=0, data_offset=0, raw_name=b"", header_offset=0, byteorder=">"):
+        self.file_index = file_index
+        self.file_type = file_type
+        self.wav_len = wav_len
+        self.unk_meta = unk_meta
+        self.data_offset = data_offset
+        self.raw_name = raw_name # Kept as-is, including whatever comes after the null terminator
+        self.header_offset = header_offset
+        self.byteorder = byteorder
+
+    @classmethod
+    def unpack(cls, buf, header_offset, byteorder=">"):
+        return cls(*struct.unpack_from(byteorder + _IFD_HEADER_FORMAT, buf, header_offset), header_offset=header_offset, byteorder=byteorder)
+
+    def pack(self):
+        return struct.pack(self.byteorder + _IFD_HEADER_FORMAT, self.file_index, self.file_type, self.wav_len, self.unk_meta, self.data_offset, self.raw_name)
+
+    @property
+    def file_name(self):
+        return self.raw_name.split(b"\x00")[0].decode("ascii", errors="replace")
+
+    def isWav(self):
+        return self.file_type == WAV_FILE_TYPE or self.file_name.lower().endswith(".wav")
+
+    def isTga(self):
+        return self.file_name.lower().endswith(".tga")
+
+    # Length of the stored data, as recorded in the header. wav uses wav_len, tga uses unk_meta.
+    def dataLength(self):
+        if self.isWav():
+            return self.wav_len
+        return self.unk_meta
+
+    def __repr__(self):
+        return "IfdHeader(" + str(self.file_index) + ", " + repr(self.file_name) + ", data_offset=" + hex(self.data_offset) + ", len=" + hex(self.dataLength()) + ")"
+
+
+# CaveBin - A read-only, memory-mapped view of a single BIN container.
+# Use as a context manager (or call close()) so the map is released before the file is replaced on disk.
+class CaveBin:
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.header = None
+        self.entries = []
+        self._map = None
+        self.view = None
+
+        with open(path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size < CAVE_HEADER_SIZE:
+                raise CaveBinError(str(path) + ": too small to be a CAVE BIN (" + str(self.size) + " bytes)")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.view = memoryview(self._map)
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self):
+        if bytes(self.view[:4]) != CAVE_MAGIC:
+            raise CaveBinError(str(self.path) + ": bad magic 0x" + bytes(self.view[:4]).hex().upper())
+
+        byteorder = _detectByteOrder(self.view, self.size)
+        self.header = CaveHeader.unpack(self.view, byteorder)
+        for i in range(self.header.internal_count):
+            self.entries.append(IfdHeader.unpack(self.view, CAVE_HEADER_SIZE + i * IFD_HEADER_SIZE, byteorder))
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, file_name):
+        for entry in self.entries:
+            if entry.file_name == file_name:
+                return entry
+        return None
+
+    # Look up an entry by file_index, internal file_name, or MUSIC_ENTRY
+    def resolve(self, key):
+        if isinstance(key, IfdHeader):
+            return key
+        if key == MUSIC_ENTRY:
+            entry = self.musicEntry()
+        elif isinstance(key, int):
+            entry = None
+            for candidate in self.entries:
+                if candidate.file_index == key:
+                    entry = candidate
+                    break
+        else:
+            entry = self.find(key)
+        if entry == None:
+            raise CaveBinError(str(self.path) + ": no internal file matching " + repr(key))
+        return entry
+
+    def wavEntries(self):
+        return [entry for entry in self.entries if entry.isWav()]
+
+    # The music track. Single-WAV BINs only have one, and multi-file BINs (Main Menu) store the music last.
+    def musicEntry(self):
+        wavs = self.wavEntries()
+        if not wavs:
+            return None
+        return max(wavs, key=lambda entry: entry.data_offset)
+
+    # Byte range an entry occupies in the file: from its data_offset up to the next entry's data (or EOF).
+    # Any padding between entries is included.
+    def entrySpan(self, entry):
+        end = self.size
+        for other in self.entries:
+            if entry.data_offset < other.data_offset < end:
+                end = other.data_offset
+        return entry.data_offset, end
+
+    # Byte range of an entry's stored data: its declared length, or the whole span if that doesn't fit
+    def dataRange(self, entry):
+        start, end = self.entrySpan(entry)
+        length = entry.dataLength()
+        if length <= 0 or start + length > end:
+            length = end - start
+        return start, start + length
+
+    # Zero-copy slice of an entry's stored data. Only valid until close().
+    def data(self, entry):
+        start, end = self.dataRange(entry)
+        return self.view[start:end]
+
+
+# The research notes don't pin down the byte order, so pick whichever makes the header consistent with itself.
+def _detectByteOrder(buf, size):
+    fallback = None
+    for byteorder in (">", "<"):
+        _, bin_len, bin_meta_len, internal_count, _ = struct.unpack_from(byteorder + _CAVE_HEADER_FORMAT, buf, 0)
+        table_end = CAVE_HEADER_SIZE + internal_count * IFD_HEADER_SIZE
+        if table_end > size:
+            continue
+        if bin_meta_len == table_end:
+            return byteorder
+        if fallback is None:
+            fallback = byteorder
+    if fallback is None:
+        raise CaveBinError("ifd table does not fit in file")
+    return fallback
+
+
+# FileSource - Payload for rebuildBin() that is streamed from a range of a file on disk.
+class FileSource:
+    __slots__ = ("path", "offset", "length")
+
+    def __init__(self, path, offset=0, length=None):
+        self.path = path
+        self.offset = offset
+        if length is None:
+            length = os.path.getsize(path) - offset
+        self.length = length
+
+    def writeTo(self, dst, callback=None):
+        with open(self.path, 'rb') as src:
+            cave_io.copyRange(src, dst, self.offset, self.length, callback)
+
+
+# Works out the rebuilt cave_header and ifd table for `cave` with `replacements` ({key: source}) applied.
+# Returns the new header, new ifds (in table order), and the write plan: a list of (source, None) or (None, (start, end))
+# in data order, where the latter means "copy this span from the original file".
+def planBin(cave, replacements):
+    replaced = {}
+    for key, source in replacements.items():
+        replaced[cave.resolve(key)] = source
+
+    table_end = CAVE_HEADER_SIZE + len(cave.entries) * IFD_HEADER_SIZE
+    data_entries = sorted(cave.entries, key=lambda entry: entry.data_offset)
+    first_data = data_entries[0].data_offset if data_entries else cave.size
+
+    # Anything between the ifd table and the first file's data is kept as-is
+    plan = []
+    cursor = table_end
+    if first_data > table_end:
+        plan.append((None, (table_end, first_data)))
+        cursor += first_data - table_end
+
+    new_offsets = {}
+    span_offsets = {} # original data_offset -> new data_offset, for data copied unchanged
+    for entry in data_entries:
+        if entry in replaced:
+            new_offsets[entry] = cursor
+            plan.append((replaced[entry], None))
+            cursor += replaced[entry].length
+        elif entry.data_offset in span_offsets:
+            new_offsets[entry] = span_offsets[entry.data_offset] # Shares its data with an earlier entry
+        else:
+            start, end = cave.entrySpan(entry)
+            new_offsets[entry] = span_offsets[entry.data_offset] = cursor
+            plan.append((None, (start, end)))
+            cursor += end - start
+
+    new_ifds = []
+    for entry in cave.entries:
+        ifd = IfdHeader(entry.file_index, entry.file_type, entry.wav_len, entry.unk_meta, new_offsets[entry], entry.raw_name, entry.header_offset, entry.byteorder)
+        if entry in replaced:
+            if ifd.isWav():
+                ifd.wav_len = replaced[entry].length
+            else:
+                ifd.unk_meta = replaced[entry].length
+        new_ifds.append(ifd)
+
+    old = cave.header
+    header = CaveHeader(old.magic, cursor, table_end, len(new_ifds), old.padding, old.byteorder)
+    return header, new_ifds, plan
+
+
+# Writes the rebuilt container to the open binary file `dst` in a single linear pass.
+# The original data is copied out of `src` (the open original BIN) range by range, and replacements are streamed from their sources.
+# callback is passed through to cave_io.copyRange().
+def writeBin(cave, src, dst, replacements, callback=None):
+    header, ifds, plan = planBin(cave, replacements)
+    dst.write(header.pack())
+    for ifd in ifds:
+        dst.write(ifd.pack())
+    if callback:
+        callback(header.bin_meta_len)
+    for source, span in plan:
+        if source is not None:
+            source.writeTo(dst, callback)
+        else:
+            cave_io.copyRange(src, dst, span[0], span[1] - span[0], callback)
+    dst.flush()
+    return header.bin_len
+
+
+# Rebuilds the BIN at src_path with `replacements` applied, and writes it to outpath.
+# outpath can be the same file as src_path. The output is written atomically (see cave_io.atomicWrite()),
+# so anything reading outpath at the same time sees either the old BIN or the complete new one.
+def rebuildBin(src_path, outpath, replacements, callback=None, dir_batch=None):
+    # The source has to be closed (and unmapped) before the new file is moved over it, Windows won't allow it otherwise
+    with cave_io.atomicWrite(outpath, dir_batch=dir_batch) as dst:
+        with CaveBin(src_path) as cave, open(src_path, 'rb') as src:
+            written = writeBin(cave, src, dst, replacements, callback)
+    return written
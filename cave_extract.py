@@ -0,0 +1,128 @@
+# MushiMix - BIN Extractor
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Exports the WAVs (and TGAs) stored inside CAVE BINs as standalone files, to preview, edit or A/B the original tracks.
+#
+# Each BIN's ifd table is read from its memory map (see cave_bin.py), and every internal file is then copied straight
+# from its data_offset into its own file with cave_io.copyRange(), which hands the copy to the kernel
+# (copy_file_range / sendfile) so the data never passes through Python. BINs are done in parallel on a thread pool.
+#
+# Files are laid out like the install, one folder per BIN:
+#   <out_dir>/res/DISKDATA/B/m05/bgm.wav
+# Files that are already there with the right size are skipped, unless overwrite is set.
+# -----
+
+# Standard Modules
+import os
+import threading
+
+# MushiMix Modules
+import cave_io
+import cave_bin
+import cave_index
+
+KINDS = ("wav", "tga")
+
+
+def _kind(entry):
+    if entry.isWav():
+        return "wav"
+    if entry.isTga():
+        return "tga"
+    return "other"
+
+
+# A file name for an internal file that's safe to write anywhere: no folders, nothing empty, no duplicates within its BIN
+def _outName(entry, position, used):
+    name = entry.file_name.replace("/", "_").replace("\\", "_").replace(":", "_").strip(". ")
+    if not name:
+        name = "%02d.%s" % (position, _kind(entry) if _kind(entry) != "other" else "bin")
+    if name.lower() in used:
+        base, ext = os.path.splitext(name)
+        name = "%s.%02d%s" % (base, position, ext)
+    used.add(name.lower())
+    return name
+
+
+# Exports the internal files of one BIN whose kind is in `kinds` into out_dir. callback(n) is called with bytes written.
+# Returns [(out_path, length, extracted)], extracted being False for files that were already there.
+def extractBin(bin_path, out_dir, kinds=KINDS, overwrite=False, callback=None):
+    results = []
+    with cave_bin.CaveBin(bin_path) as cave:
+        spans = []
+        used = set()
+        for position, entry in enumerate(cave.entries):
+            if _kind(entry) not in kinds:
+                continue
+            data = cave.data(entry)
+            length = len(data)
+            data.release()
+            spans.append((_outName(entry, position, used), entry.data_offset, length))
+
+    if not spans:
+        return results
+    os.makedirs(out_dir, exist_ok=True)
+    with open(bin_path, 'rb') as src:
+        for name, offset, length in spans:
+            out_path = out_dir + "/" + name
+            if not overwrite and os.path.isfile(out_path) and os.path.getsize(out_path) == length:
+                results.append((out_path, length, False))
+                continue
+            # Not fsync'd like the game files are, these are just copies and a full export should go at disk speed
+            try:
+                with open(out_path, 'wb') as dst:
+                    cave_io.copyRange(src, dst, offset, length, callback)
+            except BaseException:
+                try:
+                    os.remove(out_path) # Don't leave a partial file that looks done
+                except OSError:
+                    pass
+                raise
+            results.append((out_path, length, True))
+    return results
+
+
+# Exports every BIN in `sources` ({relpath: path to read it from}) into out_dir, on `threads` threads.
+# BINs that aren't CAVE containers are skipped. bin_done(relpath, results, error) is called as each BIN is done.
+# Returns (extracted files, skipped files, bytes extracted, errors), errors being a list of (relpath, exception).
+def extractAll(sources, out_dir, threads=4, kinds=KINDS, overwrite=False, bin_done=None, wrote=None):
+    from concurrent.futures import ThreadPoolExecutor
+
+    lock = threading.Lock()
+    totals = {"extracted": 0, "skipped": 0, "bytes": 0}
+    errors = []
+
+    def run(relpath, path):
+        results = []
+        error = None
+        try:
+            results = extractBin(path, out_dir + os.path.splitext(relpath)[0], kinds, overwrite, wrote)
+        except cave_bin.CaveBinError:
+            pass # Not a container (or not one we can read), nothing to export
+        except Exception as e:
+            error = e
+        with lock:
+            if error != None:
+                errors.append((relpath, error))
+            for out_path, length, extracted in results:
+                if extracted:
+                    totals["extracted"] += 1
+                    totals["bytes"] += length
+                else:
+                    totals["skipped"] += 1
+        if bin_done:
+            bin_done(relpath, results, error)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(threads)), thread_name_prefix="mushimix-extract") as pool:
+        for relpath, path in sorted(sources.items()):
+            pool.submit(run, relpath, path)
+    return totals["extracted"], totals["skipped"], totals["bytes"], errors
+
+
+# {relpath: path} of every file in the install's DISKDATA folders, for extractAll()
+def installSources(game_dir):
+    game_dir = game_dir.rstrip("/\\")
+    return {relpath: game_dir + relpath for relpath in cave_index.diskdataFiles(game_dir)}
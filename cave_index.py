@@ -0,0 +1,268 @@
+# MushiMix - CAVE BIN Index
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Catalog of every CAVE BIN in an install, and every internal file in them, kept in a small SQLite database
+# ("<game>/mushimix-bk/cave_index.db"), so anything that needs to know what's in the install can just query it.
+#
+#   containers: one row per BIN  - relpath ("/res/DISKDATA/B/m05.bin"), size, mtime, sha256, header fields, or the parse error
+#   entries:    one row per ifd  - table position, file_index, file_type, name, kind ("wav", "tga" or "other"),
+#                                  header/data offsets, length, sha256 of the data, and the WAV format for WAVs
+#
+# scan() walks every res*/DISKDATA/* folder, and only (re)reads BINs whose (size, mtime) changed since the last scan,
+# so rescanning an unchanged install is a handful of stat() calls. BINs that do need reading are parsed and hashed
+# on a thread pool (hashing releases the GIL), straight out of the memory map, and written to the database in one transaction.
+# MushiMixCore.catalog() opens it for an install, and MushiMixCore.extract() uses it to only open the BINs that hold what it exports.
+# -----
+
+# Standard Modules
+import os
+import struct
+import hashlib
+import sqlite3
+import threading
+
+# MushiMix Modules
+import cave_io
+import cave_bin
+import wav_format
+
+INDEX_FILE = "cave_index.db"
+INDEX_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS containers (
+    id INTEGER PRIMARY KEY,
+    relpath TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT,
+    byteorder TEXT,
+    bin_len INTEGER,
+    meta_len INTEGER,
+    entry_count INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    container_id INTEGER NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    file_index INTEGER NOT NULL,
+    file_type TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    header_offset INTEGER NOT NULL,
+    data_offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    sha256 TEXT,
+    sample_rate INTEGER,
+    channels INTEGER,
+    bits_per_sample INTEGER,
+    frames INTEGER,
+    PRIMARY KEY (container_id, position)
+);
+CREATE INDEX IF NOT EXISTS entries_name ON entries (file_name);
+CREATE INDEX IF NOT EXISTS entries_sha256 ON entries (sha256);
+CREATE INDEX IF NOT EXISTS entries_kind ON entries (kind);
+"""
+
+
+# Every file under the install's res*/DISKDATA/* folders, as relpaths, sorted
+def diskdataFiles(game_dir):
+    game_dir = game_dir.rstrip("/\\")
+    found = []
+    try:
+        resources = sorted(os.listdir(game_dir))
+    except OSError:
+        return found
+    for res in resources:
+        diskdata = game_dir + "/" + res + "/DISKDATA"
+        if res[:3] != "res" or not os.path.isdir(diskdata):
+            continue
+        for folder in sorted(os.listdir(diskdata)):
+            if not os.path.isdir(diskdata + "/" + folder):
+                continue
+            for file_name in sorted(os.listdir(diskdata + "/" + folder)):
+                if os.path.isfile(diskdata + "/" + folder + "/" + file_name):
+                    found.append("/" + res + "/DISKDATA/" + folder + "/" + file_name)
+    return found
+
+
+# Hashes the whole container and every entry's data in one pass over the memory map, so each byte is only read once.
+# The file is cut at every entry's start and end, and each piece goes to the container's hasher and those of the entries it's in.
+# Returns (sha256 of the file, [hasher per entry, in table order]).
+def _hashContainer(cave):
+    ranges = [cave.dataRange(entry) for entry in cave.entries]
+    digests = [hashlib.sha256() for entry in cave.entries]
+    whole = hashlib.sha256()
+    cuts = sorted(set([0, cave.size] + [offset for span in ranges for offset in span]))
+    for start, end in zip(cuts, cuts[1:]):
+        piece = cave.view[start:end]
+        try:
+            whole.update(piece)
+            for (first, last), digest in zip(ranges, digests):
+                if first <= start and end <= last:
+                    digest.update(piece)
+        finally:
+            piece.release()
+    return whole.hexdigest(), digests
+
+
+# Everything the index stores about one BIN. Only takes plain arguments, so it runs fine on a worker thread.
+def readContainer(path):
+    stat = os.stat(path)
+    row = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": None, "byteorder": None,
+           "bin_len": None, "meta_len": None, "entry_count": None, "error": None, "entries": []}
+    try:
+        cave = cave_bin.CaveBin(path)
+    except (cave_bin.CaveBinError, ValueError, struct.error) as e:
+        row["error"] = str(e)
+        row["sha256"] = cave_io.hashFile(path)
+        return row
+
+    with cave:
+        row["sha256"], digests = _hashContainer(cave)
+        row["byteorder"] = cave.header.byteorder
+        row["bin_len"] = cave.header.bin_len
+        row["meta_len"] = cave.header.bin_meta_len
+        row["entry_count"] = cave.header.internal_count
+
+        for position, entry in enumerate(cave.entries):
+            kind = "wav" if entry.isWav() else "tga" if entry.isTga() else "other"
+            data = cave.data(entry)
+            try:
+                item = {"position": position, "file_index": entry.file_index, "file_type": entry.file_type.hex().upper(),
+                        "file_name": entry.file_name, "kind": kind, "header_offset": entry.header_offset,
+                        "data_offset": entry.data_offset, "length": len(data), "sha256": digests[position].hexdigest(),
+                        "sample_rate": None, "channels": None, "bits_per_sample": None, "frames": None}
+                if kind == "wav":
+                    try:
+                        info = wav_format.parseWavBuffer(data, entry.file_name)
+                        item.update(sample_rate=info.sample_rate, channels=info.channels, bits_per_sample=info.bits_per_sample, frames=info.frames)
+                    except wav_format.WavError:
+                        pass
+            finally:
+                data.release()
+            row["entries"].append(item)
+    return row
+
+
+# CaveIndex - The catalog database of one install. Safe to share between threads.
+class CaveIndex:
+    def __init__(self, game_dir, path=None):
+        self.game_dir = game_dir.rstrip("/\\")
+        self.path = path or self.game_dir + "/mushimix-bk/" + INDEX_FILE
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            # Older layout (or a new file), start over
+            self.db.executescript("DROP TABLE IF EXISTS entries; DROP TABLE IF EXISTS containers;")
+            self.db.execute("PRAGMA user_version = " + str(INDEX_VERSION))
+        self.db.executescript(_SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Brings the index up to date with the install. Only BINs that are new or whose (size, mtime) changed are read,
+    # on `threads` threads. callback(relpath) is called as each one is read.
+    # Returns (scanned, unchanged, removed) relpath lists.
+    def scan(self, threads=4, callback=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._lock:
+            known = {row["relpath"]: (row["size"], row["mtime_ns"]) for row in self.db.execute("SELECT relpath, size, mtime_ns FROM containers")}
+
+        changed = []
+        unchanged = []
+        present = diskdataFiles(self.game_dir)
+        for relpath in present:
+            stat = cave_io.statKey(self.game_dir + relpath)
+            if stat != None and known.get(relpath) == tuple(stat):
+                unchanged.append(relpath)
+            else:
+                changed.append(relpath)
+        removed = sorted(set(known) - set(present))
+
+        def read(relpath):
+            try:
+                row = readContainer(self.game_dir + relpath)
+            except OSError as e: # Gone or unreadable since the listing, leave it out
+                print("[WARNING]", "Couldn't index", relpath, ":", e)
+                row = None
+            if callback:
+                callback(relpath)
+            return relpath, row
+
+        rows = []
+        if changed:
+            with ThreadPoolExecutor(max_workers=max(1, int(threads)), thread_name_prefix="mushimix-index") as pool:
+                rows = list(pool.map(read, changed))
+
+        with self._lock, self.db:
+            for relpath in removed:
+                self.db.execute("DELETE FROM containers WHERE relpath = ?", (relpath,))
+            for relpath, row in rows:
+                self.db.execute("DELETE FROM containers WHERE relpath = ?", (relpath,))
+                if row == None:
+                    continue
+                cursor = self.db.execute(
+                    "INSERT INTO containers (relpath, size, mtime_ns, sha256, byteorder, bin_len, meta_len, entry_count, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (relpath, row["size"], row["mtime_ns"], row["sha256"], row["byteorder"], row["bin_len"], row["meta_len"], row["entry_count"], row["error"]))
+                self.db.executemany(
+                    "INSERT INTO entries (container_id, position, file_index, file_type, file_name, kind, header_offset, data_offset, length, sha256, sample_rate, channels, bits_per_sample, frames)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(cursor.lastrowid, e["position"], e["file_index"], e["file_type"], e["file_name"], e["kind"], e["header_offset"], e["data_offset"],
+                      e["length"], e["sha256"], e["sample_rate"], e["channels"], e["bits_per_sample"], e["frames"]) for e in row["entries"]])
+        return [relpath for relpath, row in rows if row != None], unchanged, removed
+
+    # --- Queries --- Rows are sqlite3.Row, which can be used like dicts (row["file_name"])
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def containers(self):
+        return self.query("SELECT * FROM containers ORDER BY relpath")
+
+    def container(self, relpath):
+        rows = self.query("SELECT * FROM containers WHERE relpath = ?", (relpath,))
+        return rows[0] if rows else None
+
+    # Entries of one BIN, in table order
+    def entries(self, relpath):
+        return self.query("SELECT entries.* FROM entries JOIN containers ON containers.id = entries.container_id WHERE relpath = ? ORDER BY position", (relpath,))
+
+    # Relpaths of the BINs that hold at least one entry of any of these kinds
+    def holding(self, kinds):
+        rows = self.query("SELECT DISTINCT relpath FROM containers JOIN entries ON containers.id = entries.container_id WHERE kind IN (" +
+                          ", ".join("?" * len(kinds)) + ") ORDER BY relpath", tuple(kinds))
+        return [row["relpath"] for row in rows]
+
+    # Entries across the install, with their BIN's relpath, filtered by any of: internal file name, kind, data sha256
+    def find(self, file_name=None, kind=None, sha256=None):
+        sql = "SELECT containers.relpath, entries.* FROM entries JOIN containers ON containers.id = entries.container_id"
+        conditions = []
+        params = []
+        for column, value in (("file_name", file_name), ("kind", kind), ("entries.sha256", sha256)):
+            if value != None:
+                conditions.append(column + " = ?")
+                params.append(value)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self.query(sql + " ORDER BY relpath, position", params)
+
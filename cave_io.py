@@ -0,0 +1,225 @@
+# MushiMix - CAVE BIN I/O Helpers
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Small helpers for streaming data between files without holding whole tracks in memory.
+# Extended tracks can easily be 100-300 MB, so everything here copies in fixed-size chunks,
+# and lets the kernel do the copy directly (copy_file_range / sendfile) where it is supported.
+#
+# Anything written into the game's install goes through atomicWrite(), so the game (or a crash)
+# never sees a half-written file: it's written to a hidden sibling temp file, fsync'd, then renamed into place.
+# -----
+
+# Standard Modules
+import os
+import sys
+import errno
+import hashlib
+import threading
+import contextlib
+
+# Chunk size used for the plain read/write fallback. Also the max amount handed to the kernel per call.
+COPY_CHUNK_SIZE = 1024 * 1024 # 1 MiB
+
+# Errors that just mean "this copy method isn't supported here", so we should fall back to the next one
+_UNSUPPORTED_ERRNOS = {errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ENOTSOCK}
+
+
+# Copy `length` bytes of src (starting at `offset`) to the current position of dst.
+# src and dst are regular binary file objects. If length is None, copies until EOF.
+# If given, callback(n) is called after every chunk with the number of bytes just copied.
+# It can raise (e.g. to cancel a mix) and the copy will stop there.
+# Returns the number of bytes copied.
+def copyRange(src, dst, offset=0, length=None, callback=None):
+    if length is None:
+        length = max(os.fstat(src.fileno()).st_size - offset, 0)
+
+    # Anything buffered on the Python side has to hit the fd first, since we write below the buffer
+    dst.flush()
+    src_fd = src.fileno()
+    dst_fd = dst.fileno()
+
+    # Shared by every method, so a method that fails partway still counts what it already wrote,
+    # and the next one picks up right after it instead of writing those bytes again
+    progress = [0]
+    for method in (_copyFileRange, _sendFile, _readWrite):
+        if progress[0] >= length:
+            break
+        try:
+            method(src_fd, dst_fd, offset, length, progress, callback)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+    copied = progress[0]
+
+    if copied < length:
+        raise EOFError("Source ended early: copied " + str(copied) + " of " + str(length) + " bytes")
+
+    # Keep the Python file object's idea of the position in sync with the fd
+    dst.seek(0, os.SEEK_CUR)
+    return copied
+
+
+# Writes header bytes followed by the full contents of a WAV file, streamed.
+# Peak memory is the header plus one chunk, no matter how long the track is.
+def writeBinStreamed(outpath, header, wav_path, callback=None):
+    with open(wav_path, 'rb') as src, open(outpath, 'wb') as dst:
+        dst.write(header)
+        written = len(header) + copyRange(src, dst, callback=callback)
+    return written
+
+
+# Linux ioctl to make dst share src's data blocks (btrfs, XFS, bcachefs, ...)
+_FICLONE = 0x40049409
+
+
+# Copies a whole file, as a reflink if the filesystem supports it, so the copy costs next to no space or time.
+# Falls back to a regular (kernel side where possible) copy. The copy is atomic, see atomicWrite().
+# Returns True if a reflink was made.
+def cloneFile(src_path, dst_path, dir_batch=None):
+    with open(src_path, 'rb') as src, atomicWrite(dst_path, dir_batch=dir_batch) as dst:
+        if sys.platform.startswith("linux"):
+            try:
+                import fcntl
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+                return True
+            except (ImportError, OSError):
+                pass
+        copyRange(src, dst)
+    return False
+
+
+# Write to `path` so that it either keeps its old contents or has the complete new ones, never anything in between:
+#   with cave_io.atomicWrite(path) as f:
+#       f.write(...)
+# The data is written to a hidden temp file next to `path`, fsync'd, then moved over `path` with os.replace().
+# If the block raises (including a cancelled mix), the temp file is removed and `path` is left untouched.
+# The rename also has to reach the disk, which needs an fsync of the directory. Pass a DirSyncBatch to
+# do those once per directory at the end of a batch of writes, instead of once per file.
+@contextlib.contextmanager
+def atomicWrite(path, mode='wb', dir_batch=None, encoding=None):
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, "." + os.path.basename(path) + "." + str(os.getpid()) + "-" + str(threading.get_ident()) + ".mushimix-tmp")
+    f = open(tmp_path, mode, encoding=encoding)
+    try:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        f.close()
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if dir_batch is None:
+        syncDir(directory)
+    else:
+        dir_batch.add(directory)
+
+
+# DirSyncBatch - Directories waiting for an fsync, see atomicWrite(). Safe to share between threads.
+class DirSyncBatch:
+    def __init__(self):
+        self.dirs = set()
+        self._lock = threading.Lock()
+
+    def add(self, directory):
+        with self._lock:
+            self.dirs.add(directory)
+
+    def sync(self):
+        with self._lock:
+            dirs = self.dirs
+            self.dirs = set()
+        for directory in sorted(dirs):
+            syncDir(directory)
+
+
+# Makes renames in a directory durable. Only possible (and needed) on POSIX systems.
+def syncDir(directory):
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# sha256 of a whole file, read in chunks
+def hashFile(path):
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, "file_digest"): # Python 3.11+
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+# (size, mtime_ns) of a file, or None if it doesn't exist. Cheap check for "has this file changed?"
+def statKey(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+# Linux 4.5+ - in-kernel copy, can be a reflink or server-side copy on some filesystems
+def _copyFileRange(src_fd, dst_fd, offset, length, progress, callback=None):
+    if not hasattr(os, "copy_file_range"):
+        return
+    while progress[0] < length:
+        n = os.copy_file_range(src_fd, dst_fd, min(length - progress[0], COPY_CHUNK_SIZE), offset + progress[0])
+        if n == 0:
+            break
+        progress[0] += n
+        if callback:
+            callback(n)
+
+
+# Linux 2.6.33+ supports file-to-file sendfile. Other platforms need a socket on the other end, so they fall through.
+def _sendFile(src_fd, dst_fd, offset, length, progress, callback=None):
+    if not hasattr(os, "sendfile") or not sys.platform.startswith("linux"):
+        return
+    while progress[0] < length:
+        n = os.sendfile(dst_fd, src_fd, offset + progress[0], min(length - progress[0], COPY_CHUNK_SIZE))
+        if n == 0:
+            break
+        progress[0] += n
+        if callback:
+            callback(n)
+
+
+# Portable fallback, reuses one buffer for the whole copy
+def _readWrite(src_fd, dst_fd, offset, length, progress, callback=None):
+    buf = bytearray(min(length - progress[0], COPY_CHUNK_SIZE))
+    view = memoryview(buf)
+    with open(src_fd, 'rb', buffering=0, closefd=False) as src:
+        src.seek(offset + progress[0])
+        while progress[0] < length:
+            n = src.readinto(view[:min(length - progress[0], len(buf))])
+            if not n:
+                break
+            _writeAll(dst_fd, view[:n])
+            progress[0] += n
+            if callback:
+                callback(n)
+
+
+def _writeAll(fd, view):
+    while view:
+        n = os.write(fd, view)
+        view = view[n:]
@@ -0,0 +1,183 @@
+# MushiMix - Mix Engine
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Schedules the per-track work of a remix (backup, then rebuilding the BIN) across a pool of threads.
+#
+# - Tasks that write the same BIN are run one after another, in the order given, on the same thread,
+#   so a file is always backed up before it is first overwritten, and the last selection still wins.
+# - The total size of the tasks in flight is capped, so a pile of huge extended tracks doesn't all hit the disk at once.
+# - Copies are done in the kernel where possible (see cave_io.py), which releases the GIL, so threads scale fine.
+# - Every BIN is replaced atomically, and the directory fsyncs are batched up until the end of the run.
+# -----
+
+# Standard Modules
+import os
+import threading
+
+# MushiMix Modules
+import cave_io
+import cave_bin
+
+DEFAULT_THREADS = min(4, os.cpu_count() or 1)
+DEFAULT_MAX_INFLIGHT = 1024 * 1024 * 1024 # 1 GiB
+
+
+class MixCancelled(Exception):
+    pass
+
+
+# MixTask - One entry to be mixed.
+#   bin_path:     the game's BIN to read from
+#   outpath:      where the rebuilt BIN goes (same as bin_path unless in Manual Mode)
+#   replacements: {cave_bin key: source} as for cave_bin.rebuildBin()
+#   backup:       optional backup(task), called on the worker thread before outpath is overwritten
+#   after:        optional after(task), called on the worker thread once outpath is written
+class MixTask:
+    __slots__ = ("entry", "bin_path", "outpath", "replacements", "backup", "backup_name", "after")
+
+    def __init__(self, entry, bin_path, outpath, replacements, backup=None, backup_name=None, after=None):
+        self.entry = entry
+        self.bin_path = bin_path
+        self.outpath = outpath
+        self.replacements = replacements
+        self.backup = backup
+        self.backup_name = backup_name # Name to report in backup_list
+        self.after = after
+
+    # Rough amount of data this task will move, used for the in-flight cap
+    def size(self):
+        total = sum(source.length for source in self.replacements.values())
+        try:
+            total += os.path.getsize(self.bin_path)
+        except OSError:
+            pass
+        return total
+
+
+# MixEngine - Runs MixTasks on a bounded thread pool.
+class MixEngine:
+    def __init__(self, threads=DEFAULT_THREADS, max_inflight=DEFAULT_MAX_INFLIGHT):
+        self.threads = max(1, int(threads))
+        self.max_inflight = max_inflight
+
+        self._lock = threading.Lock()
+        self._budget = threading.Condition()
+        self._inflight = 0
+        self._cancelled = threading.Event()
+
+        self.dir_batch = cave_io.DirSyncBatch()
+
+        # Results of the last run(), also filled in if it was cancelled part way
+        self.backup_list = []
+        self.errors = []
+
+    # Runs all the tasks, and returns once they are all done.
+    #   wrote(n):             called (serialized) with the number of bytes written, after every chunk
+    #   task_done(task, err): called (serialized) when each task finishes, err is None on success
+    #   cancelled:            threading.Event, checked between tasks and between chunks
+    # Returns (backup_list, errors). Raises MixCancelled if cancelled.
+    def run(self, tasks, wrote=None, task_done=None, cancelled=None):
+        if cancelled is None:
+            cancelled = threading.Event()
+        self._cancelled = cancelled
+        self._inflight = 0
+        self.backup_list = backup_list = []
+        self.errors = errors = []
+
+        # Group by output file, keeping the order tasks were given in
+        groups = {}
+        for task in tasks:
+            groups.setdefault(os.path.normcase(os.path.abspath(task.outpath)), []).append(task)
+
+        def onWrote(n):
+            if cancelled.is_set():
+                self.cancel() # Wake up tasks waiting on the budget, they won't get to run
+                raise MixCancelled()
+            if wrote:
+                with self._lock:
+                    wrote(n)
+
+        def runGroup(group):
+            for task in group:
+                if cancelled.is_set():
+                    raise MixCancelled()
+                size = self._acquire(task.size())
+                try:
+                    backed_up = self._runTask(task, onWrote)
+                    error = None
+                except MixCancelled:
+                    raise
+                except Exception as e:
+                    print("[ERRUR]", e, ": in MixEngine for", task.entry)
+                    error = e
+                    backed_up = False
+                finally:
+                    self._release(size)
+
+                with self._lock:
+                    if backed_up:
+                        backup_list.append(task.backup_name)
+                    if error is not None:
+                        errors.append((task.entry, error))
+                    if task_done:
+                        task_done(task, error)
+
+        # Imported here, it pulls in logging and friends, which scripts that only import the core don't need
+        from concurrent.futures import ThreadPoolExecutor
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="mushimix-mix") as pool:
+                futures = [pool.submit(runGroup, group) for group in groups.values()]
+                was_cancelled = False
+                for future in futures:
+                    try:
+                        future.result()
+                    except MixCancelled:
+                        was_cancelled = True
+                        self.cancel() # Stop the others too
+        finally:
+            self.dir_batch.sync()
+
+        if was_cancelled:
+            raise MixCancelled()
+        return backup_list, errors
+
+    # Backup (if needed), then rebuild. Returns True if a backup was made.
+    def _runTask(self, task, onWrote):
+        backed_up = False
+        if task.backup != None:
+            backed_up = bool(task.backup(task))
+
+        cave_bin.rebuildBin(task.bin_path, task.outpath, task.replacements, onWrote, self.dir_batch)
+        if task.after != None:
+            task.after(task)
+        return backed_up
+
+    # Cancels the running run(). Tasks waiting for room in the budget give up right away, running ones at their next chunk.
+    def cancel(self):
+        self._cancelled.set()
+        with self._budget:
+            self._budget.notify_all()
+
+    # In-flight byte budget. A task bigger than the whole budget still runs, just on its own.
+    # Raises MixCancelled if the run is cancelled while waiting.
+    def _acquire(self, size):
+        size = min(size, self.max_inflight)
+        with self._budget:
+            while True:
+                if self._cancelled.is_set():
+                    raise MixCancelled()
+                if not self._inflight or self._inflight + size <= self.max_inflight:
+                    break
+                # The cancel Event can also be set from outside (the GUI's Cancel), which doesn't notify, so don't wait forever
+                self._budget.wait(0.1)
+            self._inflight += size
+        return size
+
+    def _release(self, size):
+        with self._budget:
+            self._inflight -= size
+            self._budget.notify_all()
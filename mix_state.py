@@ -0,0 +1,108 @@
+# MushiMix - Incremental Mix State
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Small database of what was last mixed into each BIN, kept in "<game>/mushimix-bk/mixstate.json".
+# Lets a remix skip any track whose output would be byte-identical to what's already there,
+# so re-running a big playlist after changing one WAV only rewrites that one BIN.
+#
+# For each output BIN it records:
+#   wav:     the custom WAV's size, mtime and sha256
+#   base:    the same for the BIN that was read from, when it's not the output itself (Manual Mode)
+#   out:     the same for the resulting BIN
+#   options: anything else that changes the output (which entry was replaced, processing settings, etc.)
+#
+# Sizes and mtimes are checked first, files are only hashed when those don't match.
+# -----
+
+# Standard Modules
+import os
+import json
+import threading
+
+# MushiMix Modules
+import cave_io
+
+STATE_FILE = "mixstate.json"
+STATE_VERSION = 1
+
+
+class MixState:
+    def __init__(self, path):
+        self.path = path
+        self.targets = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == STATE_VERSION:
+                self.targets = data.get("targets", {})
+        except (OSError, ValueError) as e:
+            if os.path.exists(self.path):
+                print("[WARNING]", "Ignoring unreadable mix state", self.path, ":", e)
+            self.targets = {}
+
+    def save(self):
+        with self._lock:
+            data = {"version": STATE_VERSION, "targets": dict(self.targets)}
+        with cave_io.atomicWrite(self.path, 'w', encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    # True if mixing wav_path into outpath (reading from base_path) with these options would give the BIN that's already there
+    def isUpToDate(self, outpath, wav_path, base_path=None, options=None):
+        record = self.targets.get(_key(outpath))
+        if not record:
+            return False
+        if record.get("options") != (options or {}):
+            return False
+        if not _matches(record.get("out"), outpath):
+            return False
+        if not _matches(record.get("wav"), wav_path):
+            return False
+        if base_path != None and base_path != outpath:
+            if not _matches(record.get("base"), base_path):
+                return False
+        return True
+
+    # Call after outpath has been successfully written. Hashes the files, so run it off the GUI thread.
+    def record(self, outpath, wav_path, base_path=None, options=None):
+        record = {
+            "wav": _fingerprint(wav_path),
+            "out": _fingerprint(outpath),
+            "options": options or {},
+            }
+        if base_path != None and base_path != outpath:
+            record["base"] = _fingerprint(base_path)
+        with self._lock:
+            self.targets[_key(outpath)] = record
+
+    def forget(self, outpath):
+        with self._lock:
+            self.targets.pop(_key(outpath), None)
+
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _fingerprint(path):
+    return {"stat": cave_io.statKey(path), "sha256": cave_io.hashFile(path)}
+
+
+def _matches(fingerprint, path):
+    if not fingerprint:
+        return False
+    stat = cave_io.statKey(path)
+    if stat == None:
+        return False
+    if stat == fingerprint.get("stat"):
+        return True
+    # Touched or copied, but maybe still the same content
+    if stat[0] != fingerprint["stat"][0]:
+        return False
+    return cave_io.hashFile(path) == fingerprint.get("sha256")
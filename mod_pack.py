@@ -0,0 +1,247 @@
+# MushiMix - Mod Packs
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# A whole soundtrack mod in one file, to share and apply in one go.
+#
+# A pack is a plain zip file (".mmpack"), with every member stored uncompressed:
+#   mushimix-pack.json   the manifest (see below)
+#   tracks/NN-mXX.wav    one WAV per track, already converted to the game's format (and loudness matched) when the pack was built
+#
+# Since nothing is compressed, each WAV is one contiguous range of the pack file. Applying a pack streams those ranges
+# straight into the rebuilt BINs (cave_bin.FileSource with an offset), so nothing is extracted to temp files:
+# it's one sequential read of the pack to verify it, then one streaming write per BIN.
+#
+# Manifest:
+#   {
+#     "version": 1, "name": "...", "author": "...", "description": "...", "created": "2025-06-03 12:00:00",
+#     "game": "mushi" or "dfk",
+#     "tracks": {"Stage 1": {"member": "tracks/00-m05.wav", "bin": "m05.bin", "size": bytes, "sha256": "...", "format": "44100 Hz, 2 ch, 16-bit"}}
+#   }
+# Every member's sha256 is checked before anything in the install is touched, see ModPack.verify().
+#
+# Build one from a playlist with buildPack(), or "python mushimix_cli.py pack".
+# Apply one with MushiMixCore.applyPack(), or "python mushimix_cli.py apply".
+# -----
+
+# Standard Modules
+import os
+import json
+import struct
+import hashlib
+import zipfile
+import datetime
+
+# MushiMix Modules
+import cave_io
+import cave_bin
+import wav_format
+import wav_resample
+
+PACK_EXTENSION = ".mmpack"
+MANIFEST_NAME = "mushimix-pack.json"
+PACK_VERSION = 1
+
+_LOCAL_HEADER = struct.Struct("<4s22sHH") # signature, fixed fields, name length, extra length
+_LOCAL_SIGNATURE = b"PK\x03\x04"
+
+
+class PackError(Exception):
+    pass
+
+
+# PackMember - One track in a pack: where its WAV is in the pack file, and what it should hash to.
+# Used as a selection value for MushiMixCore.mix(), in place of a WAV path.
+class PackMember:
+    __slots__ = ("path", "entry", "name", "bin_name", "offset", "length", "sha256")
+
+    def __init__(self, path, entry, name, bin_name, offset, length, sha256):
+        self.path = path
+        self.entry = entry
+        self.name = name
+        self.bin_name = bin_name
+        self.offset = offset
+        self.length = length
+        self.sha256 = sha256
+
+    # Header of the member's WAV, with data_offset relative to the start of the pack file
+    def wavInfo(self):
+        with open(self.path, 'rb') as f:
+            def readAt(offset, length):
+                f.seek(self.offset + offset)
+                return f.read(max(0, min(length, self.length - offset)))
+
+            info = wav_format.parseWav(readAt, self.length, self.name)
+        info.data_offset += self.offset
+        return info
+
+    # The payload to write into the BIN. Packs are built in the game's format, so this is normally the member as-is.
+    # If target (a WavInfo) says otherwise, channels and bit depth are still converted, but the sample rate has to match.
+    def source(self, target=None):
+        info = self.wavInfo()
+        if target == None or info.sameFormat(target):
+            return cave_bin.FileSource(self.path, self.offset, self.length)
+        if info.sample_rate != target.sample_rate:
+            raise PackError(self.name + ": is " + str(info.sample_rate) + " Hz, but the game expects " + str(target.sample_rate) + " Hz")
+        return wav_format.ConvertedSource(self.path, info, target)
+
+    def __repr__(self):
+        return "PackMember(" + self.entry + ", " + self.name + ")"
+
+
+# ModPack - An opened pack. Reads the manifest and member offsets, not the audio.
+class ModPack:
+    def __init__(self, path):
+        self.path = path
+        try:
+            with zipfile.ZipFile(path, 'r') as zf:
+                try:
+                    manifest = json.loads(zf.read(MANIFEST_NAME).decode("utf-8"))
+                except KeyError:
+                    raise PackError(os.path.basename(path) + ": no " + MANIFEST_NAME + ", not a MushiMix pack")
+                infos = {info.filename: info for info in zf.infolist()}
+        except (OSError, zipfile.BadZipFile, ValueError) as e:
+            raise PackError(os.path.basename(path) + ": can't read pack: " + str(e))
+
+        if not isinstance(manifest, dict) or manifest.get("version") != PACK_VERSION:
+            raise PackError(os.path.basename(path) + ": unsupported pack version " + repr(manifest.get("version") if isinstance(manifest, dict) else None))
+        self.manifest = manifest
+        self.name = manifest.get("name", "")
+        self.author = manifest.get("author", "")
+        self.description = manifest.get("description", "")
+        self.created = manifest.get("created", "")
+        self.game = manifest.get("game", "")
+
+        self.members = {}
+        with open(path, 'rb') as f:
+            for entry, track in manifest.get("tracks", {}).items():
+                try:
+                    info = infos[track["member"]]
+                    self.members[entry] = PackMember(path, entry, info.filename, track.get("bin", ""), memberOffset(f, info), info.file_size, track["sha256"])
+                except KeyError as e:
+                    raise PackError(os.path.basename(path) + ": track " + repr(entry) + " is missing " + str(e))
+                if self.members[entry].length != track.get("size", info.file_size):
+                    raise PackError(os.path.basename(path) + ": " + info.filename + " is the wrong size")
+
+    # {entry: PackMember}, to pass to MushiMixCore.mix()
+    def selections(self):
+        return dict(self.members)
+
+    # Hashes every member, in the order they're stored, so the pack is read front to back once.
+    # callback(n) is called with the number of bytes read, like the mixing callbacks. Raises PackError on the first bad member.
+    def verify(self, callback=None):
+        with open(self.path, 'rb') as f:
+            for member in sorted(self.members.values(), key=lambda member: member.offset):
+                digest = hashlib.sha256()
+                f.seek(member.offset)
+                remaining = member.length
+                while remaining > 0:
+                    chunk = f.read(min(cave_io.COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise PackError(os.path.basename(self.path) + ": " + member.name + " is truncated")
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                    if callback:
+                        callback(len(chunk))
+                if digest.hexdigest() != member.sha256:
+                    raise PackError(os.path.basename(self.path) + ": " + member.name + " doesn't match its hash, the pack is damaged")
+
+    def __repr__(self):
+        return "ModPack(" + repr(self.name) + ", " + self.game + ", " + str(len(self.members)) + " tracks)"
+
+
+# Where a stored member's data starts in the zip file f: after its local header, whose name and extra fields can differ
+# from the central directory's. Also used for delta patches (bin_patch.py).
+def memberOffset(f, info):
+    if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+        raise PackError(info.filename + ": pack members must be stored uncompressed and unencrypted")
+    f.seek(info.header_offset)
+    signature, _, name_len, extra_len = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+    if signature != _LOCAL_SIGNATURE:
+        raise PackError(info.filename + ": bad local header")
+    return info.header_offset + _LOCAL_HEADER.size + name_len + extra_len
+
+
+# Writes the pack member for one source, hashing it on the way
+class _HashingWriter:
+    def __init__(self, dst):
+        self.dst = dst
+        self.digest = hashlib.sha256()
+        self.written = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.written += len(data)
+        return self.dst.write(data)
+
+
+# Streams a cave_bin payload source into a zip member. Zip members have no fileno(), so file ranges are copied in chunks.
+def _writeSource(source, dst, callback=None):
+    if isinstance(source, wav_resample.RenderedSource):
+        source.future.result() # Rendered to a file in the process pool
+        source = cave_bin.FileSource(source.out_path)
+    if isinstance(source, cave_bin.FileSource):
+        with open(source.path, 'rb') as src:
+            src.seek(source.offset)
+            remaining = source.length
+            while remaining > 0:
+                chunk = src.read(min(cave_io.COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise EOFError(os.path.basename(source.path) + " ended early")
+                dst.write(chunk)
+                remaining -= len(chunk)
+                if callback:
+                    callback(len(chunk))
+    else:
+        source.writeTo(dst, callback)
+
+
+# Builds a pack at pack_path from selections (as for MushiMixCore.mix()), using `core` to read the game's formats
+# and convert, loudness match and extend the WAVs the same way a Remix would. Nothing in the install is modified.
+# Returns the ModPack. Raises PackError if any track can't be used, and no pack is written.
+def buildPack(core, selections, pack_path, name="", author="", description="", callback=None):
+    if not core.game:
+        raise PackError("No supported game found in " + repr(core.game_dir))
+
+    with core.rendering():
+        sources = []
+        try:
+            vanilla = core.store.vanilla() if os.path.isdir(core.backup_dir) else None
+            pairs = [(core.resolveEntry(key), value["wav"] if isinstance(value, dict) else value) for key, value in selections.items()]
+            gains = {}
+            if core.normalize == True and core.match_loudness == True and pairs:
+                gains = core.loudnessGains(pairs, vanilla, save=False)
+
+            for (entry, wav_path), value in zip(pairs, selections.values()):
+                source = core.wavSource(entry, wav_path, vanilla, gains.get(entry, 0.0), value if isinstance(value, dict) else None)
+                sources.append((entry, core.startRender(entry, source)))
+        except (KeyError, wav_format.WavError, cave_bin.CaveBinError) as e:
+            raise PackError(str(e))
+
+        tracks = {}
+        with cave_io.atomicWrite(pack_path) as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+            now = datetime.datetime.now()
+            for i, (entry, source) in enumerate(sources):
+                bin_name = core.game_files[entry]
+                member = zipfile.ZipInfo("tracks/%02d-%s.wav" % (i, os.path.splitext(bin_name)[0]), now.timetuple()[:6])
+                member.compress_type = zipfile.ZIP_STORED
+                member.file_size = source.length
+                with zf.open(member, 'w', force_zip64=source.length > 0x7FFFFFFF) as dst:
+                    writer = _HashingWriter(dst)
+                    _writeSource(source, writer, callback)
+                if writer.written != source.length:
+                    raise PackError(entry + ": wrote " + str(writer.written) + " bytes, expected " + str(source.length))
+
+                fmt = getattr(source, "out", None) or getattr(source, "target", None)
+                tracks[entry] = {"member": member.filename, "bin": bin_name, "size": writer.written, "sha256": writer.digest.hexdigest()}
+                if fmt != None:
+                    tracks[entry]["format"] = fmt.describe()
+                print("[INFO]", ": Packed", entry, "as", member.filename)
+
+            manifest = {"version": PACK_VERSION, "name": name, "author": author, "description": description,
+                        "created": str(now).split(".")[0], "game": core.game, "tracks": tracks}
+            zf.writestr(MANIFEST_NAME, json.dumps(manifest, indent=1, ensure_ascii=False))
+    return ModPack(pack_path)
+
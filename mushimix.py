@@ -19,10 +19,11 @@
 # # !! Remember to backup your game's OST !!
 #
 # Mushimix will automatically create a "mushimix-bk" folder in the game's install directory on first use of "Remix",
-# and make a copy of any files before they are modded, if they don't exist in the directory already,
-# along with a small log noting when the last backup occurred and of which files.
-# You can use the controls in the program to enable and disable backing up unmodified files as desired.
-# To restore a backup, simply move the contents of "steamapps/common/<game>/mushimix-bk/" into the game's install directory.
+# and back up every file right before it is modded. Each Remix saves a snapshot of the files it backed up,
+# and their contents are kept in "mushimix-bk/objects/", named by their hash (see backup_store.py).
+# You can use the controls in the program to enable and disable backups as desired.
+# To restore a backup, use the "Restore Backup..." button, or `python mushimix_cli.py restore --game <game>`.
+# Don't copy the contents of "mushimix-bk" into the game's install directory, they aren't laid out like the game files.
 #
 # If things get messy, you can always use "Verify integrity of game files" via Steam to restore the OST back to vanilla.
 #
@@ -33,17 +34,30 @@
 # Standard Modules
 import os
 import sys
-import shutil
+import bisect
 import datetime
 import time
+import threading
+import multiprocessing
+
+STARTUP_START = time.perf_counter()
 
 # PySide6 (Qt Framework for Python)
 from PySide6 import QtCore, QtWidgets, QtGui
 
+# MushiMix Modules
+import mushimix_core
+import music_library
+import wav_format
+from mushimix_core import MixCancelled
+
+STARTUP_IMPORTED = time.perf_counter()
+
 # CAVE/KOMODO BIN format documentation
 # ----------------------------------------------
 # NOTE: The following two dictionaries are just documentation on the file format of the .bin files in the KOMODO published CAVE Steam Ports.
 # Both of these instances are not actually used in this script directly, but are here for reference and documentation purposes.
+# The actual parser lives in cave_bin.py
 # It is accurate to our research as of: 14 January 2026
 #
 # This spec is complete:
@@ -68,11 +82,8 @@ from PySide6 import QtCore, QtWidgets, QtGui
 #
 # NOTE: For modding Sound Effects:
 # Editing sound effects (and textures) in BIN files will change data chunk offsets in the ifd_headers.
-# As such, any mods that do so will need to account for this and manually reconstruct the headers to correct the offsets,
-# rather than just copy-pasting the entire cave_header and ifd_headers as mushimix currently does.
-# The special case for the Main Menu OST gets around this by just hardcoding the known offset of the menu music,
-# since it comes last in the ifd files anyways.
-# The code wouldnt be too hard to implement but unnecessary for now!
+# cave_bin.rebuildBin() takes care of this by reconstructing the cave_header and ifd_headers from the parsed table,
+# so any internal file can be replaced by passing its ifd file_name (or file_index) instead of cave_bin.MUSIC_ENTRY.
 #
 # Also probably would want a separate app or advanced/alternate mode for SFX editing,
 # since it would have to work on one file at a time, or would make the file list way too long.
@@ -80,135 +91,539 @@ from PySide6 import QtCore, QtWidgets, QtGui
 # ----------------------------------------------
 # TODO:
 # - Add Deathsmiles Support
-# - Design mod bundle/package spec for quick modding?
-#     Maybe for after texture modding, so others can bundle and share entire audiovisual overhaul mods.
+# - Mod packs (mod_pack.py) only hold audio for now, and can only be made/applied with mushimix_cli.py.
+#     Maybe extend them after texture modding, so others can bundle and share entire audiovisual overhaul mods.
 #     Due to added complexity, probably will want to make a separate program to handle sound effects and texture mods respectively.
 # ----------------------------------------------
 
-# CaveData - Hardcoded dictionaries of the in-game OST files. Modding Sound Effects is currently unsupported.
-class CaveData:
-    def __init__(self):
-        self.mushi_files = {
-            "Main Menu": "mme.bin",
-            # "Sound Effects": "ms.bin"
-            # "Voice Lines": "mv.bin"
-
-            "Shot Select":"m01.bin",
-            "Stage 1":"m05.bin",
-            "Stage 2":"m06.bin",
-            "Stage 3":"m09.bin",
-            "Stage 4":"m10.bin",
-            "Stage 5":"m11.bin",
-            "Stage Clear":"m02.bin",
-            "Boss 1":"m07.bin",
-            "Boss 2":"m12.bin",
-            "TLB Final":"m13.bin",
-            "Ending":"m08.bin",
-            "Name Entry":"m04.bin",
-            "Game Over":"m03.bin",
-
-            "(1.5) Shot Select":"mu01.bin",
-            "(1.5) Stage 1":"mu05.bin",
-            "(1.5) Stage 2":"mu06.bin",
-            "(1.5) Stage 3":"mu09.bin",
-            "(1.5) Stage 4":"mu10.bin",
-            "(1.5) Stage 5":"mu11.bin",
-            "(1.5) Stage Clear":"mu02.bin",
-            "(1.5) Boss 1":"mu07.bin",
-            "(1.5) Boss 2":"mu12.bin",
-            "(1.5) TLB Final":"mu13.bin",
-            "(1.5) Ending":"mu08.bin",
-            "(1.5) Name Entry":"mu04.bin",
-            "(1.5) Game Over":"mu03.bin",
-
-            "(Arrange) Shot Select":"ma01.bin",
-            "(Arrange) Stage 1":"ma05.bin",
-            "(Arrange) Stage 2":"ma06.bin",
-            "(Arrange) Stage 3":"ma09.bin",
-            "(Arrange) Stage 4":"ma10.bin",
-            "(Arrange) Stage 5":"ma11.bin",
-            "(Arrange) Stage Clear":"ma02.bin",
-            "(Arrange) Boss 1":"ma07.bin",
-            "(Arrange) Boss 2":"ma12.bin",
-            "(Arrange) TLB Final":"ma13.bin",
-            "(Arrange) Ending":"ma08.bin",
-            "(Arrange) Name Entry":"ma04.bin",
-            "(Arrange) Game Over":"ma03.bin",
-            }
 
-        self.dfk_files = {
-            "Main Menu": "mm.bin",
-            # "Sound Effects": "msoe.bin"
-            # "Voice Lines": "msv.bin"
-
-            "Shot Select":"m01.bin",
-            "Stage 1":"m02.bin",
-            "Stage 2-A":"m07a.bin",
-            "Stage 2-B":"m07b.bin",
-            "Stage 3-A":"m08a.bin",
-            "Stage 3-B":"m08b.bin",
-            "Stage 4-A":"m09a.bin",
-            "Stage 4-B":"m09b.bin",
-            "Stage 5":"m10.bin",
-            "Stage Clear":"m04.bin",
-            "Boss 1":"m03.bin",
-            "Boss 2":"m06.bin",
-            "EX Boss":"m11.bin",
-            "TLB Hibachi":"m12.bin",
-            "Ending":"m13.bin",
-            "Name Entry":"m05.bin",
-
-            "(BL) Shot Select":"mb01.bin",
-            "(BL) Stage 1":"mb02.bin",
-            "(BL) Stage 2-A":"mb07a.bin",
-            "(BL) Stage 2-B":"mb07b.bin",
-            "(BL) Stage 3-A":"mb08a.bin",
-            "(BL) Stage 3-B":"mb08b.bin",
-            "(BL) Stage 4-A":"mb09a.bin",
-            "(BL) Stage 4-B":"mb09b.bin",
-            "(BL) Stage 5":"mb10.bin",
-            "(BL) Stage Clear":"mb04.bin",
-            "(BL) Boss 1":"mb03.bin",
-            "(BL) Boss 2":"mb06.bin",
-            "(BL) EX Boss":"mb11.bin",
-            "(BL) TLB Hibachi":"mb12.bin",
-            "(BL) Secret Zatsuza":"mb14.bin",
-            "(BL) Ending":"mb13.bin",
-            "(BL) Name Entry":"mb05.bin",
-
-            "(BL Arrange) Shot Select":"mk01.bin",
-            "(BL Arrange) Stage 1":"mk02.bin",
-            "(BL Arrange) Stage 2-A":"mk07a.bin",
-            "(BL Arrange) Stage 2-B":"mk07b.bin",
-            "(BL Arrange) Stage 3-A":"mk08a.bin",
-            "(BL Arrange) Stage 3-B":"mk08b.bin",
-            "(BL Arrange) Stage 4-A":"mk09a.bin",
-            "(BL Arrange) Stage 4-B":"mk09b.bin",
-            "(BL Arrange) Stage 5":"mk10.bin",
-            "(BL Arrange) Stage Clear":"mk04.bin",
-            "(BL Arrange) Boss 1":"mk03.bin",
-            "(BL Arrange) Boss 2":"mk06.bin",
-            "(BL Arrange) EX Boss":"mk11.bin",
-            "(BL Arrange) TLB Hivac":"mk12.bin",
-            "(BL Arrange) Secret":"mk14.bin",
-            "(BL Arrange) Ending":"mb13.bin",
-            "(BL Arrange) Name Entry":"mk05.bin",
-            }
+# Signals for MixWorker. QRunnable isn't a QObject, so these live on their own object.
+class MixSignals(QtCore.QObject):
+    progress = QtCore.Signal(int, int, str, object, float) # tracks done, total tracks, last finished entry, bytes written, MB/s
+    finished = QtCore.Signal(str, bool) # status message, whether backups were made
+
+
+# MixWorker - Runs a mix job on a QThreadPool thread.
+# settings is a snapshot of MushiMix's state, jobs is a list of (entry, custom WAV filename).
+class MixWorker(QtCore.QRunnable):
+    def __init__(self, settings, jobs):
+        super().__init__()
+        self.signals = MixSignals()
+        self.settings = settings
+        self.jobs = jobs
+        self.cancelled = threading.Event()
+
+        self.bytes_written = 0
+        self.tracks_done = 0
+        self.last_entry = ""
+        self.start = 0
+        self.last_emit = 0
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        start_time = datetime.datetime.now()
+        self.start = time.perf_counter()
+        backed_up = False
+        try:
+            core = self.mix()
+            backed_up = core.backup_mode
+            end_time = datetime.datetime.now()
+            elapsed_time = end_time - start_time
+            message = "Done! @ " + str(end_time).split(".")[0] + " in " + str(elapsed_time) + "s"
+            if core.skipped:
+                message += "\n" + str(len(core.skipped)) + " unchanged track(s) skipped"
+            # Rejected WAVs and failed tracks are left out of the mix, so the rest still gets done
+            if core.errors:
+                failed = ", ".join(str(entry) for entry, e in core.errors)
+                message = "🟥 " + str(len(core.errors)) + " track(s) failed to mix! " + failed + "\n" + message
+            else:
+                message = "🟢 " + message
+        except MixCancelled:
+            message = "🟥 Cancelled! " + str(self.tracks_done) + "/" + str(len(self.jobs)) + " tracks were mixed"
+        except Exception as e:
+            print("[ERRUR]", e, ": in MixWorker.run()")
+            message = "🟥 Mix failed! " + str(e)
+        self.signals.finished.emit(message, backed_up)
+
+    # Called after every chunk written (serialized by the engine). Throttled so the GUI isn't flooded with signals.
+    def wrote(self, n):
+        self.bytes_written += n
+        now = time.perf_counter()
+        if now - self.last_emit > 0.1:
+            self.last_emit = now
+            self.emitProgress()
+
+    def taskDone(self, task, error):
+        self.tracks_done += 1
+        self.last_entry = task.entry
+        self.emitProgress()
+
+    def emitProgress(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-6)
+        self.signals.progress.emit(self.tracks_done, len(self.jobs), self.last_entry, self.bytes_written, self.bytes_written / elapsed / 1048576)
+
+    def mix(self):
+        settings = self.settings
+        paths = settings["paths"]
+        core = mushimix_core.MushiMixCore(paths["game"], paths["out"], settings["safe_mode"], settings["backup_mode"], settings["threads"], match_loudness=settings["match_loudness"], extend=settings["extend"])
+
+        selections = {}
+        for entry, wav_name in self.jobs:
+            selections[entry] = paths["music"] + "/" + wav_name
+
+        core.mix(selections, self.wrote, self.taskDone, self.cancelled)
+        return core
+
+
+# RestoreWorker - Restores a backup snapshot on a QThreadPool thread. Shares MixSignals with MixWorker.
+class RestoreWorker(QtCore.QRunnable):
+    def __init__(self, core, name):
+        super().__init__()
+        self.signals = MixSignals()
+        self.core = core
+        self.name = name
+        self.done = 0
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        pass
+
+    def run(self):
+        start_time = datetime.datetime.now()
+        try:
+            restored, unchanged, errors = self.core.restore(self.name, self.fileDone)
+            end_time = datetime.datetime.now()
+            message = "🟢 Restored " + str(len(restored)) + " file(s) @ " + str(end_time).split(".")[0] + " in " + str(end_time - start_time) + "s"
+            if errors:
+                message = "🟥 " + str(len(errors)) + " file(s) failed to restore!\n" + message
+        except Exception as e:
+            print("[ERRUR]", e, ": in RestoreWorker.run()")
+            message = "🟥 Restore failed! " + str(e)
+        self.signals.finished.emit(message, False)
+
+    def fileDone(self, relpath, restored):
+        with self.lock:
+            self.done += 1
+            self.signals.progress.emit(self.done, 0, relpath, 0, 0.0)
+
+
+# Track List
+# The tracks of the current game are rows of one TrackListModel (track name, custom WAV picked for it, its details), shown in a QTableView.
+# Every dropdown shares the one list of music files (a MusicListModel), and a dropdown is only created for the row being
+# edited, by TrackDelegate. So changing the game or music folder is a single model reset, however many tracks and WAVs there are.
+NO_TRACK = "--"
+
+class TrackListModel(QtCore.QAbstractTableModel):
+    HEADERS = ("Track", "Custom WAV", "Details")
+
+    def __init__(self, info, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        self.chosen = {} # {entry: WAV filename}, entries without a pick aren't in it
+        self.info = info # {WAV filename: music_library.LibraryEntry}, shared with MusicLibrary
+
+    # New list of tracks, which clears every pick
+    def setEntries(self, entries):
+        self.beginResetModel()
+        self.entries = list(entries)
+        self.chosen = {}
+        self.endResetModel()
+
+    # Moves every pick of the file old_name to new_name, or clears them if new_name is None
+    def replaceChoice(self, old_name, new_name):
+        for entry, wav_name in list(self.chosen.items()):
+            if wav_name == old_name:
+                self.setChoice(entry, new_name)
+
+    def choice(self, entry):
+        return self.chosen.get(entry, NO_TRACK)
+
+    def setChoice(self, entry, wav_name):
+        if not wav_name or wav_name == NO_TRACK:
+            self.chosen.pop(entry, None)
+        else:
+            self.chosen[entry] = wav_name
+        row = self.entries.index(entry)
+        self.dataChanged.emit(self.index(row, 1), self.index(row, 2))
+
+    # The music library has read more WAV details
+    @QtCore.Slot()
+    def infoChanged(self):
+        if self.entries:
+            self.dataChanged.emit(self.index(0, 2), self.index(len(self.entries) - 1, 2))
+
+    # [(entry, WAV filename)] of every track with a pick, in track order
+    def selections(self):
+        return [(entry, self.chosen[entry]) for entry in self.entries if entry in self.chosen]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role not in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return None
+        entry = self.entries[index.row()]
+        if index.column() == 0:
+            return entry
+        if index.column() == 1:
+            return self.choice(entry)
+        info = self.info.get(self.chosen.get(entry))
+        return info.describe() if info != None and role == QtCore.Qt.DisplayRole else ""
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid() or index.column() != 1 or role != QtCore.Qt.EditRole:
+            return False
+        self.setChoice(self.entries[index.row()], value)
+        return True
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() == 1:
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+
+# MusicListModel - The music file names shared by every dropdown, with each file's details as its tooltip
+class MusicListModel(QtCore.QStringListModel):
+    def __init__(self, info, strings, parent=None):
+        super().__init__(strings, parent)
+        self.info = info # {WAV filename: music_library.LibraryEntry}, shared with MusicLibrary
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.ToolTipRole:
+            info = self.info.get(super().data(index, QtCore.Qt.DisplayRole))
+            return info.describe() if info != None else None
+        return super().data(index, role)
+
+
+# Signals for LibraryScanWorker
+class LibrarySignals(QtCore.QObject):
+    finished = QtCore.Signal(str, object) # folder, {WAV filename: music_library.LibraryEntry}
+
+
+# LibraryScanWorker - Reads WAV details (music_library.LibraryCache.scan()) on a QThreadPool thread.
+# names is the list of files to read, or None for the whole folder.
+class LibraryScanWorker(QtCore.QRunnable):
+    def __init__(self, cache, folder, names, threads):
+        super().__init__()
+        self.signals = LibrarySignals()
+        self.cache = cache
+        self.folder = folder
+        self.names = names
+        self.threads = threads
+
+    def run(self):
+        entries = {}
+        try:
+            entries, read = self.cache.scan(self.folder, self.names, self.threads)
+            print("[INFO]", ": Music library scanned,", len(entries), "WAV(s),", len(read), "read (the rest were cached)")
+        except Exception as e:
+            print("[ERRUR]", e, ": in LibraryScanWorker.run()")
+        self.signals.finished.emit(self.folder, entries)
+
+
+# MusicLibrary - The WAVs in the music folder, kept sorted in the dropdowns' shared model (after NO_TRACK).
+# The folder is watched with a QFileSystemWatcher. When it changes, its names are listed again (no sorting, nothing opened
+# that was already known), and just the files that were added or removed are inserted into / removed from the model.
+# Picks are kept by name in TrackListModel, so they stay put; changed(added, removed) lets the window follow renames.
+# New files are opened to check they're WAVs (12 bytes), and ones that aren't are only checked again once their size or mtime changes.
+#
+# Details of every WAV (see music_library.py) are read in the background, from the cache for files that haven't changed.
+# Files with the same audio as one that sorts before them are left out of the model, and merged({duplicate: original})
+# lets the window move their picks over.
+class MusicLibrary(QtCore.QObject):
+    changed = QtCore.Signal(list, list) # added file names, removed file names
+    merged = QtCore.Signal(dict) # {duplicate file name: file name it duplicates}
+    infoChanged = QtCore.Signal()
+    RESET_OVER = 64 # Deltas bigger than this are applied as one model reset instead of row by row
+
+    def __init__(self, model, threads=4, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.threads = threads
+        self.path = ""
+        self.present = set() # Every WAV in the folder
+        self.files = [] # Sorted, the model's rows minus NO_TRACK: present, without duplicates
+        self.rejected = {} # {file name: (size, mtime)} of .wav files that weren't WAVs (or weren't yet, while being copied)
+        self.info = model.info
+        self.duplicate_of = {}
+        self.cache = None
+        self.scans = set() # Running LibraryScanWorkers, kept referenced until they're done
+
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        # Copying a batch of files fires a burst of changes, so they're handled together once it settles
+        self.watcher.directoryChanged.connect(lambda changed_path: self.refresh_timer.start(250))
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def setPath(self, path):
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self.path = path
+        self.rejected = {}
+        self.info.clear()
+        self.duplicate_of = {}
+        self.present = self._scan(set()) if path else set()
+        self.files = sorted(self.present)
+        self.model.setStringList([NO_TRACK] + self.files)
+        if path and os.path.isdir(path):
+            self.watcher.addPath(path)
+            self._startScan(None)
+
+    # Names of the WAVs in the folder. Names in `known` are taken as still being WAVs without opening them.
+    def _scan(self, known):
+        found = set()
+        retry = False
+        try:
+            with os.scandir(self.path) as items:
+                for item in items:
+                    name = item.name
+                    if name[-4:].lower() != ".wav":
+                        continue
+                    if name in known:
+                        found.add(name)
+                        continue
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    key = (stat.st_size, stat.st_mtime_ns)
+                    if self.rejected.get(name) == key:
+                        continue
+                    if item.is_file() and wav_format.isWav(self.path + "/" + name): # Only reads the first 12 bytes
+                        found.add(name)
+                        self.rejected.pop(name, None)
+                    else:
+                        self.rejected[name] = key
+                        retry = True
+        except OSError as e:
+            print("[WARNING]", "Couldn't read the music folder :", e)
+        if retry:
+            # Might still be being written, and writes alone don't always make the watcher fire
+            self.refresh_timer.start(2000)
+        return found
+
+    def _startScan(self, names):
+        if self.cache == None:
+            try:
+                self.cache = music_library.LibraryCache()
+            except Exception as e:
+                print("[WARNING]", "Couldn't open the music library cache, details won't be kept :", e)
+                self.cache = music_library.LibraryCache(":memory:")
+        worker = LibraryScanWorker(self.cache, self.path, names, self.threads)
+        worker.signals.finished.connect(lambda folder, entries: self.scanned(worker, folder, entries))
+        self.scans.add(worker)
+        QtCore.QThreadPool.globalInstance().start(worker)
+
+    def scanned(self, worker, folder, entries):
+        self.scans.discard(worker)
+        if folder != self.path:
+            return # Folder was changed while it was being scanned
+        for name, entry in entries.items():
+            if name in self.present:
+                self.info[name] = entry
+        self._findDuplicates()
+        self._apply()
+        self.infoChanged.emit()
+
+    # removed are files that just went away. If one had duplicates, the one that's listed now takes over its picks.
+    def _findDuplicates(self, removed=()):
+        previous = self.duplicate_of
+        self.duplicate_of = music_library.duplicates({name: self.info[name] for name in self.present if name in self.info})
+        merged = {name: original for name, original in self.duplicate_of.items() if previous.get(name) != original}
+        for name in removed:
+            survivors = sorted(copy for copy, original in previous.items() if original == name and copy in self.present)
+            if survivors:
+                merged[name] = self.duplicate_of.get(survivors[0], survivors[0])
+        if merged:
+            self.merged.emit(merged)
+
+    # Brings the model in line with present, minus duplicates
+    def _apply(self):
+        visible = self.present.difference(self.duplicate_of)
+        known = set(self.files)
+        added = sorted(visible - known)
+        removed = sorted(known - visible)
+        if len(added) + len(removed) > self.RESET_OVER:
+            self.files = sorted(visible)
+            self.model.setStringList([NO_TRACK] + self.files)
+            return
+        for name in removed:
+            row = bisect.bisect_left(self.files, name)
+            del self.files[row]
+            self.model.removeRows(row + 1, 1)
+        for name in added:
+            row = bisect.bisect_left(self.files, name)
+            self.files.insert(row, name)
+            self.model.insertRows(row + 1, 1)
+            self.model.setData(self.model.index(row + 1), name)
+
+    @QtCore.Slot()
+    def refresh(self):
+        if not self.path:
+            return
+        # Some programs replace the whole folder, which drops it from the watcher
+        if self.path not in self.watcher.directories() and os.path.isdir(self.path):
+            self.watcher.addPath(self.path)
+
+        known = self.present
+        self.present = self._scan(known)
+        added = sorted(self.present - known)
+        removed = sorted(known - self.present)
+        if not added and not removed:
+            return
+
+        for name in removed:
+            self.info.pop(name, None)
+        self._findDuplicates(removed)
+        self._apply()
+        if added:
+            self._startScan(added)
+        print("[INFO]", ": Music folder changed,", len(added), "added,", len(removed), "removed")
+        self.changed.emit(added, removed)
+
+
+# TrackDelegate - The dropdown for the "Custom WAV" column, on the shared music file model.
+# It can be typed into, to filter the music files (matching anywhere in the name) instead of scrolling through them.
+class TrackDelegate(QtWidgets.QStyledItemDelegate):
+    def __init__(self, music_model, parent=None):
+        super().__init__(parent)
+        self.music_model = music_model
+
+    def createEditor(self, parent, option, index):
+        box = QtWidgets.QComboBox(parent)
+        box.setModel(self.music_model)
+        box.setEditable(True)
+        box.setInsertPolicy(QtWidgets.QComboBox.NoInsert)
+        box.view().setUniformItemSizes(True)
+        completer = box.completer()
+        completer.setFilterMode(QtCore.Qt.MatchContains)
+        completer.setCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        completer.setCompletionMode(QtWidgets.QCompleter.PopupCompletion)
+        box.activated.connect(lambda i: self.commitData.emit(box)) # Picking from the list is saved right away
+        return box
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentIndex(max(0, editor.findText(index.data(QtCore.Qt.EditRole))))
+
+    def setModelData(self, editor, model, index):
+        wav_name = editor.currentText()
+        if editor.findText(wav_name) < 0: # Typed something that isn't one of the files
+            wav_name = NO_TRACK
+        model.setData(index, wav_name, QtCore.Qt.EditRole)
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(option.rect)
+
+
+# Startup
+# The title and logo images are far bigger than they're shown, and decoding and scaling them was most of the time to the first frame.
+# Their scaled versions are saved in "<cache folder>/assets" (see music_library.cacheDir()), named after the source's size and mtime,
+# so they're only made again when the source image changes. Without a cached copy yet, they're made once the window is up.
+ASSET_DIR = music_library.cacheDir() + "/assets"
+
+def assetCachePath(source, size):
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+    name = os.path.splitext(os.path.basename(source))[0]
+    return ASSET_DIR + "/%s-%dx%d-%d-%d.png" % (name, size.width(), size.height(), stat.st_size, stat.st_mtime_ns)
+
+
+# The image at source scaled to fit size. With cached_only, returns None instead of scaling it if there's no cached copy.
+def loadAsset(source, size, cached_only=False):
+    cache_path = assetCachePath(source, size)
+    if cache_path != None and os.path.isfile(cache_path):
+        pixmap = QtGui.QPixmap(cache_path)
+        if not pixmap.isNull():
+            return pixmap
+    if cached_only:
+        return None
+
+    scaled = QtGui.QPixmap(source).scaled(size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+    if cache_path != None and not scaled.isNull():
+        try:
+            os.makedirs(ASSET_DIR, exist_ok=True)
+            prefix = os.path.basename(cache_path).rsplit("-", 2)[0] + "-"
+            for old_name in os.listdir(ASSET_DIR): # Copies of an older version of the image
+                if old_name.startswith(prefix):
+                    os.remove(ASSET_DIR + "/" + old_name)
+            if scaled.save(cache_path + ".tmp", "PNG"):
+                os.replace(cache_path + ".tmp", cache_path)
+        except OSError as e:
+            print("[WARNING]", "Couldn't cache", source, ":", e)
+    return scaled
+
+
+# StartupTimer - With --startup-timing, prints how long each step of startup took, once the first frame is up
+class StartupTimer:
+    __slots__ = ("enabled", "last", "steps")
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.last = STARTUP_IMPORTED
+        self.steps = [("imports", STARTUP_IMPORTED - STARTUP_START)]
+
+    def mark(self, step):
+        now = time.perf_counter()
+        self.steps.append((step, now - self.last))
+        self.last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        print("[INFO]", ": Startup timing")
+        for step, seconds in self.steps:
+            print("  %-18s %8.1f ms" % (step, seconds * 1000))
+        print("  %-18s %8.1f ms" % ("total", (self.last - STARTUP_START) * 1000))
+
+
+# FirstFrameFilter - Calls done() once, right after the first paint of the widget it's installed on
+class FirstFrameFilter(QtCore.QObject):
+    def __init__(self, done, parent=None):
+        super().__init__(parent)
+        self.done = done
+
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.Paint and self.done != None:
+            QtCore.QTimer.singleShot(0, self.done)
+            self.done = None
+        return False
+
 
 class MushiMix:
     def __init__(self):
         print(" --- MushiMix 2.0.0 ---")
+        self.startup = StartupTimer("--startup-timing" in sys.argv[1:])
+        self.deferred = [] # Run once the first frame is up
         self.app = QtWidgets.QApplication([])
+        self.startup.mark("QApplication")
         self.containers = {}
         self.widgets = {}
-        self.cave_data = CaveData()
 
 
         self.current_game = ""
         self.current_game_file_dict = {}
 
-        self.music_file_list = []
-        self.file_dict = {}
+        self.music_info = {} # {WAV filename: music_library.LibraryEntry}
+        self.track_model = TrackListModel(self.music_info)
+        self.music_model = MusicListModel(self.music_info, [NO_TRACK]) # Shared by every track's dropdown
+        self.music_library = MusicLibrary(self.music_model, mushimix_core.DEFAULT_THREADS)
+        self.music_library.changed.connect(self.musicChanged)
+        self.music_library.merged.connect(self.musicMerged)
+        self.music_library.infoChanged.connect(self.track_model.infoChanged)
         self.path_dict = {
             "out": "./out",
             "backup": ""
@@ -216,9 +631,13 @@ class MushiMix:
 
         self.safe_mode = False # Renamed to Manual Mode for clarity. Disabled by default for direct game modding
         self.backup_mode = True # For simple file version backups
+        self.match_loudness = True # Turn custom tracks up/down to the level of the track they replace
 
         self.backup_status = " "
         self.progress = "🟥 Select a supported game first!"
+        self.mix_worker = None
+        self.mix_threads = mushimix_core.DEFAULT_THREADS
+        self.extend_minutes = 0 # Loop tracks with loop points out to this long, 0 for off
         print("[INFO]", ": Initialization Complete!")
 
 
@@ -245,83 +664,24 @@ class MushiMix:
 
 
     def updateFileList(self, path, key, dir_type):
-        # Clear exiting file list
-        for entry in self.file_dict.keys():
-            self.file_dict[entry].clear()
-            self.file_dict[entry].addItem("--")
-
         # Update game list
         if (dir_type == "game"):
-            if self.filelist_container.layout() != None:
-                layout = self.filelist_container.layout()
-
-                # MUST iterate in reverse order as deleting an item shifts the index for every item
-                # Special thanks to eyllanesc on stackoverflow.com for this because
-                # it is practically undocumented. The method given for safely deleting widgets of a layout in the official Qt Documentation is _wrong_
-                # and will cause a runtime error or crash.
-                for index in reversed(range(layout.count())):
-                    layout.itemAt(index).widget().setParent(None)
-
-            self.current_game = ""
-            self.current_game_file_dict = {}
-            self.file_dict = {}
+            self.current_game, tracks = mushimix_core.discoverTracks(path[key])
+            self.current_game_file_dict = {entry: os.path.basename(relpath) for entry, relpath in tracks.items()}
+            self.track_model.setEntries(self.current_game_file_dict.keys())
             self.filelist_container.show()
 
-            game = path[key]
-            if (os.path.isdir(self.path_dict["game"] + "/res/DISKDATA")):
-                if game[-13:] == "Mushihimesama" or (game[-4:] == "虫姫さま"):
-                    self.current_game = "mushi"
-                    self.current_game_file_dict = self.cave_data.mushi_files
-
-                elif (game[-23:] == "DoDonPachi Resurrection") or (game[-8:] == "怒首領蜂 大復活"):
-                    self.current_game = "dfk"
-                    self.current_game_file_dict = self.cave_data.dfk_files
-
-            # Add dropdowns
-            for entry in self.current_game_file_dict.keys():
-                self.file_dict[entry] = QtWidgets.QComboBox(parent=self.filelist_container)
-                self.file_dict[entry].addItem("--")
-
-                # Populate wth music if any
-                if self.music_file_list != None:
-                    self.file_dict[entry].addItems(self.music_file_list)
-
         if dir_type == "music":
-            # Clear exiting file list
-            for entry in self.file_dict.keys():
-                self.file_dict[entry].clear()
-                self.file_dict[entry].addItem("--")
-
-            # Read Music directory
-            self.music_file_list = []
-            if path[key]:
-                for i in os.listdir(path[key]):
-                    if i[-4:] == ".wav": # Should read magic as well to verify but 99% of cases this will work fine.
-                        self.music_file_list.append(i)
-                    self.music_file_list.sort()
-
-            # Populate any dropdowns
-            if self.filelist_container.layout() != None:
-                layout = self.filelist_container.layout()
-                for k in self.file_dict.keys():
-                    for track in self.music_file_list:
-                        self.file_dict[k].addItem(track)
-
-        # Update layout
-        layout = self.filelist_container.layout()
-        if layout == None:
-            layout = QtWidgets.QGridLayout(self.filelist_container)
-
-        i = 0
-        for label, widget in self.file_dict.items():
-            layout.addWidget(QtWidgets.QLabel(label, parent=self.filelist_container), 0 + i, 0)
-            layout.addWidget(widget,0 + i, 1)
-            i += 1
-
-            self.filelist_container.show()
+            # Read Music directory, and watch it from now on. Every dropdown shares this model, so this is one reset
+            # no matter how many tracks there are, and picks of files that are in the new folder too are kept.
+            self.music_library.setPath(path[key])
+            available = set(self.music_library.files)
+            for entry, wav_name in self.track_model.selections():
+                if wav_name not in available:
+                    self.track_model.setChoice(entry, None)
 
         # Ready Check
-        if self.file_dict.items() != None:
+        if self.current_game:
             self.path_dict["backup"] = self.path_dict["game"] + "/mushimix-bk"
             if os.path.isdir(self.path_dict["backup"]):
                 self.backup_status = "🟢 Backup folder exists!"
@@ -340,6 +700,44 @@ class MushiMix:
             self.info_progress.setText(self.progress)
 
 
+    # Music folder changed on disk. A single file swapped for another is taken as a rename, and its picks follow it.
+    @QtCore.Slot(list, list)
+    def musicChanged(self, added, removed):
+        if len(added) == 1 and len(removed) == 1:
+            self.track_model.replaceChoice(removed[0], added[0])
+            return
+        for wav_name in removed:
+            self.track_model.replaceChoice(wav_name, None)
+
+    # Files turned out to have the same audio as another, and only that one is listed now
+    @QtCore.Slot(dict)
+    def musicMerged(self, merged):
+        for wav_name, original in merged.items():
+            self.track_model.replaceChoice(wav_name, original)
+
+
+    # Sets a label's image from the asset cache, or once the first frame is up if it isn't cached yet
+    def setAsset(self, label, source, size):
+        pixmap = loadAsset(source, size, cached_only=True)
+        if pixmap != None:
+            label.setPixmap(pixmap)
+        else:
+            self.deferred.append(lambda: label.setPixmap(loadAsset(source, size)))
+
+    @QtCore.Slot()
+    def firstFrame(self):
+        if self.deferred == None:
+            return
+        self.startup.mark("first frame")
+        deferred = self.deferred
+        self.deferred = None
+        for callback in deferred:
+            callback()
+        if deferred:
+            self.startup.mark("deferred assets")
+        self.startup.report()
+
+
     # Window
     def createWindow(self):
         self.window = QtWidgets.QWidget()
@@ -355,9 +753,7 @@ class MushiMix:
 
         # Title
         title = QtWidgets.QLabel(parent=top_container)
-        img = QtGui.QPixmap("./img/mushimix-title.png")
-        scaled = img.scaled(QtCore.QSize(240, 240), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
-        title.setPixmap(scaled)
+        self.setAsset(title, "./img/mushimix-title.png", QtCore.QSize(240, 240))
         # title.setMinimumHeight(120)
 
         # Credits
@@ -389,9 +785,7 @@ class MushiMix:
 
         # Image
         image = QtWidgets.QLabel(parent=top_container)
-        img = QtGui.QPixmap("./img/mushimix-logo.png")
-        scaled = img.scaled(QtCore.QSize(200, 200), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
-        image.setPixmap(scaled)
+        self.setAsset(image, "./img/mushimix-logo.png", QtCore.QSize(200, 200))
 
         # Layout 2x5 grid
         layout = QtWidgets.QGridLayout(top_container)
@@ -414,9 +808,35 @@ class MushiMix:
 
         # List
         self.filelist_container = QtWidgets.QGroupBox(parent=bot_container)
-        scrollArea = QtWidgets.QScrollArea()
-        scrollArea.setWidget(self.filelist_container)
-        scrollArea.setWidgetResizable(True)
+
+        track_filter = QtWidgets.QLineEdit(parent=self.filelist_container)
+        track_filter.setPlaceholderText("Filter tracks...")
+        track_filter.setClearButtonEnabled(True)
+
+        # Filters on both columns, so a track can be found by name or by the WAV picked for it
+        track_proxy = QtCore.QSortFilterProxyModel(self.filelist_container)
+        track_proxy.setSourceModel(self.track_model)
+        track_proxy.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        track_proxy.setFilterKeyColumn(-1)
+        track_filter.textChanged.connect(track_proxy.setFilterFixedString)
+
+        track_view = QtWidgets.QTableView(parent=self.filelist_container)
+        track_view.setModel(track_proxy)
+        track_view.setItemDelegateForColumn(1, TrackDelegate(self.music_model, track_view))
+        track_view.setEditTriggers(QtWidgets.QAbstractItemView.AllEditTriggers)
+        track_view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        track_view.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        track_view.setWordWrap(False)
+        track_view.verticalHeader().hide()
+        track_view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed) # Same height rows, so only visible rows are laid out
+        track_view.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeToContents)
+        track_view.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.Stretch)
+        track_view.horizontalHeader().setSectionResizeMode(2, QtWidgets.QHeaderView.ResizeToContents)
+
+        list_layout = QtWidgets.QVBoxLayout(self.filelist_container)
+        list_layout.addWidget(track_filter)
+        list_layout.addWidget(track_view)
+        self.widgets["track_view"] = track_view
 
         # Manual Mode - Safe Mode Check
         check_container = QtWidgets.QWidget(parent=bot_container)
@@ -433,6 +853,30 @@ class MushiMix:
         backup_checkbox.setStyleSheet("QCheckBox { font:bold; font-size : 16px } QCheckBox::indicator { width: 24px; height: 24px;} ")
         backup_checkbox.setToolTip("When enabled, will copy vanilla files \ninto \"<game_path>/mushimix-bk/\" before modifying.")
 
+        # Loudness Checkbox
+        loudness_checkbox = QtWidgets.QCheckBox("Match Loudness", parent=bot_container)
+        loudness_checkbox.setChecked(self.match_loudness)
+        loudness_checkbox.stateChanged.connect(lambda checked: self.loudnessModeChange())
+        loudness_checkbox.setStyleSheet("QCheckBox { font:bold; font-size : 16px } QCheckBox::indicator { width: 24px; height: 24px;} ")
+        loudness_checkbox.setToolTip("When enabled, custom tracks are turned up or down \nto the same loudness as the track they replace. (needs NumPy)")
+
+        # Mix Threads
+        threads_label = QtWidgets.QLabel("Threads", parent=bot_container)
+        threads_spinbox = QtWidgets.QSpinBox(parent=bot_container)
+        threads_spinbox.setRange(1, max(16, os.cpu_count() or 1))
+        threads_spinbox.setValue(self.mix_threads)
+        threads_spinbox.valueChanged.connect(lambda value: self.threadsChange(value))
+        threads_spinbox.setToolTip("How many tracks to mix at the same time.\nFast SSDs benefit from more, hard drives from fewer.")
+
+        # Loop Extension
+        extend_label = QtWidgets.QLabel("Extend Loops (min)", parent=bot_container)
+        extend_spinbox = QtWidgets.QSpinBox(parent=bot_container)
+        extend_spinbox.setRange(0, 60)
+        extend_spinbox.setSpecialValueText("Off")
+        extend_spinbox.setValue(self.extend_minutes)
+        extend_spinbox.valueChanged.connect(lambda value: self.extendChange(value))
+        extend_spinbox.setToolTip("Tracks with loop points (a \"smpl\" chunk) are looped, with crossfades,\nuntil they are at least this long, so they don't loop early in game.")
+
         # Info and Game Selector
         info_text = QtWidgets.QLabel("""\
 How to Use:
@@ -443,7 +887,8 @@ How to Use:
   4. Click "Remix!"
 
 Notes:
- - Changing a directory will clear file list!
+ - Changing the game directory will clear file list!
+ - The music folder is watched, picks are kept as WAVs come and go
  - Use Manual Mode to save to "out" folder instead
 
 Currently supported CAVE games (Steam Ver.)
@@ -466,15 +911,28 @@ Currently supported CAVE games (Steam Ver.)
         mix_button.setMaximumHeight(100)
         mix_button.setStyleSheet("QPushButton { font : bold; font-size: 30px; }")  #height: 48px; }")
         mix_button.clicked.connect(lambda checked: self.mixButton())
+        self.widgets["mix_button"] = mix_button
+
+        # Restore Button
+        restore_button = QtWidgets.QPushButton("Restore Backup...", parent=bot_container)
+        restore_button.clicked.connect(lambda checked: self.restoreButton())
+        restore_button.setToolTip("Roll the game files back to vanilla, or to how they were before any previous Remix.")
+        self.widgets["restore_button"] = restore_button
 
         # Layout 1x2 grid for checkboxes
         layout = QtWidgets.QGridLayout(check_container)
         layout.addWidget(safe_checkbox, 0, 0, 1, 1)
         layout.addWidget(backup_checkbox, 0, 1, 1, 1)
+        layout.addWidget(loudness_checkbox, 1, 0, 1, 2)
+        layout.addWidget(threads_label, 2, 0, 1, 1)
+        layout.addWidget(threads_spinbox, 2, 1, 1, 1)
+        layout.addWidget(extend_label, 3, 0, 1, 1)
+        layout.addWidget(extend_spinbox, 3, 1, 1, 1)
+        layout.addWidget(restore_button, 4, 0, 1, 2)
 
         # Layout 3x5 grid
         layout = QtWidgets.QGridLayout(bot_container)
-        layout.addWidget(scrollArea, 0, 0, 6, 3)
+        layout.addWidget(self.filelist_container, 0, 0, 6, 3)
         layout.addWidget(check_container, 0, 3, 1, 1)
         layout.addWidget(info_text, 1, 3, 1, 1)
         layout.addWidget(self.info_backup, 2, 3, 1, 1)
@@ -524,105 +982,130 @@ Currently supported CAVE games (Steam Ver.)
             print("[INFO]",": Backups Disabled")
 
 
+    # Loudness Matching
+    @QtCore.Slot()
+    def loudnessModeChange(self):
+        if self.match_loudness == False:
+            self.match_loudness = True
+            print("[INFO]",": Loudness Matching Enabled")
+        else:
+            self.match_loudness = False
+            print("[INFO]",": Loudness Matching Disabled")
+
+
+    # Mix Threads
+    @QtCore.Slot()
+    def threadsChange(self, value):
+        self.mix_threads = value
+        self.music_library.threads = value
+        print("[INFO]",": Mix Threads set to", value)
+
+
+    # Loop Extension
+    @QtCore.Slot()
+    def extendChange(self, value):
+        self.extend_minutes = value
+        print("[INFO]",": Extend Loops set to", value, "min")
+
+
     # Mix Button
+    # The actual mixing is done by a MixWorker on the global QThreadPool, so the window stays responsive.
+    # Clicking again while a mix is running cancels it.
     @QtCore.Slot()
     def mixButton(self):
+        if self.mix_worker != None:
+            print("[INFO]",": Cancelling...")
+            self.mix_worker.cancel()
+            self.progress = "🟡 Cancelling..."
+            self.info_progress.setText(self.progress)
+            return
+
         # Ready Check
-        if self.file_dict:
-            print("[INFO]",": Mixing!")
-            start_time = datetime.datetime.now()
-            dfk_paths = {
-                "1.5":  "/res/DISKDATA/F/",
-                "BL":   "/res_BL/DISKDATA/F/",
+        if self.track_model.entries:
+            jobs = self.track_model.selections()
+
+            # Snapshot of the current settings, so changing them mid-mix doesn't affect the running job
+            settings = {
+                "paths": dict(self.path_dict),
+                "safe_mode": self.safe_mode,
+                "backup_mode": self.backup_mode,
+                "match_loudness": self.match_loudness,
+                "threads": self.mix_threads,
+                "extend": self.extend_minutes * 60 or None,
                 }
-            mushi_path = "/res/DISKDATA/B/"
-
-            if self.safe_mode == True:
-                if not os.path.isdir(self.path_dict["out"]):
-                    os.makedirs(self.path_dict["out"])
-                    print("[INFO]", ": Created Manual Mode Directory")
-
-            if self.backup_mode == True:
-                if not os.path.isdir(self.path_dict["backup"]):
-                    os.makedirs(self.path_dict["backup"])
-                    print("[INFO]:", "Created Backup Directory.")
-                backup_list = []
-
-            for entry in self.file_dict.keys():
-                try:
-                    if self.file_dict[entry].currentText() != "--": # check if combo box has something:
-
-                        # Check Game
-                        if self.current_game == "mushi":
-                            diskdata_path = mushi_path
-                        if self.current_game == "dfk":
-                            if entry[:3] == "(BL":
-                                diskdata_path = dfk_paths["BL"]
-                            else:
-                                diskdata_path = dfk_paths["1.5"]
-
-                        # Backup the file if needed
-                        if self.backup_mode == True:
-                            src = self.path_dict["game"] + diskdata_path + self.current_game_file_dict[entry]
-                            dst = self.path_dict["backup"] + diskdata_path
-                            if not os.path.isfile(dst + self.current_game_file_dict[entry]):
-                                if not os.path.isdir(dst):
-                                    os.makedirs(dst)
-                                shutil.copy2(src, dst, follow_symlinks=True)
-                                backup_list.append(diskdata_path + self.current_game_file_dict[entry])
-
-                        # Get the mushi_header and custom WAV file data:
-                        with open(self.path_dict["game"] + diskdata_path + self.current_game_file_dict[entry], 'rb') as f:
-                            if entry == "Main Menu": # Main Menu special case
-                                header = f.read(0x474)
-                                # Preserve all menu Sound Effects data
-                                # NOTE: Editing sound effects in the future will change data chunk offsets.
-                                if self.current_game == "mushi":
-                                    mm_se_data = f.read(0x139EE)
-                                    header = header + mm_se_data
-                                if self.current_game == "dfk":
-                                    mm_se_data = f.read(0x355B6)
-                                    header = header + mm_se_data
-                            else:
-                                header = f.read(0x138)
-                            f.close() # Make sure this is closed before overwriting
-
-                        with open(self.path_dict["music"] + "/" + self.file_dict[entry].currentText(), 'rb') as f:
-                            data = f.read()
-
-                        # Write file with game header + filename
-                        out = header + data
-                        outpath = self.path_dict["game"] + diskdata_path + self.current_game_file_dict[entry]
-                        if self.safe_mode == True:
-                            outpath = self.path_dict["out"] + "/" + self.current_game_file_dict[entry]
-
-                        with open(outpath, 'wb') as f:
-                            f.write(out)
-                except Exception as e:
-                    print("[ERRUR]", e, ": in mixButton()")
-
-
-            if self.backup_mode == True:
-                with open(self.path_dict["backup"] + "/backup.log", "a+") as f:
-                    if backup_list:
-                        f.write("---\n")
-                        f.write("Backup @ " + str(start_time).split(".")[0] + "\n")
-                        for i in backup_list:
-                            f.write(i + "\n")
-
-                    f.close()
-                self.backup_status = "🟢 Backup versioning complete!"
-                self.info_backup.setText(self.backup_status)
 
-            end_time = datetime.datetime.now()
-            elapsed_time = end_time - start_time
-            self.progress = "🟢 Done! @ " + str(end_time).split(".")[0] + " in " + str(elapsed_time) + "s"
+            print("[INFO]",": Mixing!")
+            self.mix_worker = MixWorker(settings, jobs)
+            self.mix_worker.signals.progress.connect(self.mixProgress)
+            self.mix_worker.signals.finished.connect(self.mixFinished)
+            self.widgets["mix_button"].setText("Cancel")
+            self.progress = "🟡 Mixing... 0/" + str(len(jobs))
             self.info_progress.setText(self.progress)
-            print("[INFO]",": 🟢 Done! @ " + str(end_time).split(".")[0] + " in " + str(elapsed_time) + "s")
+            QtCore.QThreadPool.globalInstance().start(self.mix_worker)
 
         else:
             print("[WARNING]", "Nothing to mix! Did you set a Game Directory yet?")
 
+    @QtCore.Slot(int, int, str, object, float)
+    def mixProgress(self, done, total, entry, bytes_written, throughput):
+        self.progress = "🟡 Mixing... " + str(done) + "/" + str(total) + " " + entry + "\n" + str(round(bytes_written / 1048576, 1)) + " MB @ " + str(round(throughput, 1)) + " MB/s"
+        self.info_progress.setText(self.progress)
+
+    @QtCore.Slot(int, int, str, object, float)
+    def restoreProgress(self, done, total, relpath, bytes_written, throughput):
+        self.progress = "🟡 Restoring... " + str(done) + " file(s) checked\n" + relpath
+        self.info_progress.setText(self.progress)
+
+    @QtCore.Slot(str, bool)
+    def mixFinished(self, message, backed_up):
+        self.mix_worker = None
+        self.widgets["mix_button"].setText("Remix!")
+        self.widgets["mix_button"].setEnabled(True)
+        if backed_up:
+            self.backup_status = "🟢 Backup versioning complete!"
+            self.info_backup.setText(self.backup_status)
+        self.progress = message
+        self.info_progress.setText(self.progress)
+        print("[INFO]",":", message)
+
+
+    # Restore Button
+    # Lets the user pick a backup snapshot, then restores it on a RestoreWorker.
+    @QtCore.Slot()
+    def restoreButton(self):
+        if self.mix_worker != None:
+            print("[WARNING]", "Can't restore while mixing!")
+            return
+        if not self.current_game:
+            print("[WARNING]", "Nothing to restore! Did you set a Game Directory yet?")
+            return
+
+        core = mushimix_core.MushiMixCore(self.path_dict["game"], self.path_dict["out"], backup_mode=self.backup_mode, threads=self.mix_threads)
+        snapshots = core.snapshots()
+        if not snapshots:
+            self.progress = "🟥 No backups to restore yet!"
+            self.info_progress.setText(self.progress)
+            return
+
+        items = ["Vanilla (oldest backup of every file)"]
+        names = ["vanilla"]
+        for snapshot in reversed(snapshots):
+            items.append("Before Remix @ " + snapshot.created + " (" + str(len(snapshot.files)) + " files)")
+            names.append(snapshot.name)
+
+        item, ok = QtWidgets.QInputDialog.getItem(self.window, "Restore Backup", "Roll the game files back to:", items, 0, False)
+        if not ok:
+            return
+
+        print("[INFO]",": Restoring!")
+        self.mix_worker = RestoreWorker(core, names[items.index(item)])
+        self.mix_worker.signals.progress.connect(self.restoreProgress)
+        self.mix_worker.signals.finished.connect(self.mixFinished)
+        self.widgets["mix_button"].setEnabled(False)
+        self.progress = "🟡 Restoring..."
+        self.info_progress.setText(self.progress)
+        QtCore.QThreadPool.globalInstance().start(self.mix_worker)
+
 
     # Layout
     def updateWindowLayout(self):
@@ -632,14 +1115,21 @@ Currently supported CAVE games (Steam Ver.)
 
     def run(self):
         self.createWindow()
+        self.startup.mark("window")
         self.createTopWidget()
+        self.startup.mark("top widget")
         self.createBottomWidget()
+        self.startup.mark("bottom widget")
         self.updateWindowLayout()
 
+        first_frame = FirstFrameFilter(self.firstFrame, self.window)
+        self.window.installEventFilter(first_frame)
+        QtCore.QTimer.singleShot(1000, self.firstFrame) # In case the platform never paints an offscreen window
         self.app.exec()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Resampling runs in worker processes, which need this in a frozen build
     mushimix = MushiMix()
     mushimix.run()
     print("[INFO]", ": Program Exited")
@@ -0,0 +1,572 @@
+# MushiMix - Batch Command Line
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Headless remixing from a playlist manifest, for one or many installs, without starting Qt.
+# Works for every game mushimix_core supports (Mushihimesama and DoDonPachi Resurrection).
+#
+# Usage:
+#   python mushimix_cli.py mix PLAYLIST.json [--game DIR ...] [--jobs N] [--dry-run] [--json] [--manual OUT_DIR]
+#                                            [--no-backup] [--no-loudness] [--no-convert] [--extend SECONDS] [--force]
+#   python mushimix_cli.py pack PLAYLIST.json --output PACK.mmpack [--game DIR] [--name NAME] [--author AUTHOR] [--description TEXT]
+#   python mushimix_cli.py apply PACK.mmpack --game DIR [...] [--jobs N] [--dry-run] [--json] [--manual OUT_DIR] [--no-backup] [--force]
+#   python mushimix_cli.py diff --game DIR --output PATCH.mmpatch [--modded OUT_DIR] [--name NAME] [--author AUTHOR] [--description TEXT]
+#   python mushimix_cli.py patch PATCH.mmpatch --game DIR [...] [--jobs N] [--json] [--manual OUT_DIR] [--no-backup]
+#   python mushimix_cli.py extract --game DIR --output OUT_DIR [--kind wav|tga ...] [--vanilla] [--overwrite] [--jobs N] [--json]
+#   python mushimix_cli.py backups --game DIR [--json]
+#   python mushimix_cli.py restore --game DIR [NAME] [--jobs N] [--json]
+#
+# The playlist is a JSON file. Tracks are keyed by entry name ("Stage 1") or BIN filename ("m05.bin"),
+# the same as mushimix_core.MushiMixCore.mix(). WAV paths are relative to the playlist's folder.
+#   {
+#     "games":  ["/path/to/steamapps/common/Mushihimesama"],       (optional, --game adds to these)
+#     "tracks": {"Stage 1": "stage1.wav", "m06.bin": {"wav": "stage2.wav", "extend": 600}},
+#     "mushi":  {"Main Menu": "menu.wav"},                          (optional, only for Mushihimesama installs)
+#     "dfk":    {"(BL) Stage 1": "bl1.wav"}                          (optional, only for DoDonPachi Resurrection installs)
+#     "cave":   {"bgm01.bin": "track.wav"}                           (optional, only for other CAVE ports, see track_table.py)
+#   }
+# A file with just the {entry: wav} mapping works too.
+#
+# With --json, progress is written to stdout as one JSON object per line, and the usual log goes to stderr:
+#   {"event": "start", "game": ..., "tracks": N}
+#   {"event": "track", "game": ..., "entry": ..., "status": "mixed" | "skipped" | "failed" | "planned", ...}
+#   {"event": "progress", "game": ..., "done": n, "tracks": N, "bytes": b, "mb_per_s": x}
+#   {"event": "done", "game": ..., "mixed": n, "skipped": n, "failed": n, "seconds": x}
+# Packs (see mod_pack.py) are built from a playlist, and applied the same way as a playlist, after checking their hashes.
+# Delta patches (see bin_patch.py) hold just the bytes a remix changed, and are built from an install that's already been remixed.
+#
+# Exit codes:
+EXIT_OK = 0
+EXIT_FAILED = 1 # Some tracks (or files, for restore) failed
+EXIT_USAGE = 2 # Bad arguments or playlist
+EXIT_NO_GAME = 3 # No supported game in a given install dir
+EXIT_CANCELLED = 130 # Ctrl+C
+# -----
+
+# Standard Modules
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+
+# MushiMix Modules
+import cave_bin
+import cave_extract
+import mod_pack
+import bin_patch
+import wav_format
+import mushimix_core
+from mushimix_core import MixCancelled
+
+PROGRESS_INTERVAL = 0.25 # seconds between progress events
+
+
+class UsageError(Exception):
+    pass
+
+
+# Reporter - Prints events, either as JSON lines or as plain text
+class Reporter:
+    def __init__(self, as_json, stream=None):
+        self.as_json = as_json
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def event(self, event_name, text=None, **fields):
+        with self._lock:
+            if self.as_json:
+                fields = dict({"event": event_name}, **fields)
+                self.stream.write(json.dumps(fields, ensure_ascii=False) + "\n")
+            elif text != None:
+                self.stream.write(text + "\n")
+            self.stream.flush()
+
+
+# Reads a playlist file. Returns (install dirs, {"tracks": {...}, "mushi": {...}, "dfk": {...}, "cave": {...}}) with WAV paths made absolute.
+def loadPlaylist(path):
+    try:
+        with open(path, 'r', encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise UsageError("Can't read playlist " + path + ": " + str(e))
+    if not isinstance(data, dict):
+        raise UsageError("Playlist " + path + " must be a JSON object")
+
+    sections = ("tracks", "mushi", "dfk", "cave")
+    if not any(key in data for key in sections + ("games",)):
+        data = {"tracks": data} # Just the mapping
+
+    base = os.path.dirname(os.path.abspath(path))
+    playlist = {}
+    for section in sections:
+        tracks = data.get(section, {})
+        if not isinstance(tracks, dict):
+            raise UsageError("\"" + section + "\" in " + path + " must be an object of entry: wav")
+        playlist[section] = {}
+        for key, value in tracks.items():
+            if isinstance(value, dict):
+                if "wav" not in value:
+                    raise UsageError("Track " + repr(key) + " in " + path + " has no \"wav\"")
+                value = dict(value, wav=_absolute(base, value["wav"]))
+            elif isinstance(value, str):
+                value = _absolute(base, value)
+            else:
+                raise UsageError("Track " + repr(key) + " in " + path + " must be a path or an object")
+            playlist[section][key] = value
+
+    games = data.get("games", [])
+    if isinstance(games, str):
+        games = [games]
+    return [_absolute(base, game) for game in games], playlist
+
+
+def _absolute(base, path):
+    path = os.path.expandvars(os.path.expanduser(path))
+    return os.path.normpath(os.path.join(base, path))
+
+
+# The selections for one install: the shared tracks, with the game's own section on top
+def selectionsFor(game, playlist):
+    selections = dict(playlist["tracks"])
+    selections.update(playlist.get(game, {}))
+    return selections
+
+
+def makeCore(game_dir, args):
+    return mushimix_core.MushiMixCore(
+        game_dir,
+        out_dir=getattr(args, "manual", None) or "./out",
+        safe_mode=bool(getattr(args, "manual", None)),
+        backup_mode=not getattr(args, "no_backup", False),
+        threads=args.jobs,
+        incremental=not getattr(args, "force", False),
+        normalize=not getattr(args, "no_convert", False),
+        match_loudness=not getattr(args, "no_loudness", False),
+        extend=getattr(args, "extend", None),
+        )
+
+
+# Describes what will be done to a track's WAV, for --dry-run
+def describeSource(source):
+    info = {"bytes": source.length}
+    if isinstance(source, wav_format.ConvertedSource):
+        info["convert"] = source.out.describe()
+        if source.gain != 0.0:
+            info["gain_db"] = source.gain
+        if source.loop != None:
+            info["seconds"] = round(source.out_frames / source.out.sample_rate, 2)
+    return info
+
+
+# --- Commands ---
+
+# Mixes into one install. selections(core) gives what to mix, and can raise mod_pack.PackError.
+def mixGame(game_dir, selections, args, report):
+    core = makeCore(game_dir, args)
+    if not core.game:
+        report.event("error", "ERRUR: No supported game found in " + game_dir, game=game_dir, error="no supported game")
+        return EXIT_NO_GAME
+
+    try:
+        selections = selections(core)
+    except mod_pack.PackError as e:
+        report.event("error", "ERRUR: " + str(e), game=game_dir, error=str(e))
+        return EXIT_FAILED
+    report.event("start", ":: " + game_dir + " (" + core.game + "), " + str(len(selections)) + " track(s)", game=game_dir, kind=core.game, tracks=len(selections), dry_run=args.dry_run)
+    if not selections:
+        report.event("done", "Nothing to mix", game=game_dir, mixed=0, skipped=0, failed=0, seconds=0.0)
+        return EXIT_OK
+
+    if args.dry_run:
+        return planGame(core, game_dir, selections, report)
+
+    start = time.perf_counter()
+    progress = {"done": 0, "mixed": 0, "bytes": 0, "last": 0.0}
+
+    def emitProgress():
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        report.event("progress", None, game=game_dir, done=progress["done"], tracks=len(selections), bytes=progress["bytes"], mb_per_s=round(progress["bytes"] / elapsed / 1048576, 2))
+
+    def wrote(n):
+        progress["bytes"] += n
+        now = time.perf_counter()
+        if now - progress["last"] > PROGRESS_INTERVAL:
+            progress["last"] = now
+            emitProgress()
+
+    def taskDone(task, error):
+        progress["done"] += 1
+        if error != None:
+            reported.add(task.entry)
+            report.event("track", "  FAILED  " + task.entry + ": " + str(error), game=game_dir, entry=task.entry, status="failed", error=str(error))
+        elif task.entry in core.skipped:
+            report.event("track", "  skipped " + task.entry + " (up to date)", game=game_dir, entry=task.entry, status="skipped")
+        else:
+            progress["mixed"] += 1
+            report.event("track", "  mixed   " + task.entry, game=game_dir, entry=task.entry, status="mixed", bin=task.outpath)
+        emitProgress()
+
+    # Mixed on a worker thread, so Ctrl+C can cancel it cleanly instead of killing it half way
+    cancelled = threading.Event()
+    reported = set()
+    result = {}
+
+    def run():
+        try:
+            core.mix(selections, wrote, taskDone, cancelled)
+        except BaseException as e:
+            result["error"] = e
+
+    worker = threading.Thread(target=run, name="mushimix-cli")
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.2)
+    except KeyboardInterrupt:
+        cancelled.set()
+        worker.join()
+
+    # Tracks rejected before mixing (bad WAVs, unknown entries) never reach taskDone
+    for key, e in core.errors:
+        if key not in reported:
+            report.event("track", "  FAILED  " + str(key) + ": " + str(e), game=game_dir, entry=key, status="failed", error=str(e))
+
+    seconds = round(time.perf_counter() - start, 3)
+    mixed = progress["mixed"]
+    failed = len(core.errors)
+    if isinstance(result.get("error"), MixCancelled):
+        report.event("done", "Cancelled!", game=game_dir, cancelled=True, mixed=mixed, skipped=len(core.skipped), failed=failed, seconds=seconds)
+        return EXIT_CANCELLED
+    if "error" in result:
+        report.event("error", "ERRUR: " + str(result["error"]), game=game_dir, error=str(result["error"]))
+        return EXIT_FAILED
+
+    snapshot = core.snapshot.name if core.snapshot != None and core.backup_list else None
+    report.event("done", "Done! " + str(mixed) + " mixed, " + str(len(core.skipped)) + " skipped, " + str(failed) + " failed in " + str(seconds) + "s",
+                 game=game_dir, mixed=mixed, skipped=len(core.skipped), failed=failed, seconds=seconds, snapshot=snapshot)
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def planGame(core, game_dir, selections, report):
+    tasks = core.plan(selections)
+    for entry in core.skipped:
+        report.event("track", "  skip    " + entry + " (up to date)", game=game_dir, entry=entry, status="skipped")
+    for task in tasks:
+        info = describeSource(task.replacements[cave_bin.MUSIC_ENTRY])
+        text = "  mix     " + task.entry + " -> " + task.outpath
+        if "convert" in info:
+            text += " (" + ", ".join(str(key) + " " + str(value) for key, value in info.items() if key != "bytes") + ")"
+        report.event("track", text, game=game_dir, entry=task.entry, status="planned", bin=task.outpath, **info)
+    for key, e in core.errors:
+        report.event("track", "  FAILED  " + str(key) + ": " + str(e), game=game_dir, entry=key, status="failed", error=str(e))
+    report.event("done", "Dry run: " + str(len(tasks)) + " to mix, " + str(len(core.skipped)) + " up to date, " + str(len(core.errors)) + " failed",
+                 game=game_dir, dry_run=True, mixed=len(tasks), skipped=len(core.skipped), failed=len(core.errors), seconds=0.0)
+    return EXIT_FAILED if core.errors else EXIT_OK
+
+
+def commandMix(args, report):
+    games, playlist = loadPlaylist(args.playlist)
+    games += args.game or []
+    if not games:
+        raise UsageError("No install given, use --game or \"games\" in the playlist")
+
+    code = EXIT_OK
+    for game_dir in games:
+        result = mixGame(game_dir, lambda core: selectionsFor(core.game, playlist), args, report)
+        if result == EXIT_CANCELLED:
+            return result
+        code = max(code, result)
+    return code
+
+
+def commandPack(args, report):
+    games, playlist = loadPlaylist(args.playlist)
+    games = (args.game or []) + games
+    if not games:
+        raise UsageError("Packs are built against an install, use --game or \"games\" in the playlist")
+
+    core = makeCore(games[0], args)
+    if not core.game:
+        report.event("error", "ERRUR: No supported game found in " + games[0], game=games[0], error="no supported game")
+        return EXIT_NO_GAME
+    selections = selectionsFor(core.game, playlist)
+    report.event("start", ":: Packing " + str(len(selections)) + " track(s) for " + core.game, game=games[0], kind=core.game, tracks=len(selections))
+
+    start = time.perf_counter()
+    try:
+        pack = mod_pack.buildPack(core, selections, args.output, args.name or os.path.splitext(os.path.basename(args.output))[0], args.author or "", args.description or "")
+    except (mod_pack.PackError, OSError) as e:
+        report.event("error", "ERRUR: " + str(e), game=games[0], error=str(e))
+        return EXIT_FAILED
+    report.event("done", "Done! Packed " + str(len(pack.members)) + " track(s) into " + args.output, game=games[0], pack=args.output,
+                 tracks=len(pack.members), bytes=os.path.getsize(args.output), seconds=round(time.perf_counter() - start, 3))
+    return EXIT_OK
+
+
+def commandApply(args, report):
+    try:
+        pack = mod_pack.ModPack(args.pack)
+    except mod_pack.PackError as e:
+        raise UsageError(str(e))
+
+    # Checked once up front, rather than once per install
+    start = time.perf_counter()
+    report.event("verify", ":: Verifying " + os.path.basename(args.pack) + " (" + str(len(pack.members)) + " track(s))", pack=args.pack, tracks=len(pack.members))
+    try:
+        pack.verify()
+    except (mod_pack.PackError, OSError) as e:
+        report.event("error", "ERRUR: " + str(e), pack=args.pack, error=str(e))
+        return EXIT_FAILED
+    report.event("verified", None, pack=args.pack, seconds=round(time.perf_counter() - start, 3))
+
+    def selections(core):
+        if pack.game and pack.game != core.game:
+            raise mod_pack.PackError(os.path.basename(args.pack) + " is for " + repr(pack.game) + ", not " + repr(core.game))
+        return pack.selections()
+
+    code = EXIT_OK
+    for game_dir in args.game:
+        result = mixGame(game_dir, selections, args, report)
+        if result == EXIT_CANCELLED:
+            return result
+        code = max(code, result)
+    return code
+
+
+def commandDiff(args, report):
+    game_dir = args.game[0]
+    core = mushimix_core.MushiMixCore(game_dir)
+    if not core.game:
+        report.event("error", "ERRUR: No supported game found in " + game_dir, game=game_dir, error="no supported game")
+        return EXIT_NO_GAME
+
+    start = time.perf_counter()
+    try:
+        patch = bin_patch.buildPatch(core, args.output, args.modded, args.name or os.path.splitext(os.path.basename(args.output))[0], args.author or "", args.description or "")
+    except (mod_pack.PackError, cave_bin.CaveBinError, OSError) as e:
+        report.event("error", "ERRUR: " + str(e), game=game_dir, error=str(e))
+        return EXIT_FAILED
+    for patch_file in patch.files.values():
+        report.event("file", "  " + patch_file.relpath + ": " + str(patch_file.length) + " of " + str(patch_file.size) + " bytes", game=game_dir,
+                     file=patch_file.relpath, size=patch_file.size, delta=patch_file.length)
+    report.event("done", "Done! Wrote " + args.output + " (" + str(len(patch.files)) + " file(s), " + str(os.path.getsize(args.output)) + " bytes)", game=game_dir,
+                 patch=args.output, files=len(patch.files), bytes=os.path.getsize(args.output), seconds=round(time.perf_counter() - start, 3))
+    return EXIT_OK
+
+
+def commandPatch(args, report):
+    code = EXIT_OK
+    for game_dir in args.game:
+        core = makeCore(game_dir, args)
+        if not core.game:
+            report.event("error", "ERRUR: No supported game found in " + game_dir, game=game_dir, error="no supported game")
+            code = EXIT_NO_GAME
+            continue
+
+        def fileDone(relpath, patched):
+            if patched:
+                report.event("file", "  patched  " + relpath, game=game_dir, file=relpath, status="patched")
+
+        start = time.perf_counter()
+        try:
+            patched, unchanged, errors = core.applyPatch(args.patch, fileDone)
+        except (mod_pack.PackError, OSError) as e:
+            report.event("error", "ERRUR: " + str(e), game=game_dir, error=str(e))
+            code = max(code, EXIT_FAILED)
+            continue
+        for relpath, e in errors:
+            report.event("file", "  FAILED   " + relpath + ": " + str(e), game=game_dir, file=relpath, status="failed", error=str(e))
+        report.event("done", "Done! " + str(len(patched)) + " patched, " + str(len(unchanged)) + " already matched, " + str(len(errors)) + " failed",
+                     game=game_dir, patched=len(patched), unchanged=len(unchanged), failed=len(errors), seconds=round(time.perf_counter() - start, 3))
+        if errors:
+            code = max(code, EXIT_FAILED)
+    return code
+
+
+def commandExtract(args, report):
+    code = EXIT_OK
+    for game_dir in args.game:
+        core = mushimix_core.MushiMixCore(game_dir, threads=args.jobs)
+        if not core.game:
+            report.event("error", "ERRUR: No supported game found in " + game_dir, game=game_dir, error="no supported game")
+            code = EXIT_NO_GAME
+            continue
+        out_dir = args.output if len(args.game) == 1 else args.output + "/" + os.path.basename(core.game_dir)
+
+        def binDone(relpath, results, error):
+            if error != None:
+                report.event("file", "  FAILED   " + relpath + ": " + str(error), game=game_dir, file=relpath, status="failed", error=str(error))
+            elif results:
+                report.event("file", "  " + relpath + ": " + str(len(results)) + " file(s)", game=game_dir, file=relpath, status="extracted", files=len(results))
+
+        start = time.perf_counter()
+        extracted, skipped, size, errors = core.extract(out_dir, tuple(args.kind or cave_extract.KINDS), args.vanilla, args.overwrite, binDone)
+        seconds = round(time.perf_counter() - start, 3)
+        report.event("done", "Done! " + str(extracted) + " file(s) extracted (" + str(size // 1048576) + " MB), " + str(skipped) + " already there, " + str(len(errors)) + " failed in " + str(seconds) + "s",
+                     game=game_dir, output=out_dir, extracted=extracted, skipped=skipped, bytes=size, failed=len(errors), seconds=seconds)
+        if errors:
+            code = max(code, EXIT_FAILED)
+    return code
+
+
+def commandBackups(args, report):
+    code = EXIT_OK
+    for game_dir in args.game or []:
+        core = mushimix_core.MushiMixCore(game_dir)
+        if not core.game:
+            report.event("error", "ERRUR: No supported game found in " + game_dir, game=game_dir, error="no supported game")
+            code = EXIT_NO_GAME
+            continue
+        report.event("snapshot", game_dir + "\nvanilla", game=game_dir, name="vanilla")
+        for snapshot in core.snapshots():
+            report.event("snapshot", snapshot.name + "\t" + snapshot.created + "\t" + str(len(snapshot.files)) + " files",
+                         game=game_dir, name=snapshot.name, created=snapshot.created, files=len(snapshot.files))
+    return code
+
+
+def commandRestore(args, report):
+    code = EXIT_OK
+    for game_dir in args.game or []:
+        core = mushimix_core.MushiMixCore(game_dir, threads=args.jobs)
+        if not core.game:
+            report.event("error", "ERRUR: No supported game found in " + game_dir, game=game_dir, error="no supported game")
+            code = EXIT_NO_GAME
+            continue
+
+        def fileDone(relpath, restored):
+            if restored:
+                report.event("file", "  restored " + relpath, game=game_dir, file=relpath, status="restored")
+
+        try:
+            restored, unchanged, errors = core.restore(args.name, fileDone)
+        except Exception as e:
+            report.event("error", "ERRUR: " + str(e), game=game_dir, error=str(e))
+            code = EXIT_FAILED
+            continue
+        for relpath, e in errors:
+            report.event("file", "  FAILED   " + relpath + ": " + str(e), game=game_dir, file=relpath, status="failed", error=str(e))
+        report.event("done", "Done! " + str(len(restored)) + " restored, " + str(len(unchanged)) + " already matched, " + str(len(errors)) + " failed",
+                     game=game_dir, restored=len(restored), unchanged=len(unchanged), failed=len(errors))
+        if errors:
+            code = max(code, EXIT_FAILED)
+    return code
+
+
+# --- Arguments ---
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog="mushimix_cli.py", description="Headless MushiMix: remix CAVE Steam ports from a playlist.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def common(sub, jobs=True):
+        sub.add_argument("--game", action="append", metavar="DIR", help="game install directory (can be given more than once)")
+        sub.add_argument("--json", action="store_true", help="write progress as JSON lines to stdout")
+        if jobs:
+            sub.add_argument("--jobs", "-j", type=int, default=mushimix_core.DEFAULT_THREADS, metavar="N", help="tracks to work on at once (default: %(default)s)")
+
+    mix = commands.add_parser("mix", help="mix a playlist into one or more installs")
+    mix.add_argument("playlist", help="playlist JSON file")
+    common(mix)
+    mix.add_argument("--dry-run", "-n", action="store_true", help="check everything and show what would be done, without writing")
+    mix.add_argument("--manual", metavar="OUT_DIR", help="write the modded BINs to OUT_DIR instead of the game (Manual Mode)")
+    mix.add_argument("--no-backup", action="store_true", help="don't back up files before overwriting them")
+    mix.add_argument("--no-convert", action="store_true", help="use WAVs as-is, without converting them to the game's format")
+    mix.add_argument("--no-loudness", action="store_true", help="don't match loudness to the vanilla tracks")
+    mix.add_argument("--extend", type=float, metavar="SECONDS", help="loop WAVs with loop points out to at least this long")
+    mix.add_argument("--force", action="store_true", help="remix tracks even if they are already up to date")
+
+    pack = commands.add_parser("pack", help="build a mod pack from a playlist")
+    pack.add_argument("playlist", help="playlist JSON file")
+    pack.add_argument("--output", "-o", required=True, metavar="PACK", help="pack file to write (" + mod_pack.PACK_EXTENSION + ")")
+    common(pack)
+    pack.add_argument("--name", help="pack name (default: the file name)")
+    pack.add_argument("--author", help="pack author")
+    pack.add_argument("--description", help="pack description")
+    pack.add_argument("--no-convert", action="store_true", help="pack WAVs as-is, without converting them to the game's format")
+    pack.add_argument("--no-loudness", action="store_true", help="don't match loudness to the vanilla tracks")
+    pack.add_argument("--extend", type=float, metavar="SECONDS", help="loop WAVs with loop points out to at least this long")
+
+    apply = commands.add_parser("apply", help="apply a mod pack to one or more installs")
+    apply.add_argument("pack", help="pack file")
+    common(apply)
+    apply.add_argument("--dry-run", "-n", action="store_true", help="verify the pack and show what would be done, without writing")
+    apply.add_argument("--manual", metavar="OUT_DIR", help="write the modded BINs to OUT_DIR instead of the game (Manual Mode)")
+    apply.add_argument("--no-backup", action="store_true", help="don't back up files before overwriting them")
+    apply.add_argument("--force", action="store_true", help="rewrite tracks even if they are already up to date")
+
+    diff = commands.add_parser("diff", help="make a delta patch of every BIN that differs from vanilla")
+    diff.add_argument("--output", "-o", required=True, metavar="PATCH", help="patch file to write (" + bin_patch.PATCH_EXTENSION + ")")
+    common(diff, jobs=False)
+    diff.add_argument("--modded", metavar="OUT_DIR", help="read the modded BINs from a Manual Mode folder instead of the install")
+    diff.add_argument("--name", help="patch name (default: the file name)")
+    diff.add_argument("--author", help="patch author")
+    diff.add_argument("--description", help="patch description")
+
+    patch = commands.add_parser("patch", help="apply a delta patch to one or more installs")
+    patch.add_argument("patch", help="patch file")
+    common(patch)
+    patch.add_argument("--manual", metavar="OUT_DIR", help="write the patched BINs to OUT_DIR instead of the game (Manual Mode)")
+    patch.add_argument("--no-backup", action="store_true", help="don't back up files before overwriting them")
+
+    extract = commands.add_parser("extract", help="export the WAVs and TGAs in every BIN as standalone files")
+    extract.add_argument("--output", "-o", required=True, metavar="OUT_DIR", help="folder to export into (one subfolder per install if there's more than one)")
+    common(extract)
+    extract.add_argument("--kind", action="append", choices=cave_extract.KINDS, help="only export this kind of file (can be given more than once)")
+    extract.add_argument("--vanilla", action="store_true", help="export the original files from the backups, for BINs that have been modded")
+    extract.add_argument("--overwrite", action="store_true", help="export files again even if they're already there")
+
+    backups = commands.add_parser("backups", help="list backup snapshots")
+    common(backups, jobs=False)
+
+    restore = commands.add_parser("restore", help="roll an install back to vanilla, or to before a snapshot")
+    restore.add_argument("name", nargs="?", default="vanilla", help="snapshot name (default: vanilla)")
+    common(restore)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "jobs", 1) < 1:
+        parser.error("--jobs must be at least 1")
+    if args.command not in ("mix", "pack") and not args.game:
+        parser.error("--game is required")
+    return args
+
+
+def main(argv=None):
+    try:
+        args = parseArgs(sys.argv[1:] if argv == None else argv)
+    except SystemExit as e:
+        return EXIT_OK if e.code == 0 else EXIT_USAGE
+
+    report = Reporter(args.json)
+    # Keep stdout clean for the JSON lines, the core's log goes to stderr instead
+    log = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    with log:
+        try:
+            if args.command == "mix":
+                return commandMix(args, report)
+            if args.command == "pack":
+                return commandPack(args, report)
+            if args.command == "apply":
+                return commandApply(args, report)
+            if args.command == "diff":
+                return commandDiff(args, report)
+            if args.command == "patch":
+                return commandPatch(args, report)
+            if args.command == "extract":
+                return commandExtract(args, report)
+            if args.command == "backups":
+                return commandBackups(args, report)
+            return commandRestore(args, report)
+        except UsageError as e:
+            report.event("error", "ERRUR: " + str(e), error=str(e))
+            return EXIT_USAGE
+        except KeyboardInterrupt:
+            return EXIT_CANCELLED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,604 @@
+# MushiMix - Headless Core
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Everything needed to remix a game without the GUI: game detection, path resolution, backups and mixing.
+# Only the standard library and other MushiMix modules are used here, so scripts and the CLI can import this
+# without paying for PySide6 and a QApplication, and it works on a machine with no display.
+#
+# Usage:
+#   core = MushiMixCore("/path/to/steamapps/common/Mushihimesama")
+#   core.mix({"Stage 1": "/path/to/my_stage_1.wav", "m06.bin": "/path/to/stage_2.wav"})
+# -----
+
+# Standard Modules
+import os
+import shutil
+import datetime
+import contextlib
+
+# MushiMix Modules
+import cave_bin
+import mix_engine
+import mix_state
+import backup_store
+import wav_format
+import wav_resample
+import wav_loudness
+import mod_pack
+import bin_patch
+import cave_index
+import track_table
+import cave_extract
+from mix_engine import MixCancelled, DEFAULT_THREADS
+
+# Where each game keeps its OST, relative to the install dir
+DFK_PATHS = {
+    "1.5":  "/res/DISKDATA/F/",
+    "BL":   "/res_BL/DISKDATA/F/",
+    }
+MUSHI_PATH = "/res/DISKDATA/B/"
+
+# CaveData - Names for the in-game OST files of the games MushiMix knows. Which of them an install actually has
+# (and the tracks of games without names here) is worked out from the BINs themselves, see track_table.py.
+# Modding Sound Effects is currently unsupported.
+class CaveData:
+    def __init__(self):
+        self.mushi_files = {
+            "Main Menu": "mme.bin",
+            # "Sound Effects": "ms.bin"
+            # "Voice Lines": "mv.bin"
+
+            "Shot Select":"m01.bin",
+            "Stage 1":"m05.bin",
+            "Stage 2":"m06.bin",
+            "Stage 3":"m09.bin",
+            "Stage 4":"m10.bin",
+            "Stage 5":"m11.bin",
+            "Stage Clear":"m02.bin",
+            "Boss 1":"m07.bin",
+            "Boss 2":"m12.bin",
+            "TLB Final":"m13.bin",
+            "Ending":"m08.bin",
+            "Name Entry":"m04.bin",
+            "Game Over":"m03.bin",
+
+            "(1.5) Shot Select":"mu01.bin",
+            "(1.5) Stage 1":"mu05.bin",
+            "(1.5) Stage 2":"mu06.bin",
+            "(1.5) Stage 3":"mu09.bin",
+            "(1.5) Stage 4":"mu10.bin",
+            "(1.5) Stage 5":"mu11.bin",
+            "(1.5) Stage Clear":"mu02.bin",
+            "(1.5) Boss 1":"mu07.bin",
+            "(1.5) Boss 2":"mu12.bin",
+            "(1.5) TLB Final":"mu13.bin",
+            "(1.5) Ending":"mu08.bin",
+            "(1.5) Name Entry":"mu04.bin",
+            "(1.5) Game Over":"mu03.bin",
+
+            "(Arrange) Shot Select":"ma01.bin",
+            "(Arrange) Stage 1":"ma05.bin",
+            "(Arrange) Stage 2":"ma06.bin",
+            "(Arrange) Stage 3":"ma09.bin",
+            "(Arrange) Stage 4":"ma10.bin",
+            "(Arrange) Stage 5":"ma11.bin",
+            "(Arrange) Stage Clear":"ma02.bin",
+            "(Arrange) Boss 1":"ma07.bin",
+            "(Arrange) Boss 2":"ma12.bin",
+            "(Arrange) TLB Final":"ma13.bin",
+            "(Arrange) Ending":"ma08.bin",
+            "(Arrange) Name Entry":"ma04.bin",
+            "(Arrange) Game Over":"ma03.bin",
+            }
+
+        self.dfk_files = {
+            "Main Menu": "mm.bin",
+            # "Sound Effects": "msoe.bin"
+            # "Voice Lines": "msv.bin"
+
+            "Shot Select":"m01.bin",
+            "Stage 1":"m02.bin",
+            "Stage 2-A":"m07a.bin",
+            "Stage 2-B":"m07b.bin",
+            "Stage 3-A":"m08a.bin",
+            "Stage 3-B":"m08b.bin",
+            "Stage 4-A":"m09a.bin",
+            "Stage 4-B":"m09b.bin",
+            "Stage 5":"m10.bin",
+            "Stage Clear":"m04.bin",
+            "Boss 1":"m03.bin",
+            "Boss 2":"m06.bin",
+            "EX Boss":"m11.bin",
+            "TLB Hibachi":"m12.bin",
+            "Ending":"m13.bin",
+            "Name Entry":"m05.bin",
+
+            "(BL) Shot Select":"mb01.bin",
+            "(BL) Stage 1":"mb02.bin",
+            "(BL) Stage 2-A":"mb07a.bin",
+            "(BL) Stage 2-B":"mb07b.bin",
+            "(BL) Stage 3-A":"mb08a.bin",
+            "(BL) Stage 3-B":"mb08b.bin",
+            "(BL) Stage 4-A":"mb09a.bin",
+            "(BL) Stage 4-B":"mb09b.bin",
+            "(BL) Stage 5":"mb10.bin",
+            "(BL) Stage Clear":"mb04.bin",
+            "(BL) Boss 1":"mb03.bin",
+            "(BL) Boss 2":"mb06.bin",
+            "(BL) EX Boss":"mb11.bin",
+            "(BL) TLB Hibachi":"mb12.bin",
+            "(BL) Secret Zatsuza":"mb14.bin",
+            "(BL) Ending":"mb13.bin",
+            "(BL) Name Entry":"mb05.bin",
+
+            "(BL Arrange) Shot Select":"mk01.bin",
+            "(BL Arrange) Stage 1":"mk02.bin",
+            "(BL Arrange) Stage 2-A":"mk07a.bin",
+            "(BL Arrange) Stage 2-B":"mk07b.bin",
+            "(BL Arrange) Stage 3-A":"mk08a.bin",
+            "(BL Arrange) Stage 3-B":"mk08b.bin",
+            "(BL Arrange) Stage 4-A":"mk09a.bin",
+            "(BL Arrange) Stage 4-B":"mk09b.bin",
+            "(BL Arrange) Stage 5":"mk10.bin",
+            "(BL Arrange) Stage Clear":"mk04.bin",
+            "(BL Arrange) Boss 1":"mk03.bin",
+            "(BL Arrange) Boss 2":"mk06.bin",
+            "(BL Arrange) EX Boss":"mk11.bin",
+            "(BL Arrange) TLB Hivac":"mk12.bin",
+            "(BL Arrange) Secret":"mk14.bin",
+            "(BL Arrange) Ending":"mb13.bin",
+            "(BL Arrange) Name Entry":"mk05.bin",
+            }
+
+_CAVE_DATA = CaveData()
+
+
+# {game: {entry: relpath}} of the tracks MushiMix has names for, for track_table.discover()
+def knownTracks():
+    known = {}
+    for game in ("mushi", "dfk"):
+        known[game] = {entry: diskdataPath(game, entry) + bin_name for entry, bin_name in gameFiles(game).items()}
+    return known
+
+
+# Works out which game is installed in game_dir from what's in its DISKDATA folders, and its track table.
+# Returns (game, {entry: relpath}), game being "mushi", "dfk", "cave" (a CAVE port without names) or "" if unsupported.
+# See track_table.py. Cached in backup_dir (default <game_dir>/mushimix-bk), if it exists.
+def discoverTracks(game_dir, backup_dir=None):
+    return track_table.discover(game_dir, knownTracks(), backup_dir)
+
+
+# Works out which game is installed in game_dir. Returns "mushi", "dfk", "cave", or "" if unsupported.
+def detectGame(game_dir):
+    return discoverTracks(game_dir)[0]
+
+
+# WAV path of a selection, which is either the path itself or a dict with it under "wav".
+# For a track from a mod pack (a mod_pack.PackMember), it's the pack.
+def _selectionPath(value):
+    if isinstance(value, dict):
+        return value["wav"]
+    if isinstance(value, mod_pack.PackMember):
+        return value.path
+    return value
+
+
+# Entry -> BIN filename dictionary of the names MushiMix knows for a game. What's actually installed is found by discoverTracks().
+def gameFiles(game):
+    if game == "mushi":
+        return _CAVE_DATA.mushi_files
+    if game == "dfk":
+        return _CAVE_DATA.dfk_files
+    return {}
+
+
+# DISKDATA folder of an entry, relative to the install dir
+def diskdataPath(game, entry):
+    if game == "mushi":
+        return MUSHI_PATH
+    if game == "dfk":
+        if entry[:3] == "(BL":
+            return DFK_PATHS["BL"]
+        return DFK_PATHS["1.5"]
+    raise ValueError("Unsupported game: " + repr(game))
+
+
+# MushiMixCore - One game install, and the settings to mix it with.
+#   safe_mode:   Manual Mode, write to out_dir instead of the game files
+#   backup_mode: back up files into <game_dir>/mushimix-bk before modifying them (see backup_store.py)
+#   incremental: skip tracks whose BIN already matches what would be written (see mix_state.py)
+#   normalize:   convert (and resample) custom WAVs to the format of the track they replace (see wav_format.py, wav_resample.py)
+#   match_loudness: turn custom WAVs up or down to the loudness of the track they replace (see wav_loudness.py)
+#   extend:      loop custom WAVs that have loop points out to at least this many seconds (see wav_loop.py), None for off
+class MushiMixCore:
+    def __init__(self, game_dir, out_dir="./out", safe_mode=False, backup_mode=True, threads=DEFAULT_THREADS, incremental=True, normalize=True, match_loudness=True, extend=None):
+        self.game_dir = game_dir.rstrip("/\\")
+        self.backup_dir = self.game_dir + "/mushimix-bk"
+        self.game, self.tracks = discoverTracks(self.game_dir, self.backup_dir) # tracks: {entry: relpath}
+        self.game_files = {entry: os.path.basename(relpath) for entry, relpath in self.tracks.items()}
+
+        self.out_dir = out_dir
+        self.safe_mode = safe_mode
+        self.backup_mode = backup_mode
+        self.threads = threads
+        self.incremental = incremental
+        self.normalize = normalize
+        self.match_loudness = match_loudness
+        self.extend = extend
+        self.state = None
+        self.store = backup_store.BackupStore(self.backup_dir, self.game_dir)
+        self.snapshot = None
+        self.render_pool = None
+        self.render_dir = self.backup_dir + "/render" # Resampled WAVs are rendered here, and removed once the BINs are written
+
+        # Results of the last mix()
+        self.backup_list = []
+        self.errors = []
+        self.skipped = []
+
+    # Accepts an entry name ("Stage 1") or its BIN filename ("m05.bin"), returns the entry name
+    def resolveEntry(self, key):
+        if key in self.game_files:
+            return key
+        for entry, bin_name in self.game_files.items():
+            if bin_name == key:
+                return entry
+        raise KeyError("No " + (self.game or "supported game") + " entry for " + repr(key))
+
+    # Path of an entry's BIN, relative to the install dir ("/res/DISKDATA/B/m05.bin"), as used for backups
+    def relPath(self, entry):
+        return self.tracks[entry]
+
+    def binPath(self, entry):
+        return self.game_dir + self.relPath(entry)
+
+    def outPath(self, entry):
+        if self.safe_mode == True:
+            return self.out_dir + "/" + self.game_files[entry]
+        return self.binPath(entry)
+
+    # Catalog of every BIN in the install and what's in them (see cave_index.py), brought up to date first.
+    # Only BINs that changed since the last call are read. Close it when done.
+    def catalog(self):
+        index = cave_index.CaveIndex(self.game_dir, self.backup_dir + "/" + cave_index.INDEX_FILE)
+        index.scan(self.threads)
+        return index
+
+    # Exports the WAVs (and TGAs, if in kinds) in every BIN of the install into out_dir, see cave_extract.py.
+    # Only BINs the catalog says hold something of those kinds are opened, so image banks are passed over for "wav" and so on.
+    # With vanilla, BINs that have been modded are read from their vanilla copy in the backups instead.
+    # Returns (extracted, skipped, bytes, errors) from cave_extract.extractAll().
+    def extract(self, out_dir, kinds=cave_extract.KINDS, vanilla=False, overwrite=False, bin_done=None, wrote=None):
+        with self.catalog() as index:
+            holding = set(index.holding(kinds))
+        sources = {relpath: path for relpath, path in cave_extract.installSources(self.game_dir).items() if relpath in holding}
+        if vanilla == True and os.path.isdir(self.backup_dir):
+            for relpath, info in self.store.vanilla().files.items():
+                if relpath in sources and self.store.hasObject(info["sha256"]):
+                    sources[relpath] = self.store.objectPath(info["sha256"])
+        return cave_extract.extractAll(sources, out_dir.rstrip("/\\"), self.threads, kinds, overwrite, bin_done, wrote)
+
+    # Format of the music track an entry's game expects. Read from the vanilla BIN in the backups if there is one,
+    # since the BIN in the install may have been modded by something that didn't keep the format.
+    # Returns None if the track's format can't be read, in which case the custom WAV is used as-is.
+    def targetFormat(self, entry, vanilla=None):
+        try:
+            return wav_format.binWavFormat(self.vanillaPath(entry, vanilla))
+        except (cave_bin.CaveBinError, wav_format.WavError) as e:
+            print("[WARNING]", "Can't read the format of", entry, ":", e, ": leaving the custom WAV unconverted")
+            return None
+
+    # The vanilla copy of an entry's BIN in the backups (vanilla is from BackupStore.vanilla()), or the BIN in the install
+    def vanillaPath(self, entry, vanilla=None):
+        relpath = self.relPath(entry)
+        if vanilla != None and relpath in vanilla.files:
+            object_path = self.store.objectPath(vanilla.files[relpath]["sha256"])
+            if os.path.isfile(object_path):
+                return object_path
+        return self.binPath(entry)
+
+    # {entry: gain in dB} that brings each custom WAV in `pairs` ([(entry, wav_path)]) to the loudness of the vanilla track.
+    # Measurements are cached in mushimix-bk, by file hash.
+    def loudnessGains(self, pairs, vanilla=None, save=True):
+        try:
+            wav_format._numpy()
+        except wav_format.WavError as e:
+            print("[WARNING]", e, ": not matching loudness")
+            return {}
+
+        items = []
+        for entry, wav_path in pairs:
+            items += [(wav_path, False), (self.vanillaPath(entry, vanilla), True)]
+        cache = wav_loudness.LoudnessCache(self.backup_dir + "/" + wav_loudness.CACHE_FILE)
+        results = wav_loudness.measureAll(items, cache, self._renderPool(), self.threads)
+        if save:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            cache.save()
+
+        gains = {}
+        for entry, wav_path in pairs:
+            custom = results.get((wav_path, False))
+            original = results.get((self.vanillaPath(entry, vanilla), True))
+            if custom != None and original != None:
+                gains[entry] = wav_loudness.matchGain(custom[0], custom[1], original[0])
+        return gains
+
+    # The payload for a custom WAV, checked (headers only) and converted if its format doesn't match. Raises WavError.
+    # extra is the rest of a selection given as a dict, see buildTasks(), or the mod_pack.PackMember it comes from.
+    def wavSource(self, entry, wav_path, vanilla=None, gain=0.0, extra=None):
+        if isinstance(extra, mod_pack.PackMember):
+            return extra.source(self.targetFormat(entry, vanilla) if self.normalize == True else None)
+        if self.normalize != True:
+            wav_format.parseWavFile(wav_path) # Still reject files that aren't WAVs at all
+            return cave_bin.FileSource(wav_path)
+
+        extra = extra or {}
+        return wav_format.sourceFor(wav_path, self.targetFormat(entry, vanilla), wav_resample.resampler, gain, extra.get("extend", self.extend), extra.get("loop"))
+
+    # WAVs that need resampling are rendered in the process pool, starting right away.
+    # Call it inside rendering(), which shuts the pool down and removes the rendered files once they've been used.
+    def startRender(self, entry, source):
+        if isinstance(source, wav_format.ConvertedSource) and source.info.sample_rate != source.out.sample_rate:
+            os.makedirs(self.render_dir, exist_ok=True)
+            source = wav_resample.RenderedSource(source, self.render_dir + "/" + self.game_files[entry] + ".wav", self._renderPool())
+        return source
+
+    # Processes for resampling, so it isn't held up by the GIL. Threads are used if processes aren't available.
+    def _renderPool(self):
+        if self.render_pool == None:
+            import concurrent.futures
+            import multiprocessing
+            try:
+                self.render_pool = concurrent.futures.ProcessPoolExecutor(max_workers=max(1, int(self.threads)), mp_context=multiprocessing.get_context("spawn"))
+            except (ImportError, NotImplementedError, OSError) as e:
+                print("[WARNING]", "No process pool for resampling, using threads :", e)
+                self.render_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(self.threads)), thread_name_prefix="mushimix-render")
+        return self.render_pool
+
+    # Owns the render pool's lifetime: everything started with startRender() inside it is done with (or cancelled) on the way out
+    @contextlib.contextmanager
+    def rendering(self):
+        try:
+            yield self
+        finally:
+            self._closeRenderPool()
+
+    def _closeRenderPool(self):
+        if self.render_pool != None:
+            self.render_pool.shutdown(wait=True, cancel_futures=True)
+            self.render_pool = None
+        if os.path.isdir(self.render_dir):
+            shutil.rmtree(self.render_dir, ignore_errors=True)
+
+    # selections is a plain {entry or BIN filename: custom WAV path} mapping.
+    # A value can also be a dict, to set things per track: {"wav": path, "extend": seconds, "loop": [start, end] in frames}
+    # or a mod_pack.PackMember, to stream the track out of a mod pack.
+    # Tracks that are already up to date are left out, and listed in self.skipped.
+    # WAVs that can't be used are rejected before anything is written, and listed in self.errors.
+    # With dry_run, nothing is rendered or saved, see plan().
+    def buildTasks(self, selections, dry_run=False):
+        # Entries that share a BIN (like "(BL) Ending" and "(BL Arrange) Ending") always get mixed, in order,
+        # since only the last one written is recorded
+        outpath_count = {}
+        pairs = []
+        for key, value in selections.items():
+            wav_path = _selectionPath(value)
+            try:
+                entry = self.resolveEntry(key)
+                outpath = self.outPath(entry)
+                outpath_count[outpath] = outpath_count.get(outpath, 0) + 1
+                if not isinstance(value, mod_pack.PackMember): # Packs are loudness matched when they're built
+                    pairs.append((entry, wav_path))
+            except KeyError:
+                pass
+
+        vanilla = None
+        if self.normalize == True and os.path.isdir(self.backup_dir):
+            vanilla = self.store.vanilla()
+
+        gains = {}
+        if self.normalize == True and self.match_loudness == True and pairs:
+            gains = self.loudnessGains(pairs, vanilla, save=not dry_run)
+
+        tasks = []
+        for key, value in selections.items():
+            wav_path = _selectionPath(value)
+            try:
+                entry = self.resolveEntry(key)
+                bin_path = self.binPath(entry)
+                outpath = self.outPath(entry)
+                gain = gains.get(entry, 0.0)
+                source = self.wavSource(entry, wav_path, vanilla, gain, value if not isinstance(value, str) else None)
+                options = {"replace": cave_bin.MUSIC_ENTRY}
+                if isinstance(value, mod_pack.PackMember):
+                    options["pack"] = value.sha256
+                if gain != 0.0:
+                    options["gain"] = gain
+                if isinstance(source, wav_format.ConvertedSource):
+                    options["convert"] = source.out.describe()
+                    if source.loop != None:
+                        options["loop"] = list(source.loop.toTuple()[:5])
+
+                if self.state != None and outpath_count[outpath] == 1 and self.state.isUpToDate(outpath, wav_path, bin_path, options):
+                    self.skipped.append(entry)
+                    continue
+                if not dry_run:
+                    source = self.startRender(entry, source)
+
+                # Rebuild the BIN with the custom WAV in place of the music track.
+                # The cave_header and ifd offsets/lengths are recalculated, and everything else (like the menu Sound Effects) is copied as-is.
+                # The custom WAV is streamed, so it is never fully loaded in memory, and converted on the way if needed.
+                # The BIN's current contents go into this run's backup snapshot, before it is overwritten
+                backup = None
+                if self.backup_mode == True:
+                    backup = self._backer(self.relPath(entry))
+
+                after = None
+                if self.state != None:
+                    after = self._recorder(wav_path, options)
+
+                replacements = {cave_bin.MUSIC_ENTRY: source}
+                tasks.append(mix_engine.MixTask(entry, bin_path, outpath, replacements, backup, self.relPath(entry), after))
+            except Exception as e:
+                print("[ERRUR]", e, ": in MushiMixCore.buildTasks()")
+                self.errors.append((key, e))
+        return tasks
+
+    def _backer(self, relpath):
+        def backup(task):
+            if self.snapshot == None or relpath in self.snapshot.files:
+                return False
+            self.store.add(self.snapshot, relpath)
+            self.store.writeManifest(self.snapshot)
+            return True
+        return backup
+
+    def _recorder(self, wav_path, options):
+        def after(task):
+            self.state.record(task.outpath, wav_path, task.bin_path, options)
+        return after
+
+    # What mix() would do with these selections, without writing anything: the MixTasks that would run.
+    # Fills in self.skipped and self.errors the same way. Custom WAVs are still read, to measure their loudness.
+    def plan(self, selections):
+        if not self.game:
+            raise ValueError("No supported game found in " + repr(self.game_dir))
+        self.errors = []
+        self.skipped = []
+        self.state = None
+        if self.incremental:
+            self.state = mix_state.MixState(self.backup_dir + "/" + mix_state.STATE_FILE)
+        with self.rendering():
+            return self.buildTasks(selections, dry_run=True)
+
+    # Mixes every selection into the game (or out_dir in Manual Mode).
+    # wrote, task_done and cancelled are passed through to MixEngine.run().
+    # Returns (backup_list, errors). Raises MixCancelled if cancelled, after saving the backup snapshot of whatever was done.
+    def mix(self, selections, wrote=None, task_done=None, cancelled=None):
+        if not self.game:
+            raise ValueError("No supported game found in " + repr(self.game_dir))
+
+        start_time = datetime.datetime.now()
+        self.backup_list = []
+        self.errors = []
+        self.skipped = []
+
+        if self.safe_mode == True:
+            if not os.path.isdir(self.out_dir):
+                os.makedirs(self.out_dir)
+                print("[INFO]", ": Created Manual Mode Directory")
+
+        self.snapshot = None
+        if self.backup_mode == True:
+            if not os.path.isdir(self.backup_dir):
+                os.makedirs(self.backup_dir)
+                print("[INFO]:", "Created Backup Directory.")
+            self.store.importLegacy()
+            self.snapshot = self.store.beginSnapshot(self.game, start_time)
+
+        # The state database lives next to the backups
+        self.state = None
+        if self.incremental:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            self.state = mix_state.MixState(self.backup_dir + "/" + mix_state.STATE_FILE)
+
+        self.render_dir = self.backup_dir + "/render-" + start_time.strftime("%Y%m%d-%H%M%S-%f")
+        with self.rendering():
+            return self._mix(selections, wrote, task_done, cancelled)
+
+    def _mix(self, selections, wrote, task_done, cancelled):
+        tasks = self.buildTasks(selections)
+        if self.skipped:
+            print("[INFO]", ":", len(self.skipped), "track(s) already up to date, skipping")
+            if task_done:
+                for entry in self.skipped:
+                    task_done(mix_engine.MixTask(entry, self.binPath(entry), self.outPath(entry), {}), None)
+
+        engine = mix_engine.MixEngine(self.threads)
+        try:
+            engine.run(tasks, wrote, task_done, cancelled)
+        finally:
+            self.backup_list = engine.backup_list
+            self.errors += engine.errors
+            if self.snapshot != None:
+                self.store.commit(self.snapshot)
+            if self.state != None:
+                self.state.save()
+
+        return self.backup_list, self.errors
+
+    # Applies a mod pack (see mod_pack.py) the same way as mix(), streaming each track straight out of the pack.
+    # Every track in the pack is checked against its hash first, and nothing is written if any of them are damaged.
+    # verified(n) is called with the bytes hashed so far. Raises mod_pack.PackError for bad packs, or packs for another game.
+    def applyPack(self, pack_path, wrote=None, task_done=None, cancelled=None, verified=None):
+        pack = mod_pack.ModPack(pack_path)
+        if pack.game and pack.game != self.game:
+            raise mod_pack.PackError(os.path.basename(pack_path) + " is for " + repr(pack.game) + ", not " + repr(self.game or "this install"))
+        pack.verify(verified)
+        print("[INFO]", ": Verified", len(pack.members), "track(s) in", os.path.basename(pack_path))
+        return self.mix(pack.selections(), wrote, task_done, cancelled)
+
+    # Applies a delta patch (see bin_patch.py) to the install, or to out_dir in Manual Mode.
+    # The patch's data is checked against its hashes first, and nothing is written if it's damaged.
+    # callback(relpath, patched) is called as each BIN is done. Returns (patched, unchanged, errors).
+    def applyPatch(self, patch_path, callback=None):
+        if not self.game:
+            raise ValueError("No supported game found in " + repr(self.game_dir))
+        patch = bin_patch.BinPatch(patch_path)
+        if patch.game and patch.game != self.game:
+            raise bin_patch.PatchError(os.path.basename(patch_path) + " is for " + repr(patch.game) + ", not " + repr(self.game))
+        # Only the game's own track BINs, the same ones buildPatch() diffs
+        unknown = sorted(set(patch.files) - set(self.tracks.values()))
+        if unknown:
+            raise bin_patch.PatchError(os.path.basename(patch_path) + " patches files that aren't tracks of " + repr(self.game) + ": " + ", ".join(unknown))
+        patch.verify()
+
+        out_dir = None
+        if self.safe_mode == True:
+            out_dir = self.out_dir
+            os.makedirs(out_dir, exist_ok=True)
+
+        undo = None
+        if self.backup_mode == True and out_dir == None:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            self.store.importLegacy()
+            undo = self.store.beginSnapshot(self.game)
+
+        print("[INFO]", ": Applying", len(patch.files), "patched file(s) from", os.path.basename(patch_path))
+        patched, unchanged, errors = bin_patch.applyPatch(patch, self.store, out_dir, self.threads, undo, callback)
+        for relpath, e in errors:
+            print("[ERRUR]", relpath, e, ": in MushiMixCore.applyPatch()")
+        print("[INFO]", ": Patched", len(patched), "file(s),", len(unchanged), "already matched")
+        return patched, unchanged, errors
+
+    # --- Backups ---
+
+    # All backup snapshots, oldest first
+    def snapshots(self):
+        return self.store.snapshots()
+
+    # Rolls the install back to how it was right before the snapshot `name` was taken, or to vanilla if name is "vanilla".
+    # Only files that differ are copied, and each one is verified afterwards.
+    # With backup_mode on, the files being replaced are backed up into a new snapshot first, so this can be undone too.
+    # Returns (restored, unchanged, errors).
+    def restore(self, name="vanilla", callback=None):
+        if name == "vanilla":
+            target = self.store.vanilla()
+        else:
+            target = self.store.stateAt(name)
+        if not target.files:
+            raise backup_store.BackupStoreError("Nothing to restore, no backups have been made yet")
+
+        undo = None
+        if self.backup_mode == True:
+            undo = self.store.beginSnapshot(self.game)
+
+        print("[INFO]", ": Restoring", len(target.files), "file(s) to", target.name, target.created)
+        restored, unchanged, errors = self.store.restore(target, self.threads, undo, callback)
+        for relpath, e in errors:
+            print("[ERRUR]", relpath, e, ": in MushiMixCore.restore()")
+        print("[INFO]", ": Restored", len(restored), "file(s),", len(unchanged), "already matched")
+        return restored, unchanged, errors
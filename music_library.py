@@ -0,0 +1,212 @@
+# MushiMix - Music Library Scanner
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# What's in a folder of custom WAVs, without reading the audio: format, duration, size, and a fingerprint of the audio,
+# so big libraries can be listed with details, and the same track saved under two names only shown once.
+#
+# Each WAV's RIFF chunks are walked for the fmt and data chunks (wav_format.parseWav()), and the fingerprint is the sha256
+# of its format, its data length, and FINGERPRINT_SPAN bytes of audio from the start, middle and end of the data chunk.
+# Tags and other chunks aren't part of it, so a retagged copy is still a duplicate. Files are read on a thread pool.
+#
+# Results are kept in a small SQLite database in the user's cache folder (see cacheDir()), keyed by the file's path,
+# and are only read again when its (size, mtime) changes, so reopening a library of thousands of WAVs is a stat() per file.
+# -----
+
+# Standard Modules
+import os
+import sys
+import sqlite3
+import hashlib
+import threading
+
+# MushiMix Modules
+import wav_format
+
+CACHE_FILE = "library.db"
+CACHE_VERSION = 1
+FINGERPRINT_SPAN = 4096 # bytes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS wavs (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sample_rate INTEGER,
+    channels INTEGER,
+    bits_per_sample INTEGER,
+    is_float INTEGER,
+    frames INTEGER,
+    fingerprint TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS wavs_folder ON wavs (folder);
+"""
+
+
+# Where the library cache lives: %LOCALAPPDATA%/mushimix on Windows, $XDG_CACHE_HOME (or ~/.cache)/mushimix elsewhere
+def cacheDir():
+    if sys.platform == "win32" and os.environ.get("LOCALAPPDATA"):
+        return os.environ["LOCALAPPDATA"] + "/mushimix"
+    return (os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")) + "/mushimix"
+
+
+# LibraryEntry - What the scan knows about one WAV. error is set (and the rest None) for files that aren't usable WAVs.
+class LibraryEntry:
+    __slots__ = ("name", "path", "size", "mtime_ns", "sample_rate", "channels", "bits_per_sample", "is_float", "frames", "fingerprint", "error")
+
+    def __init__(self, path, size, mtime_ns, sample_rate=None, channels=None, bits_per_sample=None, is_float=None, frames=None, fingerprint=None, error=None):
+        self.name = os.path.basename(path)
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bits_per_sample = bits_per_sample
+        self.is_float = is_float
+        self.frames = frames
+        self.fingerprint = fingerprint
+        self.error = error
+
+    @property
+    def duration(self):
+        if self.error != None or not self.sample_rate:
+            return 0.0
+        return self.frames / self.sample_rate
+
+    def describe(self):
+        if self.error != None:
+            return self.error
+        minutes, seconds = divmod(int(round(self.duration)), 60)
+        kind = "float" if self.is_float else "bit"
+        return "%d:%02d, %d Hz, %d ch, %d-%s, %.1f MB" % (minutes, seconds, self.sample_rate, self.channels, self.bits_per_sample, kind, self.size / 1048576)
+
+    def __repr__(self):
+        return "LibraryEntry(" + self.name + ", " + self.describe() + ")"
+
+
+# Reads one WAV's headers and fingerprint. Only takes plain arguments, so it runs fine on a worker thread.
+def readEntry(path):
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+
+        def readAt(offset, length):
+            f.seek(offset)
+            return f.read(length)
+
+        try:
+            info = wav_format.parseWav(readAt, stat.st_size, os.path.basename(path))
+        except wav_format.WavError as e:
+            return LibraryEntry(path, stat.st_size, stat.st_mtime_ns, error=str(e))
+
+        digest = hashlib.sha256(info.describe().encode("utf-8") + info.data_length.to_bytes(8, "little"))
+        span = min(FINGERPRINT_SPAN, info.data_length)
+        for offset in (0, (info.data_length - span) // 2, info.data_length - span):
+            digest.update(readAt(info.data_offset + offset, span))
+    return LibraryEntry(path, stat.st_size, stat.st_mtime_ns, info.sample_rate, info.channels, info.bits_per_sample, info.isFloat(), info.frames, digest.hexdigest())
+
+
+# {name: name of the file it duplicates} for every entry with the same fingerprint as one that sorts before it
+def duplicates(entries):
+    first = {}
+    found = {}
+    for name in sorted(entries):
+        fingerprint = entries[name].fingerprint
+        if fingerprint == None:
+            continue
+        if fingerprint in first:
+            found[name] = first[fingerprint]
+        else:
+            first[fingerprint] = name
+    return found
+
+
+# LibraryCache - The cache database. Safe to share between threads.
+class LibraryCache:
+    def __init__(self, path=None):
+        self.path = path or cacheDir() + "/" + CACHE_FILE
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode = WAL")
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != CACHE_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS wavs")
+            self.db.execute("PRAGMA user_version = " + str(CACHE_VERSION))
+        self.db.executescript(_SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Scans the WAVs in folder, or just the ones in `names`, on `threads` threads. Only files whose (size, mtime) changed
+    # since they were cached are read. callback(name) is called as each one is read. Files that can't be opened are left out.
+    # Returns ({name: LibraryEntry}, names that were read).
+    def scan(self, folder, names=None, threads=4, callback=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        folder = os.path.abspath(folder)
+        listed = names == None
+        if listed:
+            try:
+                names = [name for name in os.listdir(folder) if name[-4:].lower() == ".wav"]
+            except OSError as e:
+                print("[WARNING]", "Couldn't read the music folder :", e)
+                return {}, []
+
+        with self._lock:
+            cached = {row["path"]: row for row in self.db.execute("SELECT * FROM wavs WHERE folder = ?", (folder,))}
+
+        entries = {}
+        changed = []
+        for name in names:
+            path = folder + "/" + name
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            row = cached.get(path)
+            if row != None and (row["size"], row["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                entries[name] = LibraryEntry(path, row["size"], row["mtime_ns"], row["sample_rate"], row["channels"], row["bits_per_sample"],
+                                             None if row["is_float"] == None else bool(row["is_float"]), row["frames"], row["fingerprint"], row["error"])
+            else:
+                changed.append(path)
+
+        def read(path):
+            try:
+                entry = readEntry(path)
+            except OSError: # Gone or unreadable since the listing
+                entry = None
+            if callback:
+                callback(os.path.basename(path))
+            return entry
+
+        read_entries = []
+        if changed:
+            with ThreadPoolExecutor(max_workers=max(1, int(threads)), thread_name_prefix="mushimix-library") as pool:
+                read_entries = [entry for entry in pool.map(read, changed) if entry != None]
+
+        with self._lock, self.db:
+            if listed: # Forget files that are gone from the folder
+                present = set(folder + "/" + name for name in names)
+                self.db.executemany("DELETE FROM wavs WHERE path = ?", [(path,) for path in cached if path not in present])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO wavs (path, folder, size, mtime_ns, sample_rate, channels, bits_per_sample, is_float, frames, fingerprint, error)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(e.path, folder, e.size, e.mtime_ns, e.sample_rate, e.channels, e.bits_per_sample, e.is_float, e.frames, e.fingerprint, e.error) for e in read_entries])
+        for entry in read_entries:
+            entries[entry.name] = entry
+        return entries, [entry.name for entry in read_entries]
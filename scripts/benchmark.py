@@ -0,0 +1,314 @@
+# MushiMix - Benchmarks
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Times the heavy parts of MushiMix on a synthetic install (see make_cave_install.py), so changes can be checked
+# for regressions without the games:
+#
+#   parse        open every BIN and read its ifd table (cave_bin.CaveBin)            latency per BIN
+#   index        catalog the install from scratch (cave_index.CaveIndex.scan)         latency per scan
+#   index-warm   rescan the unchanged install                                          latency per scan
+#   mix          Remix every track into a fresh copy of the install, with backups,    latency per track
+#                the same as the GUI's Remix! button (MushiMixCore.mix)
+#   remix        Remix every track again with other WAVs, on an install that's        latency per track
+#                already backed up (backup objects are shared)
+#   restore      roll a remixed install back to vanilla (MushiMixCore.restore)        latency per BIN
+#
+# Each benchmark runs in its own process, so the peak RSS reported is its own. It runs --repeat times,
+# and reports throughput (MB/s, median over the runs), and the 50th/90th/99th percentile latency of each item.
+# For mix, remix and restore, an item's latency is the time from the start of the run until it was done,
+# which is what the progress display in the GUI shows.
+#
+# Usage:
+#   python benchmark.py [--dir DIR] [--game mushi|dfk] [--seconds N] [--repeat N] [--threads N] [--only NAME,...]
+#                       [--loudness] [--json OUT.json] [--compare BASELINE.json] [--tolerance 0.15]
+# The install is generated into DIR (a temporary folder by default) and reused while its settings don't change.
+# With --compare, results are checked against an earlier --json, and the exit code is 1 if any throughput dropped,
+# or median latency rose, by more than --tolerance.
+# -----
+
+# Standard Modules
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# The MushiMix modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+import cave_bin
+import cave_index
+import mushimix_core
+import make_cave_install
+
+BENCHMARKS = ("parse", "index", "index-warm", "mix", "remix", "restore")
+SETTINGS_FILE = "benchmark.json"
+
+
+# Peak RSS of this process in bytes, or None where it can't be had
+def peakRss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # KB on Linux
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+# Generates the synthetic install into work_dir/template, unless it's already there with the same settings
+def prepare(work_dir, game, seconds, music):
+    settings = {"game": game, "seconds": seconds, "music": music, "version": 1}
+    try:
+        with open(work_dir + "/" + SETTINGS_FILE, 'r') as f:
+            if json.load(f) == settings:
+                return
+    except (OSError, ValueError):
+        pass
+
+    print("[INFO]", ": Generating the synthetic install in", work_dir)
+    shutil.rmtree(work_dir + "/template", ignore_errors=True)
+    shutil.rmtree(work_dir + "/music", ignore_errors=True)
+    make_cave_install.makeInstall(work_dir + "/template", game, seconds)
+    make_cave_install.makeMusic(work_dir + "/music", music, seconds)
+    with open(work_dir + "/" + SETTINGS_FILE, 'w') as f:
+        json.dump(settings, f)
+
+
+# A fresh copy of the template install, not timed
+def freshInstall(work_dir):
+    game_dir = work_dir + "/install"
+    shutil.rmtree(game_dir, ignore_errors=True)
+    shutil.copytree(work_dir + "/template", game_dir)
+    return game_dir
+
+
+def installSize(game_dir):
+    return sum(os.path.getsize(game_dir + relpath) for relpath in cave_index.diskdataFiles(game_dir))
+
+
+# Mixes the music WAVs (rotated by `shift`) into every track. Returns (seconds, bytes written, [latency per track]).
+def timedMix(core, music, shift):
+    selections = {}
+    for number, entry in enumerate(sorted(core.tracks)):
+        selections[entry] = music[(number + shift) % len(music)]
+    written = [0]
+    latencies = []
+
+    def wrote(n):
+        written[0] += n
+
+    def taskDone(task, error):
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    core.mix(selections, wrote, taskDone)
+    seconds = time.perf_counter() - start
+    if core.errors:
+        raise RuntimeError(str(len(core.errors)) + " track(s) failed to mix")
+    return seconds, written[0], latencies
+
+
+# Runs one benchmark `repeat` times, in this process. Returns {"runs": [(seconds, bytes)], "latencies": [...]}.
+def runBenchmark(name, work_dir, repeat, threads, loudness):
+    music = sorted(work_dir + "/music/" + file_name for file_name in os.listdir(work_dir + "/music"))
+    runs = []
+    latencies = []
+
+    def makeCore(game_dir):
+        return mushimix_core.MushiMixCore(game_dir, threads=threads, incremental=False, match_loudness=loudness)
+
+    if name == "parse":
+        game_dir = work_dir + "/template"
+        paths = [game_dir + relpath for relpath in cave_index.diskdataFiles(game_dir)]
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for path in paths:
+                item = time.perf_counter()
+                with cave_bin.CaveBin(path) as cave:
+                    cave.musicEntry()
+                latencies.append(time.perf_counter() - item)
+            # Nothing is read but the tables, so "bytes" is the size of the containers walked
+            runs.append((time.perf_counter() - start, installSize(game_dir)))
+
+    elif name in ("index", "index-warm"):
+        game_dir = work_dir + "/template"
+        index_path = work_dir + "/cave_index.db"
+        for _ in range(repeat):
+            if name == "index":
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(index_path + suffix):
+                        os.remove(index_path + suffix)
+            else:
+                with cave_index.CaveIndex(game_dir, index_path) as index:
+                    index.scan(threads) # Make sure it's up to date, not timed
+            start = time.perf_counter()
+            with cave_index.CaveIndex(game_dir, index_path) as index:
+                scanned, unchanged, removed = index.scan(threads)
+            seconds = time.perf_counter() - start
+            latencies.append(seconds)
+            runs.append((seconds, installSize(game_dir) if scanned else 0))
+
+    elif name == "mix":
+        for _ in range(repeat):
+            core = makeCore(freshInstall(work_dir))
+            seconds, written, times = timedMix(core, music, 0)
+            runs.append((seconds, written))
+            latencies.extend(times)
+
+    elif name == "remix":
+        core = makeCore(freshInstall(work_dir))
+        timedMix(core, music, 0)
+        for shift in range(1, repeat + 1):
+            seconds, written, times = timedMix(core, music, shift)
+            runs.append((seconds, written))
+            latencies.extend(times)
+
+    elif name == "restore":
+        for _ in range(repeat):
+            game_dir = freshInstall(work_dir)
+            core = makeCore(game_dir)
+            timedMix(core, music, 0)
+            core = mushimix_core.MushiMixCore(game_dir, threads=threads, backup_mode=False)
+            done = []
+
+            def fileDone(relpath, restored):
+                done.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            restored, unchanged, errors = core.restore("vanilla", fileDone)
+            seconds = time.perf_counter() - start
+            if errors:
+                raise RuntimeError(str(len(errors)) + " file(s) failed to restore")
+            runs.append((seconds, sum(os.path.getsize(game_dir + relpath) for relpath in restored)))
+            latencies.extend(done)
+
+    else:
+        raise ValueError("Unknown benchmark " + repr(name))
+    return {"runs": runs, "latencies": latencies}
+
+
+# Runs a benchmark in a child process (for its own peak RSS), and summarises it
+def measure(name, args, work_dir):
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--dir", work_dir,
+               "--repeat", str(args.repeat), "--threads", str(args.threads)]
+    if args.loudness:
+        command.append("--loudness")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL, text=True)
+    if result.returncode != 0:
+        return {"error": "exit code " + str(result.returncode)}
+    raw = json.loads(result.stdout.strip().splitlines()[-1])
+
+    throughputs = [size / seconds / 1048576 for seconds, size in raw["runs"] if seconds > 0]
+    return {
+        "seconds": statistics.median(seconds for seconds, size in raw["runs"]),
+        "throughput": statistics.median(throughputs) if throughputs else 0.0,
+        "p50": percentile(raw["latencies"], 50),
+        "p90": percentile(raw["latencies"], 90),
+        "p99": percentile(raw["latencies"], 99),
+        "items": len(raw["latencies"]),
+        "peak_rss": raw["peak_rss"],
+        }
+
+
+# Regressions against a baseline: throughput down, or median latency up, by more than tolerance
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before == None or "error" in result or "error" in before:
+            continue
+        if before["throughput"] and result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append("%s: throughput %.1f -> %.1f MB/s" % (name, before["throughput"], result["throughput"]))
+        if before["p50"] and result["p50"] > before["p50"] * (1 + tolerance):
+            regressions.append("%s: p50 latency %.2f -> %.2f ms" % (name, before["p50"] * 1000, result["p50"] * 1000))
+    return regressions
+
+
+def printResults(results):
+    print("%-11s %9s %10s %10s %10s %10s %7s %9s" % ("benchmark", "seconds", "MB/s", "p50 ms", "p90 ms", "p99 ms", "items", "peak RSS"))
+    for name, result in results.items():
+        if "error" in result:
+            print("%-11s FAILED (%s)" % (name, result["error"]))
+            continue
+        rss = "-" if result["peak_rss"] == None else str(round(result["peak_rss"] / 1048576)) + " MB"
+        print("%-11s %9.3f %10.1f %10.2f %10.2f %10.2f %7d %9s" % (name, result["seconds"], result["throughput"],
+              result["p50"] * 1000, result["p90"] * 1000, result["p99"] * 1000, result["items"], rss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MushiMix on a synthetic CAVE install.")
+    parser.add_argument("--dir", help="where to generate the install (default: a temporary folder)")
+    parser.add_argument("--game", choices=("mushi", "dfk"), default="mushi")
+    parser.add_argument("--seconds", type=float, default=30, help="length of every track (default: 30)")
+    parser.add_argument("--music", type=int, default=8, help="how many custom WAVs to mix in (default: 8)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=mushimix_core.DEFAULT_THREADS)
+    parser.add_argument("--only", help="comma separated benchmarks to run, out of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--loudness", action="store_true", help="match loudness while mixing, like the GUI does by default (needs NumPy)")
+    parser.add_argument("--json", metavar="OUT", help="save the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against results saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--verbose", action="store_true", help="show what the benchmarks print")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # MushiMix's own logging goes to stderr, the result is the last line on stdout
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        result = runBenchmark(args.child, args.dir, args.repeat, args.threads, args.loudness)
+        result["peak_rss"] = peakRss()
+        stdout.write(json.dumps(result) + "\n")
+        return 0
+
+    names = BENCHMARKS if not args.only else [name.strip() for name in args.only.split(",")]
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark " + repr(name))
+
+    temporary = args.dir == None
+    work_dir = os.path.abspath(args.dir or tempfile.mkdtemp(prefix="mushimix-bench-"))
+    try:
+        prepare(work_dir, args.game, args.seconds, args.music)
+        results = {}
+        for name in names:
+            print("[INFO]", ": Running", name, "...")
+            results[name] = measure(name, args, work_dir)
+    finally:
+        if temporary:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            shutil.rmtree(work_dir + "/install", ignore_errors=True)
+
+    print()
+    printResults(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("[WARNING]", "Regression :", regression)
+        if regressions:
+            return 1
+    return 1 if any("error" in result for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
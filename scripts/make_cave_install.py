@@ -0,0 +1,193 @@
+# MushiMix - Synthetic CAVE Install Generator
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Makes a fake CAVE Steam install to test and benchmark MushiMix with, without owning the games.
+# Every BIN is a real container (cave_header, ifd table, data, see doc/cave_header_spec.py), packed with cave_bin's own
+# CaveHeader/IfdHeader, and laid out where MushiMix expects it for the game:
+#
+#   mushi  Mushihimesama                  res/DISKDATA/B/m05.bin, ...
+#   dfk    DoDonPachi Resurrection        res/DISKDATA/F/m01.bin, ..., res_BL/DISKDATA/F/mb01.bin, ...
+#
+# Music BINs hold a single WAV, except the Main Menu, which holds a sound effect WAV before the music (like the real one).
+# A few extra BINs of TGA images and sound effects are added so parsing and indexing see more than music.
+# The WAVs are tones with a little noise, a different pitch for each file, so every file hashes differently,
+# and are written a block at a time, so long tracks don't need to fit in memory.
+#
+# Usage:
+#   python make_cave_install.py OUT_DIR [--game mushi|dfk|all] [--seconds N] [--music N] [--music-seconds N] [--mixed-formats]
+# Makes OUT_DIR/<game folder>/ for each game, and N custom WAVs in OUT_DIR/music/ to mix into them.
+# -----
+
+# Standard Modules
+import os
+import sys
+import math
+import array
+import random
+import struct
+import argparse
+
+# The MushiMix modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import cave_bin
+import mushimix_core
+
+GAME_FOLDERS = {"mushi": "Mushihimesama", "dfk": "DoDonPachi Resurrection"}
+TGA_FILE_TYPE = b"\x00\x00\x01" # Not documented, the parser only goes by the name for TGAs
+
+# Formats the custom WAVs cycle through with --mixed-formats: (sample rate, channels, bits)
+MIXED_FORMATS = ((44100, 2, 16), (48000, 2, 16), (44100, 2, 24), (44100, 1, 16), (22050, 2, 16))
+
+
+# WavSpec - A synthetic WAV: its format, length and tone. Knows its size before anything is written.
+class WavSpec:
+    __slots__ = ("seconds", "sample_rate", "channels", "bits", "pitch", "seed")
+
+    def __init__(self, seconds, sample_rate=44100, channels=2, bits=16, pitch=440.0, seed=0):
+        self.seconds = seconds
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bits = bits
+        self.pitch = pitch
+        self.seed = seed
+
+    @property
+    def frames(self):
+        return int(self.seconds * self.sample_rate)
+
+    @property
+    def block_align(self):
+        return self.channels * self.bits // 8
+
+    @property
+    def length(self):
+        return 44 + self.frames * self.block_align
+
+    # A tenth of a second of audio, repeated for the whole track. A whole number of periods isn't needed, the seam is just a click.
+    def _block(self):
+        rng = random.Random(self.seed)
+        peak = (1 << (self.bits - 1)) - 1
+        samples = []
+        for i in range(max(1, self.sample_rate // 10)):
+            value = 0.5 * math.sin(2 * math.pi * self.pitch * i / self.sample_rate) + rng.uniform(-0.02, 0.02)
+            sample = int(value * peak)
+            samples.extend([sample] * self.channels)
+        if self.bits == 16:
+            block = array.array("h", samples)
+            if sys.byteorder == "big":
+                block.byteswap()
+            return block.tobytes()
+        return b"".join(sample.to_bytes(self.bits // 8, "little", signed=True) for sample in samples)
+
+    def writeTo(self, f):
+        f.write(b"RIFF" + struct.pack("<I", self.length - 8) + b"WAVE")
+        f.write(b"fmt " + struct.pack("<IHHIIHH", 16, 1, self.channels, self.sample_rate, self.sample_rate * self.block_align, self.block_align, self.bits))
+        f.write(b"data" + struct.pack("<I", self.frames * self.block_align))
+        block = self._block()
+        remaining = self.frames * self.block_align
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+# An uncompressed 24-bit TGA (2.0, with the footer) of a gradient
+def makeTga(width, height, seed=0):
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, 2, 0, 0, 0, 0, 0, width, height, 24, 0x20)
+    row = bytes((x + seed) & 0xFF for x in range(width * 3))
+    footer = struct.pack("<II", 0, 0) + b"TRUEVISION-XFILE.\x00"
+    return header + b"".join(row[y % 3:] + row[:y % 3] for y in range(height)) + footer
+
+
+# Writes a CAVE container to path. files is a list of (name, data), data being bytes or a WavSpec.
+def writeBin(path, files, byteorder=">"):
+    table_end = cave_bin.CAVE_HEADER_SIZE + len(files) * cave_bin.IFD_HEADER_SIZE
+    offset = table_end
+    ifds = []
+    for index, (name, data) in enumerate(files):
+        length = data.length if isinstance(data, WavSpec) else len(data)
+        if name.lower().endswith(".wav"):
+            ifd = cave_bin.IfdHeader(index, cave_bin.WAV_FILE_TYPE, length, 0, offset, name.encode("ascii"), byteorder=byteorder)
+        else:
+            ifd = cave_bin.IfdHeader(index, TGA_FILE_TYPE, 0, length, offset, name.encode("ascii"), byteorder=byteorder)
+        ifds.append(ifd)
+        offset += length
+
+    header = cave_bin.CaveHeader(cave_bin.CAVE_MAGIC, offset, table_end, len(files), byteorder=byteorder)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(header.pack())
+        for ifd in ifds:
+            f.write(ifd.pack())
+        for name, data in files:
+            if isinstance(data, WavSpec):
+                data.writeTo(f)
+            else:
+                f.write(data)
+    return offset
+
+
+# Makes a fake install of `game` ("mushi" or "dfk") in game_dir, with music tracks `seconds` long.
+# Returns the total size written.
+def makeInstall(game_dir, game="mushi", seconds=30, byteorder=">", seed=0):
+    tracks = mushimix_core.knownTracks()[game]
+    relpaths = sorted(set(tracks.values()))
+    menu = tracks.get("Main Menu")
+    total = 0
+    for number, relpath in enumerate(relpaths):
+        music = WavSpec(seconds, pitch=220.0 + 10 * number, seed=seed + number)
+        files = [("bgm.wav", music)]
+        if relpath == menu:
+            files.insert(0, ("se.wav", WavSpec(2, pitch=880.0, seed=seed + 1000)))
+        total += writeBin(game_dir + relpath, files, byteorder)
+
+    # Non-music containers: images, and a bank of sound effects
+    folder = os.path.dirname(relpaths[0])
+    for number in range(4):
+        images = [("img%02d.tga" % i, makeTga(256, 256, seed + number * 8 + i)) for i in range(8)]
+        total += writeBin(game_dir + folder + "/sys%02d.bin" % number, images, byteorder)
+    effects = [("se%02d.wav" % i, WavSpec(1, pitch=600.0 + 40 * i, seed=seed + 2000 + i)) for i in range(16)]
+    total += writeBin(game_dir + folder + "/se.bin", effects, byteorder)
+    return total
+
+
+# Writes `count` custom WAVs into music_dir, `seconds` long. With mixed_formats, they cycle through MIXED_FORMATS
+# (mixing those needs NumPy, for the conversion). Returns their paths.
+def makeMusic(music_dir, count, seconds=30, mixed_formats=False, seed=0):
+    os.makedirs(music_dir, exist_ok=True)
+    paths = []
+    for number in range(count):
+        sample_rate, channels, bits = MIXED_FORMATS[number % len(MIXED_FORMATS)] if mixed_formats else MIXED_FORMATS[0]
+        path = music_dir + "/custom%03d.wav" % number
+        with open(path, 'wb') as f:
+            WavSpec(seconds, sample_rate, channels, bits, 330.0 + 7 * number, seed + 5000 + number).writeTo(f)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make a synthetic CAVE install (and custom WAVs) to test and benchmark MushiMix with.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--game", choices=("mushi", "dfk", "all"), default="all")
+    parser.add_argument("--seconds", type=float, default=30, help="length of each vanilla music track (default: 30)")
+    parser.add_argument("--music", type=int, default=40, help="how many custom WAVs to make (default: 40)")
+    parser.add_argument("--music-seconds", type=float, default=30, help="length of each custom WAV (default: 30)")
+    parser.add_argument("--mixed-formats", action="store_true", help="make custom WAVs in a mix of sample rates, channels and bit depths")
+    parser.add_argument("--little-endian", action="store_true", help="write the BIN headers little endian")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    games = ("mushi", "dfk") if args.game == "all" else (args.game,)
+    for game in games:
+        game_dir = args.out_dir + "/" + GAME_FOLDERS[game]
+        size = makeInstall(game_dir, game, args.seconds, "<" if args.little_endian else ">", args.seed)
+        print(game_dir, ":", str(round(size / 1048576, 1)), "MB")
+    if args.music:
+        makeMusic(args.out_dir + "/music", args.music, args.music_seconds, args.mixed_formats, args.seed)
+        print(args.out_dir + "/music", ":", args.music, "WAV(s)")
+
+
+if __name__ == "__main__":
+    main()
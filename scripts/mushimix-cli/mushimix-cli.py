@@ -1,5 +1,5 @@
-# # MushiMix - Mushi OST Converter
-# version 1.1.0
+# # MushiMix - Mushi OST Converter (CLI)
+# version 2.0.0
 #
 # Developed by Xeirla (Rur)
 # Licensed under the MIT License
@@ -8,63 +8,37 @@
 # -----
 #
 # Small script for converting custom WAV files to Mushihimesama BIN format, to play in the Steam Version of the game.
+# Uses the same headless core as the GUI (mushimix_core.py in the repository root), so PySide6 is not needed.
 #
 # As of mushimix 1.1.0, this process can now be done while the game is open even!
 # It is recommended you do so while the game is closed, of course, to avoid any potential errors
 # (such as trying to replace an music file while its being played)
 #
 # # !! Remember to backup your game's OST !!
+# Files are backed up into "<game>/mushimix-bk/" before they are modified, same as the GUI.
 # If things get messy, you can always use "Verify integrity of game files" via Steam to restore the OST back to vanilla.
 # You can also reinstall the game entirely, but that shouldn't be necessary!
 #
-# If you are changing the music often, it is also a good idea to restore all backups of the OST first
-# before running the script again. Otherwise it may make a backup of the modded files instead!
-#
 # -----
 #
 # # Usage
-# *If you want, you can clone this repository to skip part of the setup steps. If so, skip to step 3 below.*
-#
-# 1. Place this script into a folder, and create 2 subfolders:
-#       "in" and "out"
-# 2. Create 'mushimix.config' in the same directory as this script if it does not exist.
-# 3. In the config, copy-paste the path to the game's OST
-#     By default, this should be something like:
-#        - Windows --- C:\Program Files\Steam\SteamApps\common\common\Mushihimesama\res\DISKDATA\B\
-#
-#        - Linux   --- $HOME/.steam/debian-installation/steamapps/common/Mushihimesama/res/DISKDATA/B/
-#             (On Linux, replace '$HOME' with your home directory, as usual)
-#
-#        Make sure you include a '/' or '\' at the end of the path!
-#
-# 4. Put your .wav files into "custom"
-#       Rename your .wav files to the filenames of the OST you want to replace.
-#       For example:
-#       "ma05.wav" will be used to replace "ma05.bin" in game (Stage 1 Arrange)
+# See doc/mushimix-cli-usage.md
+# For playlists, many installs, JSON progress or exit codes, use mushimix_cli.py in the repository root instead.
 #
-#       Most WAV files should just work, but if they don't, try converting them
-#       from a lossless format using `ffmpeg`
-#       Converter websites may not always result in a clean file.
-#
-# 5. Once all setup is done, run this script from a terminal:
-#       python mushimix.py
-#
-# The script will create backup files in the "out" directory,
-# and overwrite the designated tracks in the game's directory.
-#
-# Enjoy custom soundtrack in game!
-#
-# Note that there is no guarantee a track will sound good if it loops early.
-# Also no guarantee the game won't just crash unexpectedly for no reason!
-# It _shouldn't_, but this has not been tested that thoroughly.
-# Use at your own risk!
+#   python mushimix-cli.py                    Mix every WAV in "in" into the game
+#   python mushimix-cli.py --manual           Write the modded BINs to "out" instead of the game
+#   python mushimix-cli.py --list-backups     List the backup snapshots
+#   python mushimix-cli.py --restore [NAME]   Roll the game back to before snapshot NAME (default: vanilla)
 #
 # -----
 
 import os
 import sys
 
-GAMEDIR = getGameDir()
+# The headless core lives in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import mushimix_core
+
 WAVDIR = os.getcwd() + '/in/'
 OUTDIR = os.getcwd() + '/out/'
 
@@ -73,79 +47,95 @@ def getGameDir():
     try:
         with open(os.getcwd() + '/mushimix.config', 'r') as f:
             gamedir = f.read().splitlines()[0]
-            if (gamedir[0] == '#') or (gamedir == ''):
+            if (gamedir == '') or (gamedir[0] == '#'):
                 raise Exception('NoPath')
             f.close()
-        return str(gamedir)
     except Exception as e:
-        if e == 'NoPath':
+        if str(e) == 'NoPath':
             print("ERRUR: No path set in 'mushimix.config'.")
         else:
             print("ERRUR: Failed to open 'mushimix.config'.")
-        print("Make sure the file is in the same folder as this script, and contains the path to the game's OST on the first line of the file.")
+        print("Make sure the file is in the same folder as this script, and contains the path to the game's install directory on the first line of the file.")
         print("For example: ")
-        print("Windows --- 'C:\\Program Files\\Steam\\SteamApps\\common\\common\\Mushihimesama\\res\\DISKDATA\\B\\'")
-        print("Linux   --- '$HOME/.steam/debian-installation/steamapps/common/Mushihimesama/res/DISKDATA/B/'")
-        sys.exit()
+        print("Windows --- 'C:\\Program Files\\Steam\\SteamApps\\common\\Mushihimesama\\'")
+        print("Linux   --- '$HOME/.steam/debian-installation/steamapps/common/Mushihimesama/'")
+        sys.exit(1)
+
+    # Older configs point at the OST folder itself (<game>/res/DISKDATA/B/), so walk back up to the install dir
+    gamedir = os.path.expandvars(os.path.expanduser(gamedir)).rstrip('/\\')
+    parts = gamedir.replace('\\', '/').split('/')
+    if len(parts) > 3 and parts[-2] == 'DISKDATA':
+        gamedir = gamedir[:-len('/'.join(parts[-3:])) - 1]
+    return gamedir
 
 
 # Custom WAV to Mushi
-def wavToMushi():
+def wavToMushi(gamedir, manual):
+    core = mushimix_core.MushiMixCore(gamedir, OUTDIR, safe_mode=manual)
     print("Using the following directories:")
-    print('GAME OST:  \t' + GAMEDIR)
+    print('GAME:      \t' + core.game_dir)
     print('CUSTOM WAV:\t' + WAVDIR)
-    print('OUTPUT:    \t' + OUTDIR)
+    if manual:
+        print('OUTPUT:    \t' + OUTDIR)
     print('')
-    if (GAMEDIR[-15:] != 'res/DISKDATA/B/') and (GAMEDIR[-15:] != 'res\\DISKDATA\\B\\'):
-        print("WARNING: Game OST directory is different from expected.")
-        print("The script will try to continue, but may fail or overwrite the wrong files!")
-        print("Double check the path in `mushimix.config` matches the expected value")
+    if not core.game:
+        print("ERRUR: No supported game found. Double check the path in `mushimix.config`.")
+        sys.exit(1)
+
+    # "ma05.wav" replaces "ma05.bin"
+    selections = {}
+    for track in sorted(os.listdir(WAVDIR)):
+        if track[-4:].lower() == '.wav':
+            selections[track[:-4] + '.bin'] = WAVDIR + track
+
     print("Processing Files...")
-    try:
-        for track in os.listdir(WAVDIR):
-            # Open OST bin
-            print(track)
-            with open(GAMEDIR + track[:-4] + '.bin', 'rb') as bin_file:
-                indata = bin_file.read()
-                bin_file.close()
-
-                # Strip header bytes
-                prefix = indata[:0x138]
-
-                # Make Backup files
-                with open(OUTDIR + track[:-4] + '.bin' + '.backup', 'wb') as backup_file:
-                    backup_file.write(indata)
-                    backup_file.close()
-
-                with open(GAMEDIR + track[:-4] + '.bin' + '.backup', 'wb') as backup_file:
-                    backup_file.write(indata)
-                    backup_file.close()
-
-            # Get custom input WAV data
-            with open(WAVDIR + track[:-4] + '.wav', 'rb') as in_file:
-                data = in_file.read()
-                in_file.close()
-
-            # Overwrite OST in GAMEDIR with new WAV data
-            with open(GAMEDIR + track[:-4] + '.bin', 'wb') as bin_file:
-                bin_file.write(prefix)
-                bin_file.write(data)
-                bin_file.close()
+    for i in selections.keys():
+        print(i)
+    backup_list, errors = core.mix(selections)
+    for key, e in errors:
+        print("ERRUR:", key, e)
+    if errors:
+        print("ERRUR: Is an input file missing or named wrong?")
+    return core, backup_list, errors
 
+# Restore a backup snapshot
+def restore(gamedir, name):
+    core = mushimix_core.MushiMixCore(gamedir)
+    try:
+        restored, unchanged, errors = core.restore(name)
     except Exception as e:
-        print(e)
-        print("ERRUR: Is an input file missing or named wrong?")
+        print("ERRUR:", e)
+        sys.exit(1)
+    for relpath in restored:
+        print("Restored:", relpath)
+    print("Done!")
+    sys.exit(1 if errors else 0)
+
+def listBackups(gamedir):
+    core = mushimix_core.MushiMixCore(gamedir)
+    print("vanilla")
+    for snapshot in core.snapshots():
+        print(snapshot.name + "\t" + snapshot.created + "\t" + str(len(snapshot.files)) + " files")
+    sys.exit(0)
 
 if __name__ == '__main__':
-    print(":: mushimix.py ::\n")
-    wavToMushi()
+    print(":: mushimix-cli.py ::\n")
+    args = sys.argv[1:]
+    if '--list-backups' in args:
+        listBackups(getGameDir())
+    if '--restore' in args:
+        i = args.index('--restore')
+        restore(getGameDir(), args[i + 1] if i + 1 < len(args) else 'vanilla')
+
+    core, backup_list, errors = wavToMushi(getGameDir(), '--manual' in args)
     print("Done!")
-    print("Backup files of the OST tracks that were changed have been written to:")
-    print('\t' + OUTDIR)
-    print('\t' + GAMEDIR)
-    print("To restore, delete the modded files, and then remove '.backup' from the backup filenames")
+    if backup_list:
+        print("Backups of the OST tracks that were changed have been written to:")
+        print('\t' + core.backup_dir + '/snapshots/' + core.snapshot.name + '.json')
+    print("To restore, run: python mushimix-cli.py --restore")
     print("If things get messy, you can always use 'Verify integrity of game files' via Steam to restore the OST back to vanilla.")
     print("You can also reinstall the game entirely, but that shouldn't be necessary!")
+    sys.exit(1 if errors else 0)
 
 
 ''''
@@ -0,0 +1,115 @@
+# MushiMix - Track Table Discovery
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Works out which game is installed, and which of its BINs hold music, by reading the ifd tables of everything
+# in its res*/DISKDATA/* folders, instead of going by the install folder's name.
+#
+#   1. Every BIN's ifd table is read (just the first page or two of each file, see cave_bin.py).
+#   2. Known games (mushimix_core.CaveData) are matched by how many of their music BINs are present as valid containers.
+#      The best match wins, and its table is every known track whose BIN was found, with the names from CaveData.
+#   3. Anything else with enough single-WAV containers (one ifd entry, a WAV: how the CAVE ports store music)
+#      is treated as an unknown CAVE game ("cave"), and its tracks are named after their internal WAV names.
+#
+# The result is cached in "<game>/mushimix-bk/tracks.json", along with the list of DISKDATA files, so it's only worked out
+# again when files are added or removed (a Remix changes BINs, but not which BINs there are or what's in their tables).
+# The cache is only written once the backup folder exists, so just opening an install doesn't create anything in it.
+# -----
+
+# Standard Modules
+import os
+import json
+import hashlib
+
+# MushiMix Modules
+import cave_io
+import cave_bin
+import cave_index
+
+CACHE_FILE = "tracks.json"
+CACHE_VERSION = 1
+UNKNOWN_GAME = "cave"
+MIN_UNKNOWN_TRACKS = 3 # Fewer single-WAV containers than this isn't a CAVE game we can do anything with
+
+
+# Identifies a set of known track names, so the cache is redone when they change
+def _knownKey(known):
+    return hashlib.sha256(json.dumps(known, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# {relpath: (ifd entry count, [wav names in table order])} of every valid CAVE BIN in relpaths that has at least one WAV
+def scanContainers(game_dir, relpaths):
+    found = {}
+    for relpath in relpaths:
+        try:
+            with cave_bin.CaveBin(game_dir + relpath) as cave:
+                wavs = [entry.file_name for entry in cave.entries if entry.isWav()]
+                if wavs:
+                    found[relpath] = (len(cave.entries), wavs)
+        except (cave_bin.CaveBinError, OSError, ValueError):
+            continue
+    return found
+
+
+# Works out (game, {entry: relpath}) from the containers found by scanContainers().
+# known is {game: {entry: relpath}} for the games MushiMix has names for. Some entries share a BIN.
+def buildTable(containers, known):
+    best = ""
+    best_count = 0
+    for game, tracks in known.items():
+        count = len(set(relpath for relpath in tracks.values() if relpath in containers))
+        if count > best_count:
+            best, best_count = game, count
+    if best:
+        return best, {entry: relpath for entry, relpath in known[best].items() if relpath in containers}
+
+    # Unknown game: single-WAV containers, named after their internal WAV
+    music = sorted(relpath for relpath, (count, wavs) in containers.items() if count == 1)
+    if len(music) < MIN_UNKNOWN_TRACKS:
+        return "", {}
+
+    names = {}
+    for relpath in music:
+        names[relpath] = os.path.splitext(containers[relpath][1][0])[0]
+    # Internal names are often all the same ("bgm.wav"), in which case the BIN name is more useful
+    if len(set(names.values())) < len(names):
+        names = {relpath: os.path.splitext(os.path.basename(relpath))[0] for relpath in music}
+
+    table = {}
+    for relpath in music:
+        res = relpath.split("/")[1]
+        entry = names[relpath] if res == "res" else "(" + res[4:] + ") " + names[relpath]
+        if entry in table:
+            entry += " [" + relpath.split("/")[3] + "]" # Same name in two DISKDATA folders
+        table[entry] = relpath
+    return UNKNOWN_GAME, table
+
+
+# (game, {entry: relpath}) for the install at game_dir, from the cache if nothing in DISKDATA changed
+def discover(game_dir, known, backup_dir=None):
+    game_dir = game_dir.rstrip("/\\")
+    backup_dir = backup_dir or game_dir + "/mushimix-bk"
+    cache_path = backup_dir + "/" + CACHE_FILE
+    files = cave_index.diskdataFiles(game_dir)
+    if not files:
+        return "", {}
+    known_key = _knownKey(known)
+
+    try:
+        with open(cache_path, 'r', encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") == CACHE_VERSION and cached.get("files") == files and cached.get("known") == known_key:
+            return cached["game"], cached["tracks"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    game, table = buildTable(scanContainers(game_dir, files), known)
+    if os.path.isdir(backup_dir):
+        try:
+            with cave_io.atomicWrite(cache_path, 'w', encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "known": known_key, "files": files, "game": game, "tracks": table}, f, indent=1)
+        except OSError as e:
+            print("[WARNING]", "Couldn't save the track table cache :", e)
+    return game, table
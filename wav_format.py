@@ -0,0 +1,318 @@
+# MushiMix - WAV Format Checks and Conversion
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Reads just the RIFF/fmt/data chunk headers of a WAV (never the sample data), so bad files are rejected straight away,
+# and converts WAVs whose format doesn't match what the game expects.
+#
+# The format a game entry expects is read from the WAV already stored in its BIN (sample rate, channels, bit depth).
+# Channel count and sample format/bit depth are converted on the fly with NumPy, in fixed-size blocks,
+# while the BIN is being written, so nothing is ever fully loaded in memory.
+# A different sample rate needs a resampler to be passed in, otherwise the WAV is rejected.
+#
+# NumPy is only needed when something actually has to be converted.
+# -----
+
+# Standard Modules
+import os
+import struct
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Frames converted per block
+BLOCK_FRAMES = 65536
+
+
+class WavError(Exception):
+    pass
+
+
+# WavInfo - What's in a WAV's fmt and data chunks
+class WavInfo:
+    __slots__ = ("format_tag", "channels", "sample_rate", "bits_per_sample", "block_align", "data_offset", "data_length", "file_size", "loops")
+
+    def __init__(self, format_tag=WAVE_FORMAT_PCM, channels=2, sample_rate=44100, bits_per_sample=16, block_align=0, data_offset=0, data_length=0, file_size=0):
+        self.format_tag = format_tag # Extensible files are stored with their sub format here
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.block_align = block_align or channels * ((bits_per_sample + 7) // 8)
+        self.data_offset = data_offset
+        self.data_length = data_length
+        self.file_size = file_size
+        self.loops = [] # (start, end) frame pairs from the smpl chunk, end exclusive
+
+    @property
+    def frames(self):
+        return self.data_length // self.block_align
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def isFloat(self):
+        return self.format_tag == WAVE_FORMAT_IEEE_FLOAT
+
+    # Same sample rate, channels, sample format and bit depth
+    def sameFormat(self, other):
+        return (self.sample_rate, self.channels, self.bits_per_sample, self.isFloat()) == (other.sample_rate, other.channels, other.bits_per_sample, other.isFloat())
+
+    def describe(self):
+        kind = "float" if self.isFloat() else "bit"
+        return str(self.sample_rate) + " Hz, " + str(self.channels) + " ch, " + str(self.bits_per_sample) + "-" + kind
+
+    def __repr__(self):
+        return "WavInfo(" + self.describe() + ", " + str(self.frames) + " frames)"
+
+
+# Quick check of the first 12 bytes, for file lists
+def isWav(path):
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(12)
+    except OSError:
+        return False
+    return len(head) == 12 and head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+
+
+def parseWavFile(path):
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+
+        def readAt(offset, length):
+            f.seek(offset)
+            return f.read(length)
+
+        return parseWav(readAt, size, os.path.basename(path))
+
+
+# For a WAV held in a buffer, like cave_bin.CaveBin.data()
+def parseWavBuffer(buf, name="buffer"):
+    return parseWav(lambda offset, length: bytes(buf[offset:offset + length]), len(buf), name)
+
+
+# Walks the RIFF chunks with readAt(offset, length). Raises WavError for anything the games can't play.
+def parseWav(readAt, size, name=""):
+    head = readAt(0, 12)
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        raise WavError(name + ": not a RIFF/WAVE file")
+
+    info = None
+    loops = []
+    offset = 12
+    while offset + 8 <= size:
+        chunk_id, chunk_len = struct.unpack("<4sI", readAt(offset, 8))
+        body = offset + 8
+
+        if chunk_id == b"fmt ":
+            if chunk_len < 16:
+                raise WavError(name + ": fmt chunk is too short")
+            fmt = readAt(body, min(chunk_len, 40))
+            format_tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                format_tag = struct.unpack("<H", fmt[24:26])[0] # First 2 bytes of the sub format GUID
+            info = WavInfo(format_tag, channels, sample_rate, bits, block_align)
+
+        elif chunk_id == b"data":
+            if info == None:
+                raise WavError(name + ": data chunk comes before the fmt chunk")
+            info.data_offset = body
+            info.data_length = min(chunk_len, size - body) # Tolerate a truncated last chunk
+            info.file_size = size
+
+        # Sampler loop points, usually after the data chunk
+        elif chunk_id == b"smpl" and chunk_len >= 36:
+            smpl = readAt(body, min(chunk_len, 36 + 24 * 16))
+            count = struct.unpack("<I", smpl[28:32])[0]
+            for i in range(min(count, (len(smpl) - 36) // 24)):
+                start, end = struct.unpack("<II", smpl[36 + i * 24 + 8:36 + i * 24 + 16])
+                loops.append((start, end + 1)) # smpl loop ends are inclusive
+
+        offset = body + chunk_len + (chunk_len & 1) # Chunks are word aligned
+
+    if info == None:
+        raise WavError(name + ": no fmt chunk")
+    if info.data_offset == 0:
+        raise WavError(name + ": no data chunk")
+    info.loops = [loop for loop in loops if loop[0] < loop[1] <= info.frames]
+
+    if info.format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        raise WavError(name + ": unsupported encoding 0x%04X, only PCM and float WAVs are supported" % info.format_tag)
+    if info.isFloat() and info.bits_per_sample not in (32, 64):
+        raise WavError(name + ": unsupported float bit depth " + str(info.bits_per_sample))
+    if not info.isFloat() and info.bits_per_sample not in (8, 16, 24, 32):
+        raise WavError(name + ": unsupported bit depth " + str(info.bits_per_sample))
+    if info.channels < 1 or info.sample_rate < 1:
+        raise WavError(name + ": bad channel count or sample rate")
+    if info.block_align != info.channels * info.bits_per_sample // 8:
+        raise WavError(name + ": bad block align")
+    if info.frames == 0:
+        raise WavError(name + ": no audio data")
+    return info
+
+
+# Canonical 44 byte header for a PCM/float WAV
+def wavHeader(info, data_length):
+    format_tag = WAVE_FORMAT_IEEE_FLOAT if info.isFloat() else WAVE_FORMAT_PCM
+    byte_rate = info.sample_rate * info.block_align
+    riff_len = 36 + data_length + (data_length & 1)
+    return (b"RIFF" + struct.pack("<I", riff_len) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, format_tag, info.channels, info.sample_rate, byte_rate, info.block_align, info.bits_per_sample)
+            + b"data" + struct.pack("<I", data_length))
+
+
+# Format of the WAV stored in a BIN's music entry (or any other entry key, see cave_bin.CaveBin.resolve())
+def binWavFormat(bin_path, key=None):
+    import cave_bin
+    with cave_bin.CaveBin(bin_path) as cave:
+        entry = cave.resolve(cave_bin.MUSIC_ENTRY if key == None else key)
+        data = cave.data(entry)
+        try:
+            return parseWavBuffer(data, os.path.basename(bin_path) + ":" + entry.file_name)
+        finally:
+            data.release()
+
+
+# The payload source to use for wav_path so that it plays as `target`, `gain` dB louder:
+# the file as-is if nothing needs changing, or a ConvertedSource that converts it while it's written.
+# resampler, if given, is resampler(source_info, target_rate, in_frames) -> object with outputFrames() and process(blocks).
+# With `extend` (seconds), tracks with loop points (`loop`, or the smpl chunk's) are looped out to that length, see wav_loop.py.
+def sourceFor(wav_path, target=None, resampler=None, gain=0.0, extend=None, loop=None):
+    import cave_bin
+    import wav_loop
+    info = parseWavFile(wav_path)
+    if target == None:
+        target = info
+    plan = wav_loop.planLoop(info, extend, loop)
+    if info.sameFormat(target) and gain == 0.0 and plan == None:
+        return cave_bin.FileSource(wav_path)
+    if info.sample_rate != target.sample_rate and resampler == None:
+        raise WavError(os.path.basename(wav_path) + ": is " + str(info.sample_rate) + " Hz, but the game expects " + str(target.sample_rate) + " Hz")
+    return ConvertedSource(wav_path, info, target, resampler, gain, plan)
+
+
+# ConvertedSource - Payload for cave_bin.rebuildBin() that converts a WAV to `target`'s format as it is written.
+# gain is in dB, see wav_loudness.py. loop is a wav_loop.LoopPlan, to extend the track.
+class ConvertedSource:
+    def __init__(self, path, info, target, resampler=None, gain=0.0, loop=None):
+        self.path = path
+        self.info = info
+        self.gain = gain
+        self.loop = loop
+        self.out = WavInfo(WAVE_FORMAT_IEEE_FLOAT if target.isFloat() else WAVE_FORMAT_PCM, target.channels, target.sample_rate, target.bits_per_sample)
+        self.resampler = resampler
+
+        self.in_frames = frames = info.frames if loop == None else loop.frames
+        if info.sample_rate != target.sample_rate:
+            frames = resampler(info, target.sample_rate, frames).outputFrames()
+        self.out_frames = frames
+        self.data_length = frames * self.out.block_align
+        self.length = 44 + self.data_length + (self.data_length & 1)
+
+    # Float32 blocks of shape (frames, source channels), of the source's frames start to stop
+    def readFrames(self, start, stop):
+        with open(self.path, 'rb') as f:
+            f.seek(self.info.data_offset + start * self.info.block_align)
+            remaining = stop - start
+            while remaining > 0:
+                count = min(BLOCK_FRAMES, remaining)
+                raw = f.read(count * self.info.block_align)
+                count = len(raw) // self.info.block_align
+                if count == 0:
+                    break
+                block = decode(raw[:count * self.info.block_align], self.info)
+                if self.gain != 0.0:
+                    block *= 10 ** (self.gain / 20)
+                yield block
+                remaining -= count
+
+    # The whole (extended) track, before resampling and channel/format conversion
+    def blocks(self):
+        if self.loop != None:
+            return self.loop.blocks(self.readFrames)
+        return self.readFrames(0, self.info.frames)
+
+    def writeTo(self, dst, callback=None):
+        dst.write(wavHeader(self.out, self.data_length))
+        blocks = self.blocks()
+        if self.info.sample_rate != self.out.sample_rate:
+            blocks = self.resampler(self.info, self.out.sample_rate, self.in_frames).process(blocks)
+
+        written = 0
+        for block in blocks:
+            block = block[:self.out_frames - written // self.out.block_align]
+            raw = encode(remix(block, self.out.channels), self.out)
+            dst.write(raw)
+            written += len(raw)
+            if callback:
+                callback(len(raw))
+        if written < self.data_length: # Pad out in case the source came up short
+            dst.write(b"\x00" * (self.data_length - written))
+        if self.data_length & 1:
+            dst.write(b"\x00")
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise WavError("NumPy is needed to convert WAV formats (pip install numpy)")
+    return numpy
+
+
+# Raw little endian frames -> float32 array of shape (frames, channels), in -1.0 - 1.0
+def decode(raw, info):
+    np = _numpy()
+    bits = info.bits_per_sample
+    if info.isFloat():
+        samples = np.frombuffer(raw, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+    elif bits == 8:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif bits == 16:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif bits == 24:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 8388608.0
+    else:
+        samples = (np.frombuffer(raw, dtype="<i4").astype(np.float64) / 2147483648.0).astype(np.float32)
+    return samples.reshape(-1, info.channels)
+
+
+# float array (frames, channels) -> raw little endian frames in `info`'s format, clipped
+def encode(block, info):
+    np = _numpy()
+    bits = info.bits_per_sample
+    if info.isFloat():
+        return block.astype("<f4" if bits == 32 else "<f8").tobytes()
+
+    block = np.clip(block, -1.0, 1.0)
+    if bits == 8:
+        return np.round(block * 127.0 + 128.0).astype(np.uint8).tobytes()
+    if bits == 16:
+        return np.round(block * 32767.0).astype("<i2").tobytes()
+    if bits == 24:
+        ints = np.round(block.astype(np.float64) * 8388607.0).astype("<i4").reshape(-1)
+        return ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    return np.round(block.astype(np.float64) * 2147483647.0).astype("<i4").tobytes()
+
+
+# Changes the channel count: mono is copied to every channel, anything to mono is averaged,
+# otherwise channels are kept in order and extra ones dropped (or the last one repeated).
+def remix(block, channels):
+    np = _numpy()
+    have = block.shape[1]
+    if have == channels:
+        return block
+    if have == 1:
+        return np.repeat(block, channels, axis=1)
+    if channels == 1:
+        return block.mean(axis=1, keepdims=True)
+    if have > channels:
+        return block[:, :channels]
+    return np.concatenate([block, np.repeat(block[:, -1:], channels - have, axis=1)], axis=1)
@@ -0,0 +1,128 @@
+# MushiMix - Loop Extension
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Extends a track that would loop early in-game, by playing its loop section over and over until it is long enough.
+# Loop points come from the WAV's "smpl" chunk (as written by most loop editors), or are given by hand, in sample frames.
+#
+#   intro | loop | loop | loop | ... | rest of the track
+#
+# Every seam is crossfaded. When there's room before the loop start, the crossfade is lined up so the audio fading in is
+# the same point in the music as the audio fading out (the frames just before the loop start), so the timing never drifts.
+# Otherwise the start of the loop is overlapped with its end, which shortens each repeat by the crossfade length.
+#
+# The extended track is never held in memory: it is read back from the source WAV, in blocks, as it is written,
+# so a 30 minute render uses about as much RAM as a few seconds of audio.
+# -----
+
+# Standard Modules
+import math
+
+# MushiMix Modules
+import wav_format
+
+DEFAULT_CROSSFADE = 0.25 # seconds
+DEFAULT_FADE_OUT = 0.0 # seconds, by default the track ends at the end of a loop, so the game's own loop carries on cleanly
+
+
+# LoopPlan - How to lay out an extended track. Build one with planLoop().
+#   frames: length of the extended track, in source frames
+#   ops:    ("copy", start, stop) or ("fade", out_start, in_start, length), in source frames
+class LoopPlan:
+    def __init__(self, loop_start, loop_end, repeats, crossfade, fade_out, in_frames):
+        self.loop_start = loop_start
+        self.loop_end = loop_end
+        self.in_frames = in_frames
+        self.repeats = repeats
+        self.crossfade = crossfade
+        self.fade_out = fade_out
+
+        # Frames just before the loop start line up with the end of the loop, use them if there's room
+        self.aligned = loop_start >= crossfade
+        in_start = loop_start - crossfade if self.aligned else loop_start
+        self.step = loop_end - crossfade - in_start # Frames each repeat adds
+
+        self.ops = [("copy", 0, loop_end - crossfade)]
+        for i in range(repeats):
+            self.ops.append(("fade", loop_end - crossfade, in_start, crossfade))
+            self.ops.append(("copy", in_start + crossfade, loop_end - crossfade))
+        self.ops.append(("copy", loop_end - crossfade, in_frames))
+        self.frames = in_frames + repeats * self.step
+
+    # Plain values, to pass to a worker process
+    def toTuple(self):
+        return (self.loop_start, self.loop_end, self.repeats, self.crossfade, self.fade_out, self.in_frames)
+
+    @classmethod
+    def fromTuple(cls, values):
+        return cls(*values)
+
+    # Float blocks of the extended track. readFrames(start, stop) yields the source's float blocks between two frames.
+    def blocks(self, readFrames):
+        np = wav_format._numpy()
+        position = 0
+        fade_start = self.frames - self.fade_out
+
+        for op in self.ops:
+            if op[0] == "copy":
+                parts = readFrames(op[1], op[2])
+            else:
+                parts = self._crossfade(readFrames, op[1], op[2], op[3])
+
+            for block in parts:
+                # Fade out at the very end, if asked for
+                if self.fade_out and position + len(block) > fade_start:
+                    t = np.arange(position, position + len(block), dtype=np.float32) - fade_start
+                    block = block * np.clip(1.0 - t / self.fade_out, 0.0, 1.0)[:, None]
+                position += len(block)
+                yield block
+
+    def _crossfade(self, readFrames, out_start, in_start, length):
+        np = wav_format._numpy()
+        done = 0
+        for leaving, entering in zip(readFrames(out_start, out_start + length), readFrames(in_start, in_start + length)):
+            t = (np.arange(done, done + len(leaving), dtype=np.float32) + 0.5) / length
+            if self.aligned:
+                # Same music on both sides, so a linear (equal gain) fade keeps the level flat
+                fade_in = t
+                fade_out = 1.0 - t
+            else:
+                # Different material, equal power keeps the level flat
+                fade_in = np.sin(t * (math.pi / 2))
+                fade_out = np.cos(t * (math.pi / 2))
+            done += len(leaving)
+            yield leaving * fade_out[:, None] + entering * fade_in[:, None]
+
+
+# Loop points to use for a WAV: the given (start, end) in frames, or the first loop in its smpl chunk, or None
+def loopPoints(info, loop=None):
+    if loop == None:
+        if not info.loops:
+            return None
+        loop = info.loops[0]
+    start, end = int(loop[0]), int(loop[1])
+    if not 0 <= start < end <= info.frames:
+        raise wav_format.WavError("loop points " + str((start, end)) + " are outside of the track (" + str(info.frames) + " frames)")
+    return start, end
+
+
+# Plans extending the WAV described by info to at least `duration` seconds, looping at `loop` (see loopPoints()).
+# Returns None if there's nothing to do: no duration, no loop points, or the track is long enough already.
+def planLoop(info, duration, loop=None, crossfade=DEFAULT_CROSSFADE, fade_out=DEFAULT_FADE_OUT):
+    if not duration:
+        return None
+    points = loopPoints(info, loop)
+    if points == None:
+        return None
+    start, end = points
+
+    target = int(duration * info.sample_rate)
+    if target <= info.frames:
+        return None
+
+    crossfade = min(int(crossfade * info.sample_rate), (end - start) // 2)
+    step = LoopPlan(start, end, 0, crossfade, 0, info.frames).step
+    repeats = -(-(target - info.frames) // step)
+    return LoopPlan(start, end, repeats, crossfade, int(fade_out * info.sample_rate), info.frames)
@@ -0,0 +1,257 @@
+# MushiMix - Loudness Matching
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Measures the integrated loudness (in LUFS, the ITU-R BS.1770 way) of the vanilla track in a BIN and of the custom WAV
+# replacing it, so the custom WAV can be turned up or down to sit at the same level as the rest of the OST.
+#
+# The meter is BS.1770-style rather than exact: the K-weighting filter is applied in the frequency domain,
+# to 100 ms segments at a time, which is one vectorized FFT per block instead of a sample by sample IIR filter.
+# Gating (400 ms blocks with 75% overlap, -70 LUFS absolute and -10 LU relative) follows the spec.
+# The file is read once, in blocks, and only one number per 100 ms segment is kept.
+#
+# Results are cached in "<game>/mushimix-bk/loudness.json" by the sha256 of the file (and which track in it),
+# so remixing doesn't re-analyse files that haven't changed. Needs NumPy.
+# -----
+
+# Standard Modules
+import os
+import json
+import math
+import threading
+
+# MushiMix Modules
+import cave_io
+import wav_format
+
+CACHE_FILE = "loudness.json"
+CACHE_VERSION = 1
+
+SEGMENT = 0.1 # seconds
+GATE_SEGMENTS = 4 # 400 ms gating blocks, stepping by one segment
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Gains smaller than this aren't worth re-encoding a track for, and the peak is kept under PEAK_LIMIT
+MIN_GAIN_DB = 0.1
+PEAK_LIMIT = 0.989 # -0.1 dBFS
+
+
+# Squared magnitude response of the two K-weighting biquads (high shelf then high pass) at the rfft bins of n samples
+def kWeighting(sample_rate, n):
+    np = wav_format._numpy()
+
+    def response(b, a):
+        z = np.exp(-1j * np.pi * np.fft.rfftfreq(n, 0.5))
+        return np.abs((b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)) ** 2
+
+    # High shelf, +4 dB above ~1.7 kHz. These parameters reproduce the spec's 48 kHz coefficients at any rate.
+    K = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    Q = 0.7071752369554196
+    Vh = 10 ** (3.999843853973347 / 20)
+    Vb = Vh ** 0.4996667741545416
+    shelf = response((Vh + Vb * K / Q + K * K, 2 * (K * K - Vh), Vh - Vb * K / Q + K * K), (1 + K / Q + K * K, 2 * (K * K - 1), 1 - K / Q + K * K))
+
+    # High pass at ~38 Hz
+    K = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    Q = 0.5003270373238773
+    highpass = response((1, -2, 1), (1 + K / Q + K * K, 2 * (K * K - 1), 1 - K / Q + K * K))
+    return shelf * highpass
+
+
+# Channel weights from BS.1770: surrounds count for +1.5 dB, and the LFE of a 5.1 file not at all
+def channelWeights(channels):
+    if channels == 6:
+        return [1.0, 1.0, 1.0, 0.0, 1.41, 1.41]
+    return [1.0] * channels
+
+
+# LoudnessMeter - Feed it float blocks of shape (frames, channels), then read loudness() and peak
+class LoudnessMeter:
+    def __init__(self, sample_rate, channels):
+        np = wav_format._numpy()
+        self.segment_len = max(1, int(round(sample_rate * SEGMENT)))
+        self.channels = channels
+        self.weights = np.asarray(channelWeights(channels), dtype=np.float64)
+
+        # Parseval for a real FFT: bins other than DC (and Nyquist, for even lengths) stand for two
+        weighting = kWeighting(sample_rate, self.segment_len)
+        weighting[1:(self.segment_len + 1) // 2] *= 2
+        self.weighting = weighting / (self.segment_len * self.segment_len)
+
+        self.pending = np.zeros((0, channels), dtype=np.float32)
+        self.energies = [] # Channel weighted mean square of each K-weighted segment
+        self.peak = 0.0
+
+    def feed(self, block):
+        np = wav_format._numpy()
+        if len(block) == 0:
+            return
+        self.peak = max(self.peak, float(np.abs(block).max()))
+        if len(self.pending):
+            block = np.concatenate([self.pending, block])
+        count = len(block) // self.segment_len
+        self.pending = block[count * self.segment_len:]
+        if count == 0:
+            return
+
+        segments = block[:count * self.segment_len].reshape(count, self.segment_len, self.channels)
+        power = np.abs(np.fft.rfft(segments, axis=1)) ** 2 # (segments, bins, channels)
+        mean_square = np.einsum("sbc,b->sc", power, self.weighting)
+        self.energies.extend((mean_square @ self.weights).tolist())
+
+    # Gated integrated loudness in LUFS, or None if the whole thing is below the absolute gate (silence)
+    def loudness(self):
+        np = wav_format._numpy()
+        energies = np.asarray(self.energies, dtype=np.float64)
+        if len(energies) < GATE_SEGMENTS:
+            if len(energies) == 0:
+                return None
+            blocks = np.array([energies.mean()])
+        else:
+            blocks = np.convolve(energies, np.full(GATE_SEGMENTS, 1.0 / GATE_SEGMENTS), mode="valid")
+
+        with np.errstate(divide="ignore"):
+            levels = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[levels > ABSOLUTE_GATE]
+        if len(gated) == 0:
+            return None
+        relative = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE
+        gated = blocks[(levels > ABSOLUTE_GATE) & (levels > relative)]
+        return -0.691 + 10 * math.log10(gated.mean())
+
+
+def _measure(blocks, info):
+    meter = LoudnessMeter(info.sample_rate, info.channels)
+    for block in blocks:
+        meter.feed(block)
+    return meter.loudness(), meter.peak
+
+
+def _bufferBlocks(buf, info):
+    step = wav_format.BLOCK_FRAMES * info.block_align
+    end = info.data_offset + info.frames * info.block_align
+    for offset in range(info.data_offset, end, step):
+        yield wav_format.decode(bytes(buf[offset:min(offset + step, end)]), info)
+
+
+# (loudness in LUFS or None, sample peak) of a WAV file, or of the music track in a BIN if is_bin.
+# Only takes plain arguments, so it can run in a worker process.
+def analyse(path, is_bin=False):
+    if not is_bin:
+        info = wav_format.parseWavFile(path)
+        source = wav_format.ConvertedSource(path, info, info)
+        return _measure(source.blocks(), info)
+
+    import cave_bin
+    with cave_bin.CaveBin(path) as cave:
+        data = cave.data(cave.musicEntry())
+        try:
+            info = wav_format.parseWavBuffer(data, os.path.basename(path))
+            return _measure(_bufferBlocks(data, info), info)
+        finally:
+            data.release()
+
+
+# Gain in dB that brings a track at `loudness` to `target`, without pushing its peak over PEAK_LIMIT.
+# 0.0 if either can't be measured, or the difference is too small to matter.
+def matchGain(loudness, peak, target):
+    if loudness == None or target == None:
+        return 0.0
+    gain = target - loudness
+    if peak > 0:
+        gain = min(gain, 20 * math.log10(PEAK_LIMIT / peak))
+    if abs(gain) < MIN_GAIN_DB:
+        return 0.0
+    return round(gain, 2)
+
+
+# LoudnessCache - Measurements by content hash, plus (size, mtime) -> hash for the files they came from
+class LoudnessCache:
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.results = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.files = data.get("files", {})
+                self.results = data.get("results", {})
+        except (OSError, ValueError):
+            pass
+
+    # Cache key of a file's current contents (hashes it if it changed since last time)
+    def key(self, path, is_bin=False):
+        stat = cave_io.statKey(path)
+        name = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            cached = self.files.get(name)
+        if cached and stat and cached[:2] == stat:
+            digest = cached[2]
+        else:
+            digest = cave_io.hashFile(path)
+            with self._lock:
+                self.files[name] = stat + [digest]
+                self.dirty = True
+        return digest + (":music" if is_bin else "")
+
+    def get(self, key):
+        with self._lock:
+            return self.results.get(key)
+
+    def put(self, key, loudness, peak):
+        with self._lock:
+            self.results[key] = [loudness, peak]
+            self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            data = {"version": CACHE_VERSION, "files": dict(self.files), "results": dict(self.results)}
+            self.dirty = False
+        with cave_io.atomicWrite(self.path, 'w', encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+
+# Measures every (path, is_bin) in items, using and updating the cache.
+# Files are hashed on `threads` threads, and anything not cached is analysed on `pool` (an Executor).
+# Returns {(path, is_bin): (loudness, peak)}. Files that fail are left out, with a warning.
+def measureAll(items, cache, pool, threads=4):
+    from concurrent.futures import ThreadPoolExecutor
+
+    items = list(dict.fromkeys(items))
+    with ThreadPoolExecutor(max_workers=max(1, int(threads)), thread_name_prefix="mushimix-hash") as hasher:
+        keys = dict(zip(items, hasher.map(lambda item: _tryKey(cache, item), items)))
+
+    results = {}
+    pending = {}
+    for item, key in keys.items():
+        if key == None:
+            continue
+        cached = cache.get(key)
+        if cached != None:
+            results[item] = tuple(cached)
+        else:
+            pending[item] = pool.submit(analyse, item[0], item[1])
+
+    for item, future in pending.items():
+        try:
+            results[item] = future.result()
+            cache.put(keys[item], results[item][0], results[item][1])
+        except Exception as e:
+            print("[WARNING]", "Couldn't measure the loudness of", item[0], ":", e)
+    return results
+
+
+def _tryKey(cache, item):
+    try:
+        return cache.key(item[0], item[1])
+    except OSError as e:
+        print("[WARNING]", "Couldn't read", item[0], ":", e)
+        return None
@@ -0,0 +1,159 @@
+# MushiMix - Resampler
+#
+# Licensed under the MIT License
+# Developed by Xeirla (Rur)
+#
+# -----
+# Streaming polyphase resampler, so 48 kHz / 96 kHz WAVs can be dropped in as-is instead of going through ffmpeg.
+#
+# The rate change is reduced to a ratio up/down (48000 -> 44100 is 147/160), and a Kaiser windowed sinc low-pass
+# is split into `up` phases. Each output sample only needs the one phase that lines up with it,
+# so only ~(taps / up) multiply-adds are done per output sample and channel, all vectorized with NumPy.
+# Input is fed in blocks, and only the last few input frames the filter still needs are kept between blocks,
+# so memory use doesn't depend on the length of the track.
+#
+# Resampling is the slow part of a Remix, so MushiMixCore runs it in a process pool, one track per process
+# (see render() and RenderedSource), while the rest of the Remix carries on.
+# -----
+
+# Standard Modules
+import os
+import math
+
+# MushiMix Modules
+import cave_io
+import cave_bin
+import wav_format
+
+# Filter length, in zero crossings of the sinc each side of the centre, and Kaiser window beta
+ZERO_CROSSINGS = 16
+KAISER_BETA = 8.0
+
+
+# PolyphaseResampler - Resamples float32 blocks of shape (frames, channels) from src_rate to dst_rate
+class PolyphaseResampler:
+    def __init__(self, src_rate, dst_rate, channels, in_frames=None):
+        np = wav_format._numpy()
+        g = math.gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self.channels = channels
+        self.in_frames = in_frames
+
+        # Low-pass at the lower of the two Nyquist rates, designed at the upsampled rate
+        rate = max(self.up, self.down)
+        half_len = ZERO_CROSSINGS * rate
+        n = np.arange(-half_len, half_len + 1, dtype=np.float64)
+        h = np.sinc(n / rate) / rate * np.kaiser(len(n), KAISER_BETA) * self.up
+        self.delay = half_len # Centre of the filter, in upsampled samples
+
+        # phases[p, k] = h[p + k * up]
+        self.taps = -(-len(h) // self.up)
+        h = np.concatenate([h, np.zeros(self.taps * self.up - len(h))])
+        self.phases = h.reshape(self.taps, self.up).T.astype(np.float32)
+        self.reversed = np.ascontiguousarray(self.phases[:, ::-1]) # Newest input frame last, to match the windows
+
+        # Input history, channels first, buf[:, 0] is input frame buf_start. Starts with silence before the track.
+        self.buf = np.zeros((channels, self.taps), dtype=np.float32)
+        self.buf_start = -self.taps
+        self.next_out = 0
+
+    def outputFrames(self, in_frames=None):
+        if in_frames == None:
+            in_frames = self.in_frames
+        return -(-in_frames * self.up // self.down)
+
+    # Input frame the output frame n is centred on, and the filter phase to use for it
+    def _position(self, n):
+        m = n * self.down + self.delay
+        return m // self.up, m % self.up
+
+    # Feeds one block in, returns the output frames that can be computed so far.
+    # Outputs n and n + up use the same phase, and input frames exactly `down` apart, so each phase is
+    # one strided matrix-vector product over a sliding window view of the input, with no copies.
+    def feed(self, block, limit=None):
+        np = wav_format._numpy()
+        from numpy.lib.stride_tricks import sliding_window_view
+        if len(block):
+            self.buf = np.concatenate([self.buf, block.T.astype(np.float32, copy=False)], axis=1)
+        available = self.buf_start + self.buf.shape[1] - 1 # Last input frame we have
+
+        # Every output whose newest input frame is available
+        end = (available * self.up - self.delay) // self.down + 1
+        if limit != None:
+            end = min(end, limit)
+        count = max(0, end - self.next_out)
+        out = np.empty((self.channels, count), dtype=np.float32)
+
+        windows = sliding_window_view(self.buf, self.taps, axis=1) # windows[c, s, j] = buf[c, s + j]
+        for r in range(min(self.up, count)):
+            i0, p = self._position(self.next_out + r)
+            first = i0 - self.taps + 1 - self.buf_start
+            rows = windows[:, first:first + (len(range(r, count, self.up)) - 1) * self.down + 1:self.down]
+            out[:, r::self.up] = rows @ self.reversed[p]
+        self.next_out += count
+
+        # Drop the input nobody needs anymore
+        first_needed = self._position(self.next_out)[0] - self.taps + 1
+        drop = max(0, first_needed - self.buf_start)
+        if drop:
+            self.buf = self.buf[:, drop:]
+            self.buf_start += drop
+        return out.T
+
+    # Feeds the rest of the filter with silence, returns the last output frames
+    def flush(self):
+        np = wav_format._numpy()
+        pad = np.zeros((self.delay // self.up + self.taps + 1, self.channels), dtype=np.float32)
+        return self.feed(pad, self.outputFrames())
+
+    # Generator over resampled blocks, for wav_format.ConvertedSource
+    def process(self, blocks):
+        total = self.outputFrames()
+        for block in blocks:
+            out = self.feed(block, total)
+            if len(out):
+                yield out
+        out = self.flush()
+        if len(out):
+            yield out
+
+
+# Resampler factory in the form wav_format.sourceFor() wants
+def resampler(info, target_rate, in_frames=None):
+    return PolyphaseResampler(info.sample_rate, target_rate, info.channels, info.frames if in_frames == None else in_frames)
+
+
+# Converts (and resamples) wav_path to the format (sample_rate, channels, bits_per_sample, is_float), into out_path.
+# Runs in a worker process, so it only takes plain arguments.
+def render(wav_path, target, out_path, gain=0.0, loop=None):
+    import wav_loop
+    sample_rate, channels, bits_per_sample, is_float = target
+    fmt = wav_format.WAVE_FORMAT_IEEE_FLOAT if is_float else wav_format.WAVE_FORMAT_PCM
+    target = wav_format.WavInfo(fmt, channels, sample_rate, bits_per_sample)
+    if loop != None:
+        loop = wav_loop.LoopPlan.fromTuple(loop)
+    source = wav_format.ConvertedSource(wav_path, wav_format.parseWavFile(wav_path), target, resampler, gain, loop)
+    with cave_io.atomicWrite(out_path) as f:
+        source.writeTo(f)
+    return out_path
+
+
+# RenderedSource - Payload for cave_bin.rebuildBin() that is rendered by render() in a process pool, ahead of time.
+# The length is known up front, so the BIN's header can be planned before the render is done.
+class RenderedSource:
+    def __init__(self, converted, out_path, pool):
+        self.path = converted.path
+        self.out_path = out_path
+        self.length = converted.length
+        self.target = out = converted.out
+        self.future = pool.submit(render, converted.path, (out.sample_rate, out.channels, out.bits_per_sample, out.isFloat()), out_path, converted.gain, converted.loop.toTuple() if converted.loop != None else None)
+
+    def writeTo(self, dst, callback=None):
+        self.future.result() # Waits for the render, raises whatever it raised
+        if os.path.getsize(self.out_path) != self.length:
+            raise wav_format.WavError(os.path.basename(self.path) + ": resampled file came out the wrong size")
+        cave_bin.FileSource(self.out_path).writeTo(dst, callback)
+
+    def cancel(self):
+        self.future.cancel()